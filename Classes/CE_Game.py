@@ -1,7 +1,9 @@
+from typing import Callable
 
-import aiohttp
+from Exceptions.FailedScrapeException import FailedScrapeException
+from Modules import HTTP_Client
 from Classes.CE_Objective import CEObjective
-from Classes.OtherClasses import CECompletion
+from Classes.OtherClasses import CECompletion, LazyObject, PartialObject
 import Modules.hm as hm
 
 class CEGame:
@@ -150,9 +152,7 @@ class CEGame:
     
     async def get_raw_ce_data(self) -> dict :
         "Returns the raw CE data."
-        async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-            async with session.get(f'https://cedb.me/api/game/{self.ce_id}') as response :
-                return await response.json()
+        return await HTTP_Client.fetch_json("GET", f'https://cedb.me/api/game/{self.ce_id}')
     
     async def get_ce_api_game(self) -> 'CEAPIGame' :
         "Returns the CEAPIGame."
@@ -234,19 +234,16 @@ class CEGame:
         """Returns the current price (in USD) on the platform of this game."""
         if self.platform != "steam" : return None
 
-        async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-            async with session.get('https://store.steampowered.com/api/appdetails?',
-                                   params={'appids': self.platform_id, 'cc' : 'US'}) as response :
-                json_response = await response.json()
-
-                steam_id = str(self.platform_id)
-                
-                if json_response[steam_id]['data']['is_free'] : return 0
-                elif 'price_overview' in json_response[steam_id]['data'] :
-                    return float(json_response[steam_id]['data']['price_overview']['final_formatted'][1::])
-                else :
-                    return None
-        return None
+        json_response = await HTTP_Client.fetch_json("GET", 'https://store.steampowered.com/api/appdetails?',
+                                                     params={'appids': self.platform_id, 'cc' : 'US'})
+
+        steam_id = str(self.platform_id)
+            
+        if json_response[steam_id]['data']['is_free'] : return 0
+        elif 'price_overview' in json_response[steam_id]['data'] :
+            return float(json_response[steam_id]['data']['price_overview']['final_formatted'][1::])
+        else :
+            return None
 
             
     # def get_steamhunters_data(self) -> int | None :
@@ -268,20 +265,19 @@ class CEGame:
         
     async def get_steamhunters_data_async(self) -> int | None :
         if self.platform != "steam" : return None
-        async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-            async with session.get(f"https://steamhunters.com/api/apps/{self.platform_id}") as response :
-                if await response.text() == "null" or await response.text() == None :
-                    return None
-                try :
-                    json_response = await response.json()
-                except :
-                    print(f"SteamHunters response failed for {self.name_with_link()}")
-                    return 999999
-
-                if 'medianCompletionTime' in json_response :
-                    return int(int(json_response['medianCompletionTime']) / 60)
-                else :
-                    return None
+        try :
+            json_response = await HTTP_Client.fetch_json("GET", f"https://steamhunters.com/api/apps/{self.platform_id}")
+        except FailedScrapeException :
+            print(f"SteamHunters response failed for {self.name_with_link()}")
+            return 999999
+        
+        # steamhunters sends back "null" if it doesn't know the game
+        if json_response is None : return None
+
+        if 'medianCompletionTime' in json_response :
+            return int(int(json_response['medianCompletionTime']) / 60)
+        else :
+            return None
         
     # def get_steam_data(self) -> SteamData | None : 
     #     """Returns the steam data for this game."""
@@ -298,25 +294,23 @@ class CEGame:
     async def get_completion_data(self) -> CECompletion :
         """Returns the completion data for this game."""
 
-        async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-            async with session.get(f'https://cedb.me/api/game/{self.ce_id}/leaderboard') as response :
-                json_response = await response.json()
+        json_response = await HTTP_Client.fetch_json("GET", f'https://cedb.me/api/game/{self.ce_id}/leaderboard')
 
-                completions, started, owners = (0,)*3
+        completions, started, owners = (0,)*3
 
-                total_points = self.get_total_points()
-                for user in json_response :
-                    if user['points'] == total_points : completions += 1
-                    elif user['points'] != 0 : started += 1
-                    owners += 1
+        total_points = self.get_total_points()
+        for user in json_response :
+            if user['points'] == total_points : completions += 1
+            elif user['points'] != 0 : started += 1
+            owners += 1
 
-                return CECompletion(
-                    {
-                        'completed' : completions,
-                        'started' : started,
-                        'total' : owners
-                    }
-                )
+        return CECompletion(
+            {
+                'completed' : completions,
+                'started' : started,
+                'total' : owners
+            }
+        )
     
     def has_an_uncleared(self) -> bool :
         """Returns true if this game has an uncleared objective."""
@@ -442,4 +436,24 @@ class CEAPIGame(CEGame) :
     @property
     def header(self) -> str :
         "The header for this game."
-        return self.full_data['header']
\ No newline at end of file
+        return self.full_data['header']
+
+class CEPartialGame(PartialObject, CEGame) :
+    """A game that was loaded from mongo with only some of its fields
+    (see `Mongo_Reader.GAME_VIEWS`). Using anything that wasn't loaded raises
+    a `FieldNotLoadedException`, so these can't be dumped back either."""
+    FIELDS = ["ce_id", "game_name", "platform", "platform_id", "category",
+              "objectives", "last_updated", "banner"]
+    "Every field a `CEGame` has, by its constructor argument name."
+
+    def __init__(self, **fields) :
+        CEGame.__init__(self, **{field : fields.get(field) for field in self.FIELDS})
+        self._set_unloaded([f"_{field}" for field in self.FIELDS if field not in fields])
+
+class CELazyGame(LazyObject, CEGame) :
+    """A game from a bulk load (see `Mongo_Reader.get_games_map()`) whose objectives
+    are only built the first time they're used. Otherwise it's a normal :class:`CEGame`."""
+    def __init__(self, objectives : Callable[[], list[CEObjective]], **fields) :
+        CEGame.__init__(self, objectives=None, **fields)
+        self._set_lazy({'_objectives' : objectives})
+
@@ -1,12 +1,12 @@
 import datetime
-from typing import Literal, get_args
-import aiohttp
+from typing import Callable, Literal, get_args
+from Modules import HTTP_Client
 from Classes.CE_Cooldown import CECooldown
 from Classes.CE_Roll import CERoll
 from Classes.CE_Game import CEGame
 from Classes.CE_User_Game import CEUserGame
 import Modules.hm as hm
-from Classes.OtherClasses import CRData
+from Classes.OtherClasses import CRData, LazyObject, PartialObject
 
 MUTELIST_CEIDS = [
     "e790e8f0-f67e-4646-8fa9-de436b2c8d5e" # athenavenny
@@ -22,7 +22,9 @@ class CEUser:
                  display_name : str,
                  avatar : str,
                  last_updated : int,
-                 steam_id : str = "a"):
+                 steam_id : str = "a",
+                 fingerprint : str | None = None,
+                 version : int = 0):
         self._discord_id : int = discord_id
         self._ce_id : str = ce_id
         self._owned_games : list[CEUserGame] = owned_games
@@ -31,6 +33,9 @@ class CEUser:
         self._avatar = avatar
         self._last_updated = last_updated
         self._steam_id = steam_id
+        self._fingerprint = fingerprint
+        self._version = version
+        self._synced_state : dict | None = None
 
     # ------------ getters -------------
 
@@ -81,6 +86,39 @@ class CEUser:
         self._last_updated = last_updated
         pass
     
+    @property
+    def fingerprint(self) -> str | None :
+        """Returns the hash of this user's site data (games, objectives, connections, 
+        name and avatar) as of their last update, or `None` if it's never been taken."""
+        return self._fingerprint
+    
+    def set_fingerprint(self, fingerprint : str | None) :
+        "Setter for fingerprint."
+        self._fingerprint = fingerprint
+        pass
+
+    @property
+    def version(self) -> int :
+        """Returns the version of this user's document when it was loaded. 
+        Every write to mongo bumps it, so a stale copy can be caught."""
+        return self._version
+    
+    def set_version(self, version : int) :
+        "Setter for version."
+        self._version = version
+        pass
+
+    @property
+    def synced_state(self) -> dict | None :
+        """Returns the rolls and other fields (not `owned_games`) as they are in mongo,
+        as of when this user was loaded or last written, or `None` if it never was."""
+        return self._synced_state
+    
+    def set_synced_state(self, state : dict | None) :
+        "Setter for synced state."
+        self._synced_state = state
+        pass
+    
     @property
     def casino_score(self) :
         """Returns the casino score associated with this user."""
@@ -436,6 +474,21 @@ class CEUser:
 
     # ----------- other methods ------------
 
+    # -- updates --
+
+    def can_skip_update(self, site_data : 'CEUser', updated_game_ids : set[str]) -> bool :
+        """Returns true if updating this user with `site_data` can't change anything, so the
+        update (and the write back to Mongo) can be skipped. That's when:
+        \n- their site data has the same fingerprint as last time,
+        \n- they don't have any current or pending rolls (those can end just by time passing), and
+        \n- they don't own any game in `updated_game_ids` (a game changing can complete or un-complete it)."""
+        if self.fingerprint is None or self.fingerprint != site_data.fingerprint : return False
+        for roll in self.rolls :
+            if roll.status == "current" or roll.status == "pending" : return False
+        for game in self.owned_games :
+            if game.ce_id in updated_game_ids : return False
+        return True
+
     # -- rolls --
 
     
@@ -500,24 +553,22 @@ class CEUser:
     
     async def get_api_user(self) -> 'CEAPIUser' :
         "Returns the CEAPIUser."
-        async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-            async with session.get(f'https://cedb.me/api/user/{self.ce_id}/') as response :
-                try :
-                    data = await response.json()
-                except :
-                    return None
-
-
-                return CEAPIUser(
-                    discord_id=self.discord_id,
-                    ce_id=self.ce_id,
-                    owned_games=self.owned_games,
-                    rolls=self.rolls,
-                    full_data=data,
-                    display_name=self.display_name,
-                    avatar=self.avatar,
-                    last_updated=self.last_updated
-                )
+        try :
+            data = await HTTP_Client.fetch_json("GET", f'https://cedb.me/api/user/{self.ce_id}/')
+        except :
+            return None
+
+
+        return CEAPIUser(
+            discord_id=self.discord_id,
+            ce_id=self.ce_id,
+            owned_games=self.owned_games,
+            rolls=self.rolls,
+            full_data=data,
+            display_name=self.display_name,
+            avatar=self.avatar,
+            last_updated=self.last_updated
+        )
         
     def completions(self, database_name : list[CEGame]) -> int :
         "Returns the number of completions this user has."
@@ -544,7 +595,9 @@ class CEUser:
             "display-name" : self.display_name,
             "avatar" : self.avatar,
             "last_updated" : self.last_updated,
-            "steam_id" : self._steam_id
+            "steam_id" : self._steam_id,
+            "fingerprint" : self.fingerprint,
+            "version" : self.version
         }
 
         return user_dict
@@ -630,7 +683,6 @@ class CEAPIUser(CEUser) :
 
         # imports
         from Classes.CE_User_Objective import CEUserObjective
-        from Modules import CEAPIReader
 
         # grab all the data
         ce_ids : list[str] = []
@@ -638,7 +690,7 @@ class CEAPIUser(CEUser) :
         game_names : list[str] = []
         for objective in self.full_data['userObjectives'] :
             ce_ids.append(objective['objective']['id'])
-            completion_dates.append(CEAPIReader._timestamp_to_unix(objective['updatedAt']))
+            completion_dates.append(hm.cetimestamp_to_unix(objective['updatedAt']))
             game_names.append(objective['objective']['game']['name'])
         
         # make sure they didn't request too much
@@ -694,19 +746,23 @@ class CEAPIUser(CEUser) :
         curr_month_points = 0
         prev_month_points = 0
 
-        now = datetime.datetime.now()
-        current_month_datetime = datetime.datetime(year=now.year, month=now.month, day=1)
+        # CE timestamps are UTC, so the months are too.
+        utc = datetime.timezone.utc
+        now = datetime.datetime.now(utc)
+        current_month_datetime = datetime.datetime(year=now.year, month=now.month, day=1, tzinfo=utc)
         previous_month_datetime = datetime.datetime(
             year=(now.year if now.month != 1 else now.year-1),
             month=(now.month - 1 if now.month != 1 else 12),
-            day=1
+            day=1,
+            tzinfo=utc
         )
 
         for api_objective in self.api_user_objectives :
-            if hm.cetimestamp_to_datetime(api_objective['updatedAt']) >= current_month_datetime :
+            completed_datetime = hm.cetimestamp_to_datetime(api_objective['updatedAt'])
+            if completed_datetime >= current_month_datetime :
                 if api_objective['partial'] : curr_month_points += api_objective['objective']['pointsPartial']
                 else : curr_month_points += api_objective['objective']['points']
-            elif hm.cetimestamp_to_datetime(api_objective['updatedAt']) >= previous_month_datetime :
+            elif completed_datetime >= previous_month_datetime :
                 if api_objective['partial'] : prev_month_points += api_objective['objective']['pointsPartial']
                 else : prev_month_points += api_objective['objective']['points']
 
@@ -752,4 +808,24 @@ class CEAPIUser(CEUser) :
         return_str += f"{hm.get_emoji('Tier 4')}: {t4s}\t{hm.get_emoji('Tier 5')}: {t5s}\tTotal: {total}"
 
         # and now return.
-        return return_str
\ No newline at end of file
+        return return_str
+
+class CEPartialUser(PartialObject, CEUser) :
+    """A user that was loaded from mongo with only some of its fields
+    (see `Mongo_Reader.USER_VIEWS`). Using anything that wasn't loaded raises
+    a `FieldNotLoadedException`, so these can't be dumped back either."""
+    FIELDS = ["discord_id", "ce_id", "owned_games", "rolls", "display_name",
+              "avatar", "last_updated", "steam_id", "fingerprint", "version"]
+    "Every field a `CEUser` has, by its constructor argument name."
+
+    def __init__(self, **fields) :
+        CEUser.__init__(self, **{field : fields.get(field) for field in self.FIELDS})
+        self._set_unloaded([f"_{field}" for field in self.FIELDS if field not in fields])
+
+class CELazyUser(LazyObject, CEUser) :
+    """A user from a bulk load (see `Mongo_Reader.get_database_user()`) whose owned games
+    are only built the first time they're used. Otherwise it's a normal :class:`CEUser`."""
+    def __init__(self, owned_games : Callable[[], list[CEUserGame]], **fields) :
+        CEUser.__init__(self, owned_games=None, **fields)
+        self._set_lazy({'_owned_games' : owned_games})
+
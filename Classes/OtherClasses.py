@@ -1,7 +1,9 @@
-from typing import Literal, get_args
+from typing import Any, Callable, Literal, get_args
 
 import discord
 
+from Exceptions.FieldNotLoadedException import FieldNotLoadedException
+
 
 
 class GameData() :
@@ -135,7 +137,7 @@ class CECompletion() :
         percentage = round(percentage, 2)
         return f"{percentage}%"
     
-    def description(self) -> str :
+    def description(self, label : str = "Full CE Completions") -> str :
         """Returns the completion description. \n
         Example 1:
         Full CE Completions: 19 (8.67% of 219 owners)
@@ -145,8 +147,33 @@ class CECompletion() :
         """
         percentage = self.completion_percentage()
         if percentage == None :
-            return f"Full CE Completions: {self.completions} (Percentage N/A)"
-        return f"Full CE Completions: {self.completions} ({percentage} of {self.total} owners)"
+            return f"{label}: {self.completions} (Percentage N/A)"
+        return f"{label}: {self.completions} ({percentage} of {self.total} owners)"
+    
+class CEUserStats() :
+    "An object to hold a user's point and completion totals (see `Mongo_Reader.get_user_point_stats()`)."
+    def __init__(self, data : dict) :
+        self.__data = data
+
+    @property
+    def raw_data(self) -> dict :
+        "Returns this object as a dict."
+        return self.__data
+    
+    @property
+    def points(self) -> int :
+        "The total number of points this user has."
+        return self.raw_data['points']
+    
+    @property
+    def completed_games(self) -> int :
+        "The number of games this user has completed."
+        return self.raw_data['completed_games']
+    
+    @property
+    def owned_games(self) -> int :
+        "The number of games this user owns."
+        return self.raw_data['owned_games']
     
 
 # just makes shit easier
@@ -916,3 +943,59 @@ class CEInput :
         returned_string += "- Tag Inputs are not yet available." #TODO: tag
 
         return returned_string
+
+
+
+class PartialObject() :
+    """A mixin for objects that were loaded from mongo with only some of their fields.
+    \nThe fields that weren't loaded are left as `None`, and reading one (directly or through
+    a method that uses it) raises a `FieldNotLoadedException` instead of quietly working with it.
+    Setting a field counts as loading it."""
+    _unloaded_fields : frozenset[str] = frozenset()
+
+    def _set_unloaded(self, fields : list[str]) :
+        "Marks `fields` (the attribute names, like `_rolls`) as not loaded."
+        object.__setattr__(self, '_unloaded_fields', frozenset(fields))
+
+    def __getattribute__(self, name : str) :
+        if name in object.__getattribute__(self, '_unloaded_fields') :
+            raise FieldNotLoadedException(
+                f"'{name.lstrip('_')}' wasn't loaded on this {type(self).__name__}. "
+                + "Load the full object (or a view that has this field) instead."
+            )
+        return object.__getattribute__(self, name)
+
+    def __setattr__(self, name : str, value) :
+        unloaded = object.__getattribute__(self, '_unloaded_fields')
+        if name in unloaded : object.__setattr__(self, '_unloaded_fields', unloaded - {name})
+        object.__setattr__(self, name, value)
+
+
+
+class LazyObject() :
+    """A mixin for objects that were bulk-loaded from mongo and only build their
+    big nested fields (a game's objectives, a user's owned games) the first time they're used.
+    \nA lazy field isn't set until then, so every other attribute is read like normal (no
+    `__getattribute__` overhead). Setting a lazy field just replaces it."""
+
+    def _set_lazy(self, loaders : dict[str, Callable[[], Any]]) :
+        "Removes the attributes in `loaders` (like `_objectives`) so `loaders[name]()` builds them on first use."
+        for name in loaders : object.__getattribute__(self, '__dict__').pop(name, None)
+        object.__setattr__(self, '_lazy_loaders', dict(loaders))
+
+    def __getattr__(self, name : str) :
+        # only called when `name` isn't set, so loaded fields never come through here.
+        loaders = object.__getattribute__(self, '__dict__').get('_lazy_loaders', {})
+        if name not in loaders :
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        value = loaders.pop(name)()
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name : str, value) :
+        object.__getattribute__(self, '__dict__').get('_lazy_loaders', {}).pop(name, None)
+        object.__setattr__(self, name, value)
+
+    def is_loaded(self, name : str) -> bool :
+        "Returns true if the lazy field `name` (like `_objectives`) has been built."
+        return name not in object.__getattribute__(self, '__dict__').get('_lazy_loaders', {})
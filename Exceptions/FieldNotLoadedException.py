@@ -0,0 +1,10 @@
+class FieldNotLoadedException(Exception) :
+    """An exception for CE Assistant v2 to denote
+    a field being used on an object that was loaded without it."""
+    def __init__(self, message : str) :
+        super().__init__(message)
+        self._message = message
+    
+    def get_message(self) -> str :
+        """Returns the message associated with this exception."""
+        return self._message
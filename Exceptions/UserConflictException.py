@@ -0,0 +1,10 @@
+class UserConflictException(Exception) :
+    """An exception for CE Assistant v2 to denote
+    a user being written to mongo after someone else already changed them."""
+    def __init__(self, message : str) :
+        super().__init__(message)
+        self._message = message
+    
+    def get_message(self) -> str :
+        """Returns the message associated with this exception."""
+        return self._message
@@ -3,19 +3,21 @@ This module is dedicated to interactions with the Challenge Enthusiasts API.
 
 To pull data from individual game or user pages, use `get_api_page_data()`.
 
-To pull data from all games on the site, use `get_api_games_full()`.
+To pull data from all games on the site, use `get_api_games_full()`
+(or `iter_api_games_full()` to get them page by page).
 
-To pull data from all users on the site, use `get_api_users_all()`.
+To pull data from all users on the site, use `get_api_users_all()`
+(or `get_api_users_query()` to only pull specific users).
 """
 
 import asyncio
-import datetime
 import functools
+import hashlib
+import json
 import time
 from typing import Literal
 import typing
 
-import aiohttp
 
 # -- local --
 from Classes.CE_Game import CEAPIGame
@@ -24,10 +26,8 @@ from Classes.CE_User_Objective import CEUserObjective
 from Classes.CE_User import CEUser
 from Classes.CE_User_Game import CEUserGame
 from Exceptions.FailedScrapeException import FailedScrapeException
-
-# -- other --
-import requests
-import json
+from Modules import HTTP_Client
+from utils import time_utils
 
 
 # ---------------------- module for ce-api maintenance -----------------------
@@ -40,8 +40,8 @@ def to_thread(func: typing.Callable) -> typing.Coroutine:
 
 def _timestamp_to_unix(input : str) :
     """Takes in the Challenge Enthusiasts timestamp (`"2024-02-25T07:04:38.000Z"`) 
-    and converts it to unix timestamp (`1708862678`)"""
-    return int(time.mktime(datetime.datetime.strptime(str(input[:-5:]), "%Y-%m-%dT%H:%M:%S").timetuple()))
+    and converts it to unix timestamp (`1708844678`)"""
+    return time_utils.cetimestamp_to_unix(input)
 
 
 
@@ -82,13 +82,12 @@ def _ce_to_game(json_response : dict) -> CEAPIGame :
         # ...and assign it to the array.
         all_objectives.append(ce_objective)
 
+    # the game was last updated whenever it, or any of its objectives/requirements, last changed.
     last_updated = _timestamp_to_unix(json_response['updatedAt'])
     for objective in json_response['objectives'] :
-        if _timestamp_to_unix(objective['updatedAt']) > last_updated:
-            last_updated = _timestamp_to_unix(objective['updatedAt'])
+        last_updated = max(last_updated, _timestamp_to_unix(objective['updatedAt']))
         for objreq in objective['objectiveRequirements'] :
-            if _timestamp_to_unix(objreq['updatedAt']) > last_updated :
-                last_updated = _timestamp_to_unix(objreq['updatedAt'])
+            last_updated = max(last_updated, _timestamp_to_unix(objreq['updatedAt']))
 
     # now that we have all objectives, we can make the object...
     ce_game = CEAPIGame(
@@ -108,62 +107,80 @@ def _ce_to_game(json_response : dict) -> CEAPIGame :
 
 
 
-async def get_api_games_full() -> list[CEAPIGame] :
-    """Returns an array of :class:`CEAPIGame`'s grabbed from https://cedb.me/api/games/full"""
-    # Step 1: get the big json intact.
+async def _get_api_games_page(offset : int, pull_limit : int) -> list[dict] :
+    """Pulls one page of `pull_limit` games starting at `offset` from 
+    https://cedb.me/api/games/full (retrying as cedb.me's `HTTP_Client.HostPolicy` says to)."""
+    try :
+        return await HTTP_Client.fetch_json(
+            "GET", f"https://cedb.me/api/games/full?limit={pull_limit}&offset={offset}"
+        )
+
+    # if this page has failed every try, throw an exception and go to sleep
+    except FailedScrapeException :
+        raise FailedScrapeException("Scraping failed from api/games/full " 
+                                    + f"on games {offset} through {offset+pull_limit-1}.")
+
+
+
+async def iter_api_games_full(window : int = 8) -> typing.AsyncIterator[CEAPIGame] :
+    """Yields :class:`CEAPIGame`'s from https://cedb.me/api/games/full one page at a time.
+    \n`window` is the number of pages kept in flight. While the caller is working on
+    one page, the next `window - 1` pages are already downloading."""
     PULL_LIMIT = 50 #grab this many games per API call
-    TRY_LIMIT = 3 # try each batch of 'PULL LIMIT' this many times
-    json_response = []
-    done_fetching : bool = False
-    i = 1
-    
-    async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-
-        #overarching while statement - if not done, keep going
-        while (not done_fetching):
-            
-            print(f"fetching games {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}...", end=" ")
-            
-            #for each iteration (PULL_LIMIT), allow the site to be queried a few times in case of failure
-            for x in range(TRY_LIMIT):
-
-                # set up a variable used to catch errors
-                str_error = None
-                outer_response = None
-
-                # try to call the API
-                try:
-                    async with session.get(f"https://cedb.me/api/games/full?limit={PULL_LIMIT}&offset={(i-1)*PULL_LIMIT}") as response :
-                        outer_response = response
-                        j = await response.json()
-                        json_response += j
-                        done_fetching = len(j) == 0
-                        i += 1
-              
-                # if we got an error from the API call, set "str_error" to a value to enable the error catch/retry below
-                except Exception as e:
-                    str_error = e
-                    pass
-                
+    total_games = 0
+    next_offset = 0
+    in_flight : list[asyncio.Task] = []
+
+    def schedule_next_page() :
+        "Starts the request for the next page that hasn't been requested yet."
+        nonlocal next_offset
+        in_flight.append(asyncio.create_task(
+            _get_api_games_page(next_offset, PULL_LIMIT)
+        ))
+        next_offset += PULL_LIMIT
+
+    try :
+        # fill up the window
+        for _ in range(max(window, 1)) : schedule_next_page()
+
+        while True :
+            # the oldest request is always the next page in offset order.
+            print(f"fetching games {total_games} through {total_games+PULL_LIMIT-1}...", end=" ")
+            page : list[dict] = await in_flight.pop(0)
+
+            # anything but a list (like an empty body) isn't a page, and stopping here would
+            # look like every game after it was removed from the site.
+            if not isinstance(page, list) :
+                raise FailedScrapeException("Scraping failed from api/games/full "
+                                            + f"on games {total_games} through {total_games+PULL_LIMIT-1} (it didn't send a page).")
+
+            # stop at the first empty page - anything after it is past the end of the catalogue.
+            if len(page) == 0 : break
+
+            # keep the window full while this page is being worked on.
+            schedule_next_page()
+
+            total_games += len(page)
+            for game in page :
+                yield _ce_to_game(game)
                 
-                # if an error, print a message and try again until TRY_LIMIT attempts completed for this batch of PULL_LIMIT games
-                if str_error:
-                    print(str_error)
-                    try :
-                        print(await outer_response.text())
-                    except : print('couldnt print response')
-                    print(f"Scraping failed from api/games/full on games {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}." + " Attempt " + str(x+1) + " of " + str(TRY_LIMIT))
-            
-                    # if this block of games have failed TRY_LIMIT times, throw an exception and go to sleep
-                    if x+1 == TRY_LIMIT:
-                        raise FailedScrapeException("Scraping failed from api/games/full " 
-                                            + f"on games {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}.")
-
-                # if no error - continue on to the next block of "PULL LIMIT" games
-                else:
-                    break
-            
-    print(f"\ndone fetching games! total games: {len(json_response)}")
+            # free up the page
+            del page
+        
+    # if we stopped early (empty page, failure, or the caller stopped iterating),
+    # don't leave any requests hanging.
+    finally :
+        for task in in_flight : task.cancel()
+    
+    print(f"\ndone fetching games! total games: {total_games}")
+
+
+
+async def get_api_games_full(window : int = 8) -> list[CEAPIGame] :
+    """Returns an array of :class:`CEAPIGame`'s grabbed from https://cedb.me/api/games/full.
+    \n`window` is the number of pages that are requested at the same time. 
+    Pass `1` to walk the pages one at a time.
+    \nIf you can work on the games as they come in, use `iter_api_games_full()` instead."""
 
     """"
     BIG ASS FUCKING NOTE
@@ -171,38 +188,80 @@ async def get_api_games_full() -> list[CEAPIGame] :
     the bot should effectively freeze the game in place. just copy it over from when it existed last.
     """
 
-    # Step 2: iterate through the new json and construct an array of CEAPIGame's.
-    all_games : list[CEAPIGame] = []
-    for game in json_response :
+    return [game async for game in iter_api_games_full(window)]
 
-        # grab the object
-        ce_game = _ce_to_game(game)
 
-        # ... and append it to the list.
-        all_games.append(ce_game)
-    
-    # free up all of that space
-    del json_response
 
-    # and return
-    return all_games
+async def _get_api_users_query(ce_ids : list[str]) -> list[dict] :
+    """Pulls the users in `ce_ids` from https://cedb.me/api/users/query in one request
+    (retrying as cedb.me's `HTTP_Client.HostPolicy` says to)."""
+    try :
+        return await HTTP_Client.fetch_json(
+            "POST", "https://cedb.me/api/users/query", json={'id' : ce_ids}
+        )
+    except FailedScrapeException :
+        raise FailedScrapeException("Scraping failed from api/users/query "
+                                    + f"on users {ce_ids[0]} through {ce_ids[-1]}.")
+
+
+
+async def get_api_users_query(ce_ids : list[str]) -> list[CEUser] :
+    """Returns an array of :class:`CEUser`'s for only the users in `ce_ids`, 
+    grabbed from https://cedb.me/api/users/query.
+    \nThe ids are sent in batches of `QUERY_LIMIT`, and up to `QUERY_CONCURRENCY` batches
+    are requested at the same time."""
+    QUERY_LIMIT = 50 # send this many ids per API call
+    QUERY_CONCURRENCY = 4 # have this many API calls going at once
 
+    if len(ce_ids) == 0 : return []
 
+    semaphore = asyncio.Semaphore(QUERY_CONCURRENCY)
+    batches = [ce_ids[i:i+QUERY_LIMIT] for i in range(0, len(ce_ids), QUERY_LIMIT)]
+
+    async def fetch_batch(batch : list[str]) -> list[dict] :
+        async with semaphore :
+            return await _get_api_users_query(batch)
+
+    print(f"fetching {len(ce_ids)} registered users in {len(batches)} batches...")
+    responses : list[list[dict]] = await asyncio.gather(*[fetch_batch(batch) for batch in batches])
+
+    # convert to objects
+    all_users : list[CEUser] = []
+    for response in responses :
+        for user in response :
+            all_users.append(_ce_to_user(user))
 
-async def get_api_users_all(database_user : list[CEUser] | list[str] = None) -> list[CEUser]:
+    print(f"done fetching users! total users: {len(all_users)}")
+    return all_users
+
+
+
+async def get_api_users_all(database_user : list[CEUser] | list[str] = None, 
+                            use_query : bool = True) -> list[CEUser]:
     """Returns an array of :class:`CEUser`'s grabbed from https://cedb.me/api/users/all.
     NOTE: if `database_user` is passed, this will only return the users who are CEA Registered.
-    You can pass in the entire database_user here, or just a list of registered ids. Either work."""
+    You can pass in the entire database_user here, or just a list of registered ids. Either work.
+    \nWhen `database_user` is passed, only the registered users are requested 
+    (see `get_api_users_query()`). Pass `use_query=False` to crawl every user on the site 
+    and filter them instead."""
 
     # Step 0: check if database_user was passed
     if database_user is not None and len(database_user) > 0 :
         registered_ids : list[str] = []
-        if type(database_user[0]) == CEUser :
+        if isinstance(database_user[0], CEUser) :
             registered_ids = [user.ce_id for user in database_user]
         elif type(database_user[0]) == str :
             registered_ids = database_user
         else :
             database_user = None
+    
+    # nobody's registered, so there's nobody to grab.
+    elif database_user is not None :
+        return []
+
+    # only ask the site for our users
+    if database_user is not None and use_query :
+        return await get_api_users_query(registered_ids)
 
 
     # Step 1: get the big json intact.
@@ -210,71 +269,46 @@ async def get_api_users_all(database_user : list[CEUser] | list[str] = None) ->
     total_response = []
     done_fetching : bool = False
     i = 1
-    async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-        try :
-
-            # this will run if database user has been provided
-            if database_user is not None and False :
-                while (not done_fetching) :
-                    
-                    # print
-                    print(f"fetching users {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1} from database_user")
-
-                    # set up data
-                    data = {'id' : registered_ids[((i-1)*PULL_LIMIT), i*PULL_LIMIT-1]}
-
-                    # pull the data and json-ify it
-                    api_response = requests.post("https://cedb.me/api/users/query", data=data)
-                    current_response = json.loads(api_response.text)
-
-                    # check if you're done fetching
-                    done_fetching = len(current_response) == 0
-
-                    # add this to the total response and increment i
-                    total_response += current_response
-                    i += 1
-
-            # this will run if database user wasn't provided
-            while (not done_fetching) :
-
-                # pull the data
-                print(f"fetching users {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}", end=" ")
-
-                # set up params
-                params = {"limit" : PULL_LIMIT, "offset" : (i-1)*PULL_LIMIT}
-                """# if database_user has been provided, include the 'ids' in the payload.
-                if database_user is not None : params['ids'] = registered_ids"""
-
-                # pull the data and json-ify it
-                async with session.get("https://cedb.me/api/users/all", params=params) as response :
-                    current_response = await response.json()
-
-                    # check to see if this is the last one
-                    done_fetching = len(current_response) == 0
-
-                    # go through and filter out users that aren't CEA registered if database_user is passed through
-                    if database_user is not None :
-                        removed_indexes = []
-                        # if the user isn't registered, add the index to remove indexes
-                        for index, user in enumerate(current_response) :
-                            if user['id'] not in registered_ids :
-                                removed_indexes.append(index)
-                        # remove all of the indexes in reverse order
-                        for index in reversed(removed_indexes) :
-                            del current_response[index]
-                        print(f"({len(removed_indexes)} removed)", end=". ")
-
-                    # print this so that there will be a new line
-                    else :
-                        print("")
-
-                    # add to the total response and increment i
-                    total_response += current_response
-                    i += 1
-        except Exception as e : 
-            print(f"original exception: {e}")
-            raise FailedScrapeException("Failed scraping from api/users/all/ "
-                                        + f"on users {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}")
+    try :
+
+        # this will run if database user wasn't provided (or the query was turned off)
+        while (not done_fetching) :
+
+            # pull the data
+            print(f"fetching users {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}", end=" ")
+
+            # set up params
+            params = {"limit" : PULL_LIMIT, "offset" : (i-1)*PULL_LIMIT}
+
+            # pull the data and json-ify it
+            current_response = await HTTP_Client.fetch_json("GET", "https://cedb.me/api/users/all", params=params)
+
+            # check to see if this is the last one
+            done_fetching = len(current_response) == 0
+
+            # go through and filter out users that aren't CEA registered if database_user is passed through
+            if database_user is not None :
+                removed_indexes = []
+                # if the user isn't registered, add the index to remove indexes
+                for index, user in enumerate(current_response) :
+                    if user['id'] not in registered_ids :
+                        removed_indexes.append(index)
+                # remove all of the indexes in reverse order
+                for index in reversed(removed_indexes) :
+                    del current_response[index]
+                print(f"({len(removed_indexes)} removed)", end=". ")
+
+            # print this so that there will be a new line
+            else :
+                print("")
+
+            # add to the total response and increment i
+            total_response += current_response
+            i += 1
+    except Exception as e : 
+        print(f"original exception: {e}")
+        raise FailedScrapeException("Failed scraping from api/users/all/ "
+                                    + f"on users {(i-1)*PULL_LIMIT} through {i*PULL_LIMIT-1}")
     print(f"done fetching users! total users: {len(total_response)}")
 
     # convert to objects
@@ -290,17 +324,36 @@ async def get_api_users_all(database_user : list[CEUser] | list[str] = None) ->
 
 
 
+def _user_fingerprint(json_response : dict) -> str :
+    """Returns a stable hash of everything in a user's API data that the bot cares about
+    (their games, objectives, connections, display name and avatar).
+    If two fingerprints match, nothing about that user changed on the site."""
+    relevant_data = {
+        'userGames' : json_response['userGames'],
+        'userObjectives' : json_response['userObjectives'],
+        'userConnections' : json_response['userConnections'],
+        'displayName' : json_response['displayName'],
+        'avatar' : json_response['avatar']
+    }
+    return hashlib.sha256(
+        json.dumps(relevant_data, sort_keys=True, separators=(',', ':')).encode()
+    ).hexdigest()
+
+
+
 def _ce_to_user(json_response : dict) -> CEUser :
     # Go through all of their games and make CEUserGame's out of them.
     user_games : list[CEUserGame] = []
+    # index the games by id so each objective can find its game without searching the list.
+    user_games_by_id : dict[str, CEUserGame] = {}
     for game in json_response['userGames'] :
-        user_games.append(
-            CEUserGame(
-                ce_id=game['game']['id'],
-                user_objectives=[],
-                name=game['game']['name']
-            )
+        user_game = CEUserGame(
+            ce_id=game['game']['id'],
+            user_objectives=[],
+            name=game['game']['name']
         )
+        user_games.append(user_game)
+        user_games_by_id.setdefault(user_game.ce_id, user_game)
 
 
     """ok
@@ -336,10 +389,9 @@ def _ce_to_user(json_response : dict) -> CEUser :
 
         # now that we have the objective
         # we need to assign it to the correct games
-        for ce_game in user_games :
-            if ce_game.ce_id == new_objective.game_ce_id : 
-                ce_game.add_user_objective(new_objective)
-                break
+        ce_game = user_games_by_id.get(new_objective.game_ce_id)
+        if ce_game is not None :
+            ce_game.add_user_objective(new_objective)
 
     return CEUser(
         discord_id=0,
@@ -349,7 +401,8 @@ def _ce_to_user(json_response : dict) -> CEUser :
         display_name=json_response['displayName'],
         avatar=json_response['avatar'],
         last_updated=0,
-        steam_id=steam_id
+        steam_id=steam_id,
+        fingerprint=_user_fingerprint(json_response)
     )
 
 
@@ -357,16 +410,57 @@ def _ce_to_user(json_response : dict) -> CEUser :
 async def get_api_page_data(type : Literal["user", "game"], ce_id : str) -> CEUser | CEAPIGame | None :
     """Returns either a :class:`CEUser` or a :class:`CEAPIGame` 
     from `ce_id` depending on `type`."""
-    async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-        # if type is user
-        if type == "user" :
-            async with session.get(f"https://cedb.me/api/user/{ce_id}") as response :
-                json_response = await response.json()
-                if len(json_response) == 0 : return None
-                return _ce_to_user(json_response=json_response)
-
-        elif type == "game" :
-            async with session.get(f"https://cedb.me/api/game/{ce_id}") as response :
-                json_response = await response.json()
-                if len(json_response) == 0 : return None
-                return _ce_to_game(json_response=json_response)
+    # if type is user
+    if type == "user" :
+        json_response = await HTTP_Client.fetch_json("GET", f"https://cedb.me/api/user/{ce_id}")
+        if len(json_response) == 0 : return None
+        return _ce_to_user(json_response=json_response)
+
+    elif type == "game" :
+        json_response = await HTTP_Client.fetch_json("GET", f"https://cedb.me/api/game/{ce_id}")
+        if len(json_response) == 0 : return None
+        return _ce_to_game(json_response=json_response)
+
+
+
+def _synthetic_api_user(num_games : int, objectives_per_game : int) -> dict :
+    "Makes a fake /api/user payload with `num_games` games and `objectives_per_game` objectives in each."
+    user_games, user_objectives = [], []
+    for g in range(num_games) :
+        game_id = f"game-{g}"
+        user_games.append({'game' : {'id' : game_id, 'name' : f"Game {g}"}})
+        for o in range(objectives_per_game) :
+            user_objectives.append({
+                'partial' : o % 3 == 0,
+                'updatedAt' : "2024-02-25T07:04:38.000Z",
+                'objective' : {
+                    'id' : f"{game_id}-objective-{o}",
+                    'gameId' : game_id,
+                    'community' : o % 4 == 0,
+                    'points' : 10,
+                    'pointsPartial' : 5,
+                    'name' : f"Objective {o}"
+                }
+            })
+    return {
+        'id' : "synthetic-user",
+        'displayName' : "Synthetic User",
+        'avatar' : "",
+        'userConnections' : [{'platform' : 'steam', 'platformId' : "0"}],
+        'userGames' : user_games,
+        'userObjectives' : user_objectives
+    }
+
+def benchmark_ce_to_user(num_games : int = 4000, objectives_per_game : int = 6, repeats : int = 5) :
+    """Times `_ce_to_user()` on a synthetic heavy user, and again on one twice the size.
+    The second time should be about double the first (linear), not four times (quadratic)."""
+    for scale in (1, 2) :
+        payload = _synthetic_api_user(num_games * scale, objectives_per_game)
+        start = time.perf_counter()
+        for _ in range(repeats) : _ce_to_user(payload)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"_ce_to_user: {num_games*scale} games, {num_games*scale*objectives_per_game} objectives "
+              + f"-> {elapsed*1000:.1f} ms")
+
+if __name__ == "__main__" :
+    benchmark_ce_to_user()
@@ -0,0 +1,172 @@
+"""
+Sends the bot's log and announcement messages in the background, so the master loop
+doesn't have to sit and wait on Discord.
+
+Every channel gets its own queue, worked through by its own task. Discord rate-limits
+sends per channel (the `POST /channels/{id}/messages` route bucket), and discord.py waits
+out a bucket's limit inside `send()`, so a channel that's being throttled only holds up
+its own queue. Every other channel keeps going.
+
+Text queued with `coalesce=True` (like the userlog and casinolog lines) is joined with the
+coalescable text queued right after it, into as few messages as `MESSAGE_LIMIT` allows.
+Either way, each channel's messages go out in the order they were queued.
+
+Use `send()` to queue a message (it returns right away), and `drain()` to wait until
+everything queued has gone out. The bot drains before it shuts down. A message's `on_done`
+callback (if it has one) is awaited once it's been sent or given up on.
+"""
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+import discord
+
+
+MESSAGE_LIMIT = 2000
+"The most characters Discord allows in one message."
+
+SEND_TRY_LIMIT = 3
+"How many times a message is tried before it's given up on."
+
+RETRY_BACKOFF_SECONDS = 2.0
+"How long to wait before the first retry (doubled for each one after)."
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+"The statuses that are worth retrying. (discord.py already waits out most 429s itself.)"
+
+
+
+class _QueuedMessage() :
+    "One message waiting to be sent."
+    def __init__(self, content : str | None, embed : discord.Embed | None,
+                 file : discord.File | None, coalesce : bool,
+                 on_done : Callable[[bool], Awaitable[None]] | None) :
+        self.content = content
+        self.embed = embed
+        self.file = file
+        self.coalesce = coalesce and content is not None and embed is None and file is None
+        self.on_done = on_done
+
+_queues : dict[int, deque[_QueuedMessage]] = {}
+_workers : dict[int, asyncio.Task] = {}
+
+
+
+def send(channel : discord.abc.Messageable, content : str | None = None, *,
+         embed : discord.Embed | None = None, file : discord.File | None = None, coalesce : bool = False,
+         on_done : Callable[[bool], Awaitable[None]] | None = None) :
+    """Queues a message for `channel` and returns straight away.
+    \nIf `coalesce`, `content` can be sent in the same message as other coalesced text
+    queued for this channel (one line each). Text longer than `MESSAGE_LIMIT` is split up.
+    \n`on_done(sent)` is awaited after the message has gone out (`sent` is true)
+    or been given up on (`sent` is false)."""
+    if channel is None :
+        print(f"couldn't queue a message for a channel that doesn't exist: {content}")
+        return
+    _queues.setdefault(channel.id, deque()).append(_QueuedMessage(content, embed, file, coalesce, on_done))
+
+    worker = _workers.get(channel.id)
+    if worker is None or worker.done() :
+        _workers[channel.id] = asyncio.create_task(_work(channel))
+
+def pending() -> int :
+    "Returns how many messages are waiting to be sent, across every channel."
+    return sum(len(queue) for queue in _queues.values())
+
+async def drain(timeout : float | None = None) -> bool :
+    """Waits until every queued message has been sent (or given up on).
+    Returns false if `timeout` seconds went by first."""
+    try :
+        async with asyncio.timeout(timeout) :
+            while True :
+                workers = [worker for worker in _workers.values() if not worker.done()]
+                if len(workers) == 0 : return True
+                await asyncio.wait(workers)
+    except TimeoutError :
+        print(f"gave up waiting on {pending()} queued discord message(s).")
+        return False
+
+
+
+def _split(content : str) -> list[str] :
+    "Splits `content` into pieces of at most `MESSAGE_LIMIT` characters, at line breaks where it can."
+    pieces : list[str] = []
+    while len(content) > MESSAGE_LIMIT :
+        cut = content.rfind("\n", 0, MESSAGE_LIMIT + 1)
+        if cut <= 0 : cut = MESSAGE_LIMIT
+        pieces.append(content[:cut])
+        content = content[cut:].lstrip("\n")
+    if len(content) > 0 : pieces.append(content)
+    return pieces
+
+def _next_batch(queue : deque[_QueuedMessage]) -> list[_QueuedMessage] :
+    """Takes the next message off `queue`, or (if it's coalescable) the run of coalescable
+    messages after it that fit in one message together."""
+    batch = [queue.popleft()]
+    if not batch[0].coalesce : return batch
+    length = len(batch[0].content)
+    while len(queue) > 0 and queue[0].coalesce and length + 1 + len(queue[0].content) <= MESSAGE_LIMIT :
+        length += 1 + len(queue[0].content)
+        batch.append(queue.popleft())
+    return batch
+
+def _pack(batch : list[_QueuedMessage]) -> list[tuple[str, list[int]]] :
+    """Splits and joins `batch`'s text into messages that fit in `MESSAGE_LIMIT`.
+    Each comes with the indexes (in `batch`) of the queued messages it has text from."""
+    pieces : list[tuple[str, list[int]]] = []
+    for index, message in enumerate(batch) :
+        for piece in _split(message.content) :
+            if len(pieces) > 0 and len(pieces[-1][0]) + 1 + len(piece) <= MESSAGE_LIMIT :
+                text, indexes = pieces[-1]
+                pieces[-1] = (text + "\n" + piece, indexes if indexes[-1] == index else indexes + [index])
+            else :
+                pieces.append((piece, [index]))
+    return pieces
+
+async def _work(channel : discord.abc.Messageable) :
+    "Sends everything queued for `channel`, oldest first, then stops."
+    queue = _queues[channel.id]
+    while len(queue) > 0 :
+        batch = _next_batch(queue)
+        first = batch[0]
+        # whether each message in the batch made it out, so a failed piece doesn't
+        # mark the messages that were sent in the other pieces as failed too.
+        sent = [True] * len(batch)
+        if first.content is None :
+            sent[0] = await _send(channel, None, first.embed, first.file)
+        else :
+            pieces = _pack(batch)
+            for i, (piece, indexes) in enumerate(pieces) :
+                # the embed and file (if any) go with the last piece.
+                last = i == len(pieces) - 1
+                if await _send(channel, piece, first.embed if last else None, first.file if last else None) : continue
+                for index in indexes : sent[index] = False
+        for message, message_sent in zip(batch, sent) :
+            if message.on_done is None : continue
+            try :
+                await message.on_done(message_sent)
+            except Exception as e :
+                print(f"a sent message's callback failed: {e}")
+
+async def _send(channel : discord.abc.Messageable, content : str | None,
+                embed : discord.Embed | None, file : discord.File | None) -> bool :
+    """Sends one message, retrying if Discord is having trouble.
+    Returns false if it was given up on. Failures are printed, not raised."""
+    kwargs = {"content" : content, "embed" : embed}
+    for attempt in range(SEND_TRY_LIMIT) :
+        if file is not None :
+            file.reset()
+            kwargs["file"] = file
+        try :
+            await channel.send(**kwargs)
+            return True
+        except discord.HTTPException as e :
+            if e.status not in RETRY_STATUSES or attempt == SEND_TRY_LIMIT - 1 :
+                print(f"couldn't send a message to channel {channel.id} ({e.status}): {e.text}")
+                return False
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        except Exception as e :
+            print(f"couldn't send a message to channel {channel.id}: {e}")
+            return False
+    return False
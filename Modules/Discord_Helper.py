@@ -13,6 +13,7 @@ import discord
 from Classes.CE_Roll import CERoll
 from Classes.OtherClasses import EmbedMessage, UpdateMessage
 import Modules.hm as hm
+import Modules.Mongo_Reader as Mongo_Reader
 import Modules.WebInteractor as WebInteractor
 
 
@@ -118,8 +119,13 @@ async def get_game_embed(game_id : str, database_name : list) -> discord.Embed :
     embed.description += f"- SteamHunters Median Completion Time: {sh_data} hours\n"
     
     # -- get ce data --
-    completion_data = await game.get_completion_data()
-    embed.description += f"- {completion_data.description()}\n"
+    # counted over registered users at the end of every loop. (brand new games ask CE instead.)
+    completion_data = await Mongo_Reader.get_game_stats(game.ce_id)
+    if completion_data is not None :
+        embed.description += f"- {completion_data.description('Server CE Completions')}\n"
+    else :
+        completion_data = await game.get_completion_data()
+        embed.description += f"- {completion_data.description()}\n"
 
     return embed
 
@@ -236,6 +242,7 @@ async def get_user_embeds(user, database_name : list) -> tuple[discord.Embed, di
     summary_embed.add_field(
         name="User", value = f"<@{user.discord_id}> {hm.get_emoji(user.get_rank())}", inline=True
     )
+    # the user's already loaded, so their points are counted here (the saved stats can be a loop behind the rank above).
     summary_embed.add_field(
         name = "Current Values", value = f"{user.get_total_points()} {hm.get_emoji('Points')} - Casino Score: {user.casino_score}", inline=True
     )
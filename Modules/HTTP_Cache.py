@@ -0,0 +1,196 @@
+"""
+An on-disk cache for the responses `HTTP_Client` gets back, so quiet loops don't have to
+download (and send through the rate limiter) things that haven't changed.
+
+Each cached response is two files in `CACHE_DIRECTORY`: the body, and a small json file
+with its `ETag`, `Last-Modified`, and when it goes stale. Only the URLs in `CACHE_TTLS`
+are cached. While a response is fresh it's served straight from disk. Once it's stale,
+it's re-requested with `If-None-Match`/`If-Modified-Since`, and a `304` means the copy
+on disk gets used again. The least recently used responses are thrown away once the
+cache is bigger than `MAX_CACHE_BYTES`.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+CACHE_DIRECTORY = "http_cache"
+"Where cached responses are kept."
+
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+"How big the cache can get before the least recently used responses are thrown out."
+
+CACHE_TTLS : dict[str, float] = {
+    "https://cedb.me/api/games/full" : 0,
+    "https://cedb.me/api/users/all" : 0,
+    "https://store.steampowered.com/curator/" : 0,
+    "https://store.steampowered.com/api/appdetails" : 60 * 60,
+    "https://steamhunters.com/api/apps" : 6 * 60 * 60
+}
+"""The URLs (by prefix) that get cached, and how many seconds they're fresh for.
+\nA TTL of 0 means it's always checked with the site first (a conditional GET),
+so those are only kept if the site sent back an `ETag` or a `Last-Modified`."""
+
+
+
+class CachedResponse() :
+    "What's known about one cached response (the body stays on disk until it's needed)."
+    def __init__(self, key : str, url : str, size : int, stored_at : float, fresh_until : float,
+                 etag : str | None = None, last_modified : str | None = None, encoding : str = "utf-8") :
+        self.key = key
+        self.url = url
+        self.size = size
+        self.stored_at = stored_at
+        self.fresh_until = fresh_until
+        self.etag = etag
+        self.last_modified = last_modified
+        self.encoding = encoding
+
+    def is_fresh(self) -> bool :
+        "Returns true if this can be used without asking the site first."
+        return time.time() < self.fresh_until
+
+    def conditional_headers(self) -> dict[str, str] :
+        "Returns the headers that ask the site to send a `304` if this is still current."
+        headers = {}
+        if self.etag is not None : headers['If-None-Match'] = self.etag
+        if self.last_modified is not None : headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_dict(self) -> dict :
+        return {
+            'key' : self.key,
+            'url' : self.url,
+            'size' : self.size,
+            'stored_at' : self.stored_at,
+            'fresh_until' : self.fresh_until,
+            'etag' : self.etag,
+            'last_modified' : self.last_modified,
+            'encoding' : self.encoding
+        }
+
+
+
+class HTTPCache() :
+    """The cache itself. The index of what's cached is kept in memory
+    (in least-to-most recently used order) and rebuilt from disk on startup."""
+    def __init__(self, directory : str = CACHE_DIRECTORY, max_bytes : int = MAX_CACHE_BYTES) :
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._entries : OrderedDict[str, CachedResponse] = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # ----- files -----
+
+    def _meta_path(self, key : str) -> str :
+        return os.path.join(self._directory, f"{key}.json")
+
+    def _body_path(self, key : str) -> str :
+        return os.path.join(self._directory, f"{key}.body")
+
+    def _load_index(self) :
+        "Rebuilds the index from the files on disk, oldest first."
+        entries : list[CachedResponse] = []
+        for file_name in os.listdir(self._directory) :
+            if not file_name.endswith(".json") : continue
+            try :
+                with open(os.path.join(self._directory, file_name)) as f :
+                    entry = CachedResponse(**json.load(f))
+                if not os.path.exists(self._body_path(entry.key)) : raise FileNotFoundError(entry.key)
+                entries.append(entry)
+            except (OSError, ValueError, TypeError) :
+                self._remove_files(file_name[:-len(".json")])
+
+        for entry in sorted(entries, key=lambda e : os.path.getmtime(self._meta_path(e.key))) :
+            self._entries[entry.key] = entry
+            self._total_bytes += entry.size
+        self._evict()
+
+    def _remove_files(self, key : str) :
+        for path in (self._meta_path(key), self._body_path(key)) :
+            try : os.remove(path)
+            except FileNotFoundError : pass
+
+    def _write_meta(self, entry : CachedResponse) :
+        # the meta file's modified time doubles as its "last used" time for the next startup.
+        with open(self._meta_path(entry.key), 'w') as f :
+            json.dump(entry.to_dict(), f)
+
+    def _evict(self) :
+        "Throws out the least recently used responses until the cache fits."
+        while self._total_bytes > self._max_bytes and len(self._entries) > 0 :
+            key, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            self._remove_files(key)
+
+    # ----- lookups -----
+
+    @staticmethod
+    def ttl_for(url : str) -> float | None :
+        "Returns how long `url` stays fresh for, or `None` if it shouldn't be cached."
+        for prefix, ttl in CACHE_TTLS.items() :
+            if url.startswith(prefix) : return ttl
+        return None
+
+    @staticmethod
+    def key_for(url : str, params : dict | None) -> str :
+        "Returns the key `url` (with `params`, in any order) is cached under."
+        items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        return hashlib.sha256(f"{url} {items}".encode()).hexdigest()
+
+    def get(self, key : str) -> CachedResponse | None :
+        "Returns the cached response for `key`, or `None` if there isn't one."
+        return self._entries.get(key)
+
+    def read_body(self, entry : CachedResponse) -> bytes | None :
+        "Returns the body of `entry` and marks it as just used, or `None` if it's gone missing."
+        try :
+            with open(self._body_path(entry.key), 'rb') as f :
+                body = f.read()
+        except FileNotFoundError :
+            self.discard(entry.key)
+            return None
+        self._entries.move_to_end(entry.key)
+        return body
+
+    # ----- writes -----
+
+    def store(self, key : str, url : str, headers, body : bytes, encoding : str, ttl : float) :
+        "Saves a `200` response (if it's worth keeping) with its validators from `headers`."
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if 'no-store' in headers.get('Cache-Control', '') : return
+        if ttl <= 0 and etag is None and last_modified is None : return
+        if len(body) > self._max_bytes : return
+
+        self.discard(key)
+        now = time.time()
+        entry = CachedResponse(key, url, len(body), now, now + ttl, etag, last_modified, encoding)
+        with open(self._body_path(key), 'wb') as f :
+            f.write(body)
+        self._write_meta(entry)
+        self._entries[key] = entry
+        self._total_bytes += entry.size
+        self._evict()
+
+    def revalidated(self, entry : CachedResponse, headers, ttl : float) :
+        "Marks `entry` as current again after the site sent back a `304`."
+        entry.fresh_until = time.time() + ttl
+        entry.etag = headers.get('ETag', entry.etag)
+        entry.last_modified = headers.get('Last-Modified', entry.last_modified)
+        self._write_meta(entry)
+        self._entries.move_to_end(entry.key)
+
+    def discard(self, key : str) :
+        "Removes `key` from the cache, if it's there."
+        entry = self._entries.pop(key, None)
+        if entry is not None : self._total_bytes -= entry.size
+        self._remove_files(key)
+
+    def clear(self) :
+        "Empties the cache."
+        for key in list(self._entries) : self.discard(key)
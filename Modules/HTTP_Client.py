@@ -0,0 +1,384 @@
+"""
+Holds the one `aiohttp.ClientSession` that every outbound HTTP call in CE Assistant shares.
+
+Opening a new session per call means a new TCP (and TLS) handshake per request.
+This session keeps connections alive between calls, pools them per host, and caches DNS lookups.
+
+Use `get_session()` wherever you would have opened an `aiohttp.ClientSession`, and
+DON'T close it (no `async with`!). The bot closes it on shutdown with `close_session()`.
+
+Wrap every cedb.me, store.steampowered.com and steamhunters.com URL in `url()` before requesting it.
+Normally that does nothing, but if the `CE_ASSISTANT_REPLAY_URL` environment variable is set
+(or `use_replay_server()` is called) those requests go to the local replay server instead
+(see `Modules/Replay_Server.py`).
+
+`fetch_json()` and `fetch_text()` are the preferred way to make a request. They go through a
+per-host rate limiter (a token bucket that slows down when a host throttles us and speeds back
+up when it doesn't), retry with exponential backoff and jitter (honouring `Retry-After`), and
+stop asking a host at all for a while if it keeps failing (a circuit breaker). GETs to the
+URLs in `HTTP_Cache.CACHE_TTLS` are also cached on disk and re-checked with conditional GETs.
+"""
+
+import asyncio
+import email.utils
+import json
+import os
+import random
+import time
+import typing
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from Exceptions.FailedScrapeException import FailedScrapeException
+from Modules import HTTP_Cache
+
+
+USER_AGENT = "andy's-super-duper-bot/0.1"
+"The User-Agent sent with every request."
+
+TOTAL_CONNECTION_LIMIT = 100
+"The maximum number of open connections across every host."
+
+PER_HOST_CONNECTION_LIMIT = 16
+"The maximum number of open connections to any one host (cedb.me, steampowered, etc.)."
+
+DNS_CACHE_SECONDS = 300
+"How long a DNS lookup is reused for."
+
+KEEPALIVE_SECONDS = 60
+"How long an idle connection is kept open before it's closed."
+
+REQUEST_TIMEOUT_SECONDS = 60
+"How long any single request can take before it's abandoned."
+
+
+REPLAY_URL_ENVIRONMENT_VARIABLE = "CE_ASSISTANT_REPLAY_URL"
+"The environment variable that, if set, points every replayable host at the replay server."
+
+REPLAYABLE_HOSTS = ("cedb.me", "store.steampowered.com", "steamhunters.com")
+"The hosts that the replay server can stand in for."
+
+
+CACHE_ENVIRONMENT_VARIABLE = "CE_ASSISTANT_HTTP_CACHE"
+"Set this environment variable to `0` to turn the on-disk response cache off."
+
+CACHE_ENABLED = os.environ.get(CACHE_ENVIRONMENT_VARIABLE, "1") != "0"
+"Whether responses are cached on disk (see `HTTP_Cache`)."
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+"The statuses that are worth retrying. Any other status is handed back to the caller."
+
+
+
+class HostPolicy() :
+    """How hard a single host can be hit.
+    \n`rate` requests per second are allowed on average, with bursts of up to `burst`.
+    When the host throttles us the rate is halved (down to `min_rate`), and it creeps
+    back up by `recovery` per successful request.
+    \nA request is tried up to `try_limit` times, waiting `base_backoff * 2^attempt`
+    seconds (with jitter, capped at `max_backoff`) between tries.
+    \nAfter `failure_threshold` failures in a row the host is left alone for `cooldown` seconds."""
+    def __init__(self, rate : float, burst : int, min_rate : float = 0.2, recovery : float = 0.05,
+                 try_limit : int = 4, base_backoff : float = 1.0, max_backoff : float = 60.0,
+                 failure_threshold : int = 8, cooldown : float = 120.0) :
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.try_limit = try_limit
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+
+HOST_POLICIES : dict[str, HostPolicy] = {
+    "cedb.me" : HostPolicy(rate=8, burst=16),
+    # steam's store api allows about 200 requests every 5 minutes.
+    "store.steampowered.com" : HostPolicy(rate=0.6, burst=10, min_rate=0.1, base_backoff=5.0),
+    "steamhunters.com" : HostPolicy(rate=4, burst=8)
+}
+"The policy for each host we talk to."
+
+DEFAULT_HOST_POLICY = HostPolicy(rate=10, burst=20)
+"The policy for any host not in `HOST_POLICIES`."
+
+
+
+class _TokenBucket() :
+    "An adaptive token bucket. `acquire()` waits until a request is allowed."
+    def __init__(self, policy : HostPolicy) :
+        self._policy = policy
+        self._rate = policy.rate
+        self._tokens = float(policy.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) :
+        now = time.monotonic()
+        self._tokens = min(self._policy.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self) :
+        "Waits for a token and takes it."
+        # the lock makes waiters line up, so they get their tokens in order.
+        async with self._lock :
+            self._refill()
+            while self._tokens < 1 :
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+
+    def throttled(self) :
+        "Slows down after the host said we're going too fast. Empties the bucket so nobody else goes right away."
+        self._rate = max(self._policy.min_rate, self._rate / 2)
+        self._tokens = min(self._tokens, 0)
+
+    def pause(self, seconds : float) :
+        "Holds every request to this host for (at least) `seconds`."
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self._rate)
+
+    def succeeded(self) :
+        "Speeds back up a little after a request went through."
+        self._rate = min(self._policy.rate, self._rate + self._policy.recovery)
+
+
+class _CircuitBreaker() :
+    "Stops requests to a host that keeps failing until it's had time to recover."
+    def __init__(self, policy : HostPolicy) :
+        self._policy = policy
+        self._failures = 0
+        self._opened_at : float | None = None
+
+    def is_open(self) -> bool :
+        """Returns true if the host should be left alone right now.
+        \nOnce the cooldown is over this returns false again, and the next result decides
+        whether the breaker closes (success) or opens for another cooldown (failure)."""
+        if self._opened_at is None : return False
+        return time.monotonic() - self._opened_at < self._policy.cooldown
+
+    def succeeded(self) :
+        self._failures = 0
+        self._opened_at = None
+
+    def failed(self) :
+        self._failures += 1
+        if self._failures >= self._policy.failure_threshold :
+            self._opened_at = time.monotonic()
+
+
+
+_session : aiohttp.ClientSession | None = None
+_buckets : dict[str, _TokenBucket] = {}
+_breakers : dict[str, _CircuitBreaker] = {}
+_cache : HTTP_Cache.HTTPCache | None = None
+_replay_url : str | None = os.environ.get(REPLAY_URL_ENVIRONMENT_VARIABLE, "").rstrip('/') or None
+
+
+def get_session() -> aiohttp.ClientSession :
+    """Returns the shared :class:`aiohttp.ClientSession`, making it if it doesn't exist yet.
+    \nThis has to be called from inside the running event loop."""
+    global _session
+    if _session is None or _session.closed :
+        connector = aiohttp.TCPConnector(
+            limit=TOTAL_CONNECTION_LIMIT,
+            limit_per_host=PER_HOST_CONNECTION_LIMIT,
+            ttl_dns_cache=DNS_CACHE_SECONDS,
+            keepalive_timeout=KEEPALIVE_SECONDS
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers={'User-Agent' : USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+        )
+    return _session
+
+
+async def close_session() :
+    "Closes the shared session (and all of its connections). Safe to call more than once."
+    global _session
+    if _session is not None and not _session.closed :
+        await _session.close()
+    _session = None
+
+
+
+def use_replay_server(replay_url : str | None) :
+    """Sends every request to a replayable host to the replay server at `replay_url`
+    (like `http://127.0.0.1:8089`) instead. Pass `None` to go back to the live sites."""
+    global _replay_url
+    _replay_url = replay_url.rstrip('/') if replay_url else None
+
+
+def is_replaying() -> bool :
+    "Returns true if requests are currently going to the replay server."
+    return _replay_url is not None
+
+
+def url(live_url : str) -> str :
+    """Returns the URL that should actually be requested for `live_url`.
+    \nThis is `live_url` itself unless the replay server is on, in which case
+    `https://cedb.me/api/users/all` becomes `{replay_url}/cedb.me/api/users/all`."""
+    if _replay_url is None : return live_url
+
+    parts = urlsplit(live_url)
+    if parts.hostname not in REPLAYABLE_HOSTS : return live_url
+
+    replayed = f"{_replay_url}/{parts.hostname}{parts.path}"
+    if parts.query : replayed += f"?{parts.query}"
+    return replayed
+
+
+
+#  _____    ______    ____    _    _   ______    _____   _______    _____ 
+# |  __ \  |  ____|  / __ \  | |  | | |  ____|  / ____| |__   __|  / ____|
+# | |__) | | |__    | |  | | | |  | | | |__    | (___      | |    | (___  
+# |  _  /  |  __|   | |  | | | |  | | |  __|    \___ \     | |     \___ \ 
+# | | \ \  | |____  | |__| | | |__| | | |____   ____) |    | |     ____) |
+# |_|  \_\ |______|  \___\_\  \____/  |______| |_____/     |_|    |_____/ 
+
+def _limits_for(host : str) -> tuple[HostPolicy, _TokenBucket, _CircuitBreaker] :
+    "Returns the policy, rate limiter and circuit breaker for `host`."
+    policy = HOST_POLICIES.get(host, DEFAULT_HOST_POLICY)
+    if host not in _buckets :
+        _buckets[host] = _TokenBucket(policy)
+        _breakers[host] = _CircuitBreaker(policy)
+    return policy, _buckets[host], _breakers[host]
+
+
+def _retry_after_seconds(response : aiohttp.ClientResponse) -> float | None :
+    "Returns how long the `Retry-After` header says to wait, or `None` if there isn't one."
+    value = response.headers.get('Retry-After')
+    if value is None : return None
+    try : return max(0.0, float(value))
+    except ValueError : pass
+    try : return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError) : return None
+
+
+def _backoff_seconds(policy : HostPolicy, attempt : int) -> float :
+    "Returns how long to wait before try number `attempt + 1` (exponential, with full jitter)."
+    return random.uniform(0, min(policy.max_backoff, policy.base_backoff * 2 ** attempt))
+
+
+def _get_cache() -> HTTP_Cache.HTTPCache | None :
+    "Returns the response cache (making it if it doesn't exist yet), or `None` if caching is off."
+    global _cache
+    if not CACHE_ENABLED : return None
+    if _cache is None : _cache = HTTP_Cache.HTTPCache()
+    return _cache
+
+
+async def _fetch(method : str, live_url : str, decode : typing.Callable[[bytes, str], typing.Any],
+                 try_limit : int | None, **kwargs) :
+    """Makes a rate-limited, retried (and, for the URLs in `HTTP_Cache.CACHE_TTLS`, cached)
+    request and returns `decode(body, encoding)`.
+    \nRaises :class:`FailedScrapeException` if every try fails or the host's circuit is open,
+    or straight away if the host answers with an error status (400 or up) that isn't retried
+    (see `RETRY_STATUSES`), whatever its body says."""
+    host = urlsplit(live_url).hostname
+    policy, bucket, breaker = _limits_for(host)
+    if try_limit is None : try_limit = policy.try_limit
+    session = get_session()
+    request_url = url(live_url)
+
+    # -- check the cache first --
+    cache = _get_cache() if method == "GET" else None
+    ttl = HTTP_Cache.HTTPCache.ttl_for(live_url) if cache is not None else None
+    cached : HTTP_Cache.CachedResponse | None = None
+    if ttl is not None :
+        cache_key = HTTP_Cache.HTTPCache.key_for(request_url, kwargs.get('params'))
+        cached = cache.get(cache_key)
+        if cached is not None and cached.is_fresh() :
+            body = cache.read_body(cached)
+            try :
+                if body is not None : return decode(body, cached.encoding)
+            except ValueError : pass
+            cache.discard(cache_key)
+            cached = None
+
+    base_headers = dict(kwargs.pop('headers', None) or {})
+    for attempt in range(try_limit) :
+        if breaker.is_open() :
+            raise FailedScrapeException(f"{host} has failed too many times in a row. Not trying it again yet.")
+
+        headers = dict(base_headers)
+        if cached is not None : headers.update(cached.conditional_headers())
+
+        await bucket.acquire()
+        retry_after : float | None = None
+        try :
+            async with session.request(method, request_url, headers=headers, **kwargs) as response :
+
+                # nothing changed, so use what's on disk.
+                if response.status == 304 and cached is not None :
+                    body = cache.read_body(cached)
+                    if body is None : raise ValueError("the cached response went missing.")
+                    try : result = decode(body, cached.encoding)
+                    except ValueError :
+                        cache.discard(cache_key)
+                        cached = None
+                        raise
+                    cache.revalidated(cached, response.headers, ttl)
+
+                elif response.status >= 400 and response.status not in RETRY_STATUSES :
+                    # the host answered, it just said no (a 404 page, a json error, etc.). that's never
+                    # the data that was asked for, and asking again won't change it. it isn't the host
+                    # failing either, so it doesn't count against the breaker.
+                    breaker.succeeded()
+                    bucket.succeeded()
+                    raise FailedScrapeException(f"{method} {live_url} returned {response.status}.")
+
+                elif response.status not in RETRY_STATUSES :
+                    body = await response.read()
+                    encoding = response.get_encoding()
+                    result = decode(body, encoding)
+                    if ttl is not None and response.status == 200 :
+                        cache.store(cache_key, live_url, response.headers, body, encoding, ttl)
+
+                else :
+                    retry_after = _retry_after_seconds(response)
+                    if response.status == 429 : bucket.throttled()
+                    if retry_after is not None : bucket.pause(retry_after)
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status
+                    )
+
+                breaker.succeeded()
+                bucket.succeeded()
+                return result
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e :
+            error = f"{type(e).__name__} {e}"
+
+        breaker.failed()
+        print(f"{method} {live_url} failed ({error}). Attempt {attempt+1} of {try_limit}.")
+        if attempt + 1 < try_limit :
+            await asyncio.sleep(max(retry_after or 0, _backoff_seconds(policy, attempt)))
+
+    raise FailedScrapeException(f"{method} {live_url} failed {try_limit} times.")
+
+
+def _decode_json(body : bytes, encoding : str) -> typing.Any :
+    # some of these sites don't send the json content type, so don't check it.
+    text = body.decode(encoding)
+    if text.strip() == "" : return None
+    return json.loads(text)
+
+
+def _decode_text(body : bytes, encoding : str) -> str :
+    return body.decode(encoding, errors="replace")
+
+
+async def fetch_json(method : str, live_url : str, try_limit : int | None = None, **kwargs) -> typing.Any :
+    """Requests `live_url` (through the rate limiter, with retries) and returns the JSON it sent back.
+    \n`kwargs` go straight to :meth:`aiohttp.ClientSession.request` (`params`, `json`, etc.)."""
+    return await _fetch(method, live_url, _decode_json, try_limit, **kwargs)
+
+
+async def fetch_text(method : str, live_url : str, try_limit : int | None = None, **kwargs) -> str :
+    """Requests `live_url` (through the rate limiter, with retries) and returns the text it sent back.
+    \n`kwargs` go straight to :meth:`aiohttp.ClientSession.request` (`params`, `json`, etc.)."""
+    return await _fetch(method, live_url, _decode_text, try_limit, **kwargs)
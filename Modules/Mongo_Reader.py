@@ -5,20 +5,34 @@ Version 3 : Object-Oriented, and each item has its own document.
 
 
 # imports
+import asyncio
+import contextlib
+import datetime
+import hashlib
 import json
 import sys
-from typing import Literal
+import time
+from collections import OrderedDict
+from typing import Callable, Literal
+import bson
 from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 
 # -- local --
 from Classes.CE_Cooldown import CECooldown
-from Classes.CE_Game import CEAPIGame, CEGame
+from Classes.CE_Game import CEAPIGame, CEGame, CELazyGame, CEPartialGame
 from Classes.CE_Objective import CEObjective
 from Classes.CE_Roll import CERoll
-from Classes.CE_User import CEUser
+from Classes.CE_User import CELazyUser, CEPartialUser, CEUser
 from Classes.CE_User_Game import CEUserGame
 from Classes.CE_User_Objective import CEUserObjective
 from Classes.OtherClasses import *
+from Exceptions.FieldNotLoadedException import FieldNotLoadedException
+from Exceptions.UserConflictException import UserConflictException
+from Modules import Mongo_V4
 
 from motor.motor_asyncio import AsyncIOMotorClient
 
@@ -35,6 +49,15 @@ V3NAMETITLE = "database-name-v3"
 V3USERTITLE = "database-user-v3"
 V3INPUTTITLE = "database-input-v3"
 V3MISCTITLE = "database-misc-v3"
+V3STATSTITLE = "database-stats-v3"
+V3LOOPTITLE = "database-loop-v3"
+V3LOOPGAMETITLE = "database-loop-games-v3"
+V3OUTBOXTITLE = "database-outbox-v3"
+
+DATABASE_VERSION : int = local_json_data.get('database_version', 3)
+"""Where games and users are kept: 3 (one document each) or 4 (split up, see `Mongo_V4`).
+Set `database_version` in secret_info.json once `Reformatter.reformat_database_v3_to_v4()` has been run.
+Inputs and the misc documents are in v3 either way."""
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -53,6 +76,8 @@ V3MISCTITLE = "database-misc-v3"
 # VERSION 3
 async def get_list(database : Literal["name", "user", "input"]) -> list[str] :
     "Returns a list of CE IDs in the specified database."
+    if DATABASE_VERSION >= 4 and database in ("name", "user") :
+        return await Mongo_V4.get_ce_ids(_mongo_client[Mongo_V4.V4DATABASE], database)
     if database == "name" :
         collection = _mongo_client['database_name'][V3NAMETITLE]
     elif database == "user" :
@@ -68,69 +93,316 @@ async def get_list(database : Literal["name", "user", "input"]) -> list[str] :
 
 
 
+# -- indexes -- #
+
+OUTBOX_RETENTION_SECONDS = 14 * 24 * 60 * 60
+"How long messages are kept in the outbox before mongo deletes them (sent or not)."
+
+def _ce_id_index() -> IndexModel :
+    return IndexModel([("ce_id", ASCENDING)], unique=True, name="ce_id_unique")
+
+V3_INDEXES : dict[str, list[IndexModel]] = {
+    V3NAMETITLE : [_ce_id_index()],
+    V3USERTITLE : [
+        _ce_id_index(),
+        # unlinked users have their discord_id set to None, so only real ids have to be unique.
+        IndexModel([("discord_id", ASCENDING)], unique=True, name="discord_id_unique",
+                   partialFilterExpression={"discord_id" : {"$gt" : 0}})
+    ],
+    V3INPUTTITLE : [_ce_id_index()],
+    # the misc documents are told apart by which of these fields they have.
+    # (database_tier isn't indexed - its value is the whole tier list.)
+    V3MISCTITLE : [
+        IndexModel([("curator_count", ASCENDING)], unique=True, sparse=True, name="curator_count_unique"),
+        IndexModel([("curated", ASCENDING)], unique=True, sparse=True, name="curated_unique")
+    ],
+    V3STATSTITLE : [IndexModel([("kind", ASCENDING), ("ce_id", ASCENDING)], unique=True, name="kind_ce_id_unique")],
+    V3LOOPTITLE : [
+        IndexModel([("run_id", ASCENDING)], unique=True, name="run_id_unique"),
+        IndexModel([("finished", ASCENDING), ("started", DESCENDING)], name="finished_started")
+    ],
+    V3LOOPGAMETITLE : [IndexModel([("run_id", ASCENDING), ("ce_id", ASCENDING)], unique=True, name="run_id_ce_id_unique")],
+    V3OUTBOXTITLE : [
+        IndexModel([("key", ASCENDING)], unique=True, name="key_unique"),
+        IndexModel([("sent", ASCENDING), ("created", ASCENDING), ("order", ASCENDING)], name="sent_created_order"),
+        # mongo deletes old messages by itself.
+        IndexModel([("created", ASCENDING)], expireAfterSeconds=OUTBOX_RETENTION_SECONDS, name="created_ttl")
+    ]
+}
+"The indexes every v3 collection should have."
+
+async def ensure_indexes() -> list[str] :
+    """Creates any of the indexes in `V3_INDEXES` that don't exist yet. Safe to run every startup.
+    \nReturns a message for each index that couldn't be made (duplicate data, a conflicting old index, etc.)."""
+    problems : list[str] = []
+    for title, indexes in V3_INDEXES.items() :
+        collection = _mongo_client['database_name'][title]
+        for index in indexes :
+            try : await collection.create_indexes([index])
+            except OperationFailure as e :
+                problems.append(f"couldn't create index {index.document['name']} on {title}: {e.details.get('errmsg', e)}")
+    if DATABASE_VERSION >= 4 : problems += await Mongo_V4.ensure_indexes(_mongo_client[Mongo_V4.V4DATABASE])
+    for problem in problems : print(problem)
+    return problems
+
+HOT_QUERIES : list[tuple[str, dict]] = [
+    (V3NAMETITLE, {"ce_id" : ""}),
+    (V3USERTITLE, {"ce_id" : ""}),
+    (V3USERTITLE, {"discord_id" : 1}),
+    (V3INPUTTITLE, {"ce_id" : ""}),
+    (V3MISCTITLE, {"curator_count" : {"$exists" : True}}),
+    (V3MISCTITLE, {"curated" : {"$exists" : True}}),
+    (V3MISCTITLE, {"database_tier" : {"$exists" : True}}),
+    (V3STATSTITLE, {"kind" : "game", "ce_id" : ""}),
+    (V3LOOPTITLE, {"finished" : None}),
+    (V3LOOPGAMETITLE, {"run_id" : ""}),
+    (V3OUTBOXTITLE, {"sent" : False})
+]
+"The queries that run all the time, as `(collection, filter)`."
+
+def _plan_stages(plan : dict) -> list[str] :
+    "Returns every stage in a query plan, outermost first."
+    stages = [plan.get('stage', "?")]
+    if 'inputStage' in plan : stages += _plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []) : stages += _plan_stages(child)
+    return stages
+
+async def explain_hot_queries() -> list[tuple[str, list[str], bool]] :
+    """Runs `explain()` on every query in `HOT_QUERIES`.
+    \nReturns `(query, stages, is_collection_scan)` for each one."""
+    results : list[tuple[str, list[str], bool]] = []
+    queries = [("database_name", title, query) for title, query in HOT_QUERIES]
+    if DATABASE_VERSION >= 4 : queries += [(Mongo_V4.V4DATABASE, title, query) for title, query in Mongo_V4.HOT_QUERIES]
+    for database, title, query in queries :
+        collection = _mongo_client[database][title]
+        explanation = await collection.find(query).limit(1).explain()
+        winning_plan = explanation['queryPlanner']['winningPlan']
+        # newer servers wrap the plan one level deeper
+        stages = _plan_stages(winning_plan.get('queryPlan', winning_plan))
+        results.append((f"{title} {query}", stages, "COLLSCAN" in stages))
+    return results
+
+
+
 # -- games -- #
+async def _find_game_documents(query : dict | None = None, projection : dict | None = None, raw : bool = False) :
+    """Yields the v3 document of every game matching `query`, from whichever database version is in use.
+    \n`projection` and `raw` (yield undecoded `RawBSONDocument`'s) only matter in v3.
+    (In v4, a projection without `objectives` skips reading them.)"""
+    if DATABASE_VERSION >= 4 :
+        objectives = projection is None or "objectives" in projection
+        for document in await Mongo_V4.find_games(_mongo_client[Mongo_V4.V4DATABASE], query, objectives) :
+            yield document
+        return
+    collection = _mongo_client['database_name'][V3NAMETITLE]
+    if raw : collection = collection.with_options(codec_options=_RAW_BSON)
+    async for document in collection.find(query or {}, projection or {"_id" : 0}) :
+        yield document
+
 async def get_game(ce_id : str) -> CEGame | None :
     "Gets a game associated with `ce_id`."
-    collection = _mongo_client['database_name'][V3NAMETITLE]
-    
-    db = await collection.find_one({"ce_id" : ce_id})
-    if db is None : return None
+    async for db in _find_game_documents({"ce_id" : ce_id}) :
+        return __mongo_to_game(db)
+    return None
         #raise ValueError(f"No game with id {ce_id} found in mongo.")
 
-    return __mongo_to_game(db)
+async def get_games(ce_ids : list[str]) -> dict[str, CEGame] :
+    """Gets every game in `ce_ids` (in chunks of `$in` queries, not one query each).
+    Returns a dict keyed by ce_id. Any id that isn't in mongo just isn't in the dict."""
+    IN_CHUNK_SIZE = 1000 # ask for this many ids per query
 
-async def get_database_name() -> list[CEGame] :
-    collection = _mongo_client['database_name'][V3NAMETITLE]
+    games : dict[str, CEGame] = {}
+    ce_ids = list(ce_ids)
+    for i in range(0, len(ce_ids), IN_CHUNK_SIZE) :
+        async for document in _find_game_documents({"ce_id" : {"$in" : ce_ids[i:i+IN_CHUNK_SIZE]}}) :
+            games[document['ce_id']] = __mongo_to_game(document)
+    return games
 
+async def get_games_map(lazy : bool = False) -> dict[str, CEGame] :
+    """Gets every game in mongo in one streamed query. Returns a dict keyed by ce_id.
+    \nIf `lazy`, the games are :class:`CELazyGame`'s (see "lazy bulk loads" below)."""
+    games : dict[str, CEGame] = {}
+    async for document in _find_game_documents(raw=lazy) :
+        games[document['ce_id']] = __mongo_to_game(document, lazy)
+    return games
+
+async def get_database_name() -> list[CEGame] :
+    """Returns every game in mongo.
+    \nThis is served from an in-process copy of the collection (see "database name cache" below), 
+    so most calls don't query mongo at all. The list is yours to change, but the
+    :class:`CEGame`'s in it are shared - don't edit them without dumping them."""
+    await _refresh_database_name_cache()
+    return list(_name_cache.values())
+
+async def _load_database_name() -> list[CEGame] :
+    "Reads every game straight from mongo (lazily - most cached games never have their objectives looked at)."
     documents = []
 
-    async for document in collection.find({}, {"_id": 0}) :
-        documents.append(__mongo_to_game(document))
+    async for document in _find_game_documents(raw=True) :
+        documents.append(__mongo_to_game(document, lazy=True))
 
     return documents
 
-    cursor = collection.find({}, {"_id" : 0})
-    objects = await cursor.to_list(length=None)
-
-    database_name : list[CEGame] = []
-    for o in objects :
-        database_name.append(__mongo_to_game(o))
-    
-    return database_name
-
 async def dump_game(game : CEGame | CEAPIGame) :
     "Dumps a game."
-    if type(game) is not CEGame and type(game) is not CEAPIGame :
+    if type(game) not in (CEGame, CEAPIGame, CELazyGame) :
         raise TypeError(f"Argument 'game' is of type {type(game)}, not CEGame.")
     
+    if DATABASE_VERSION >= 4 :
+        failed = await Mongo_V4.save_games(_mongo_client[Mongo_V4.V4DATABASE], [game.to_dict()])
+        invalidate_cached_games([game.ce_id])
+        if len(failed) > 0 : raise Exception(f"Game {game.ce_id} not dumped properly: {failed[0][1]}")
+        return
+
     collection = _mongo_client['database_name'][V3NAMETITLE]
 
-    if (await collection.find_one({"ce_id" : game.ce_id})) == None :
-        await collection.insert_one(game.to_dict())
-    else :
-        await collection.replace_one({"ce_id" : game.ce_id}, game.to_dict())
+    await collection.replace_one({"ce_id" : game.ce_id}, game.to_dict(), upsert=True)
+    invalidate_cached_games([game.ce_id])
     pass
 
 async def delete_game(ce_id : str) :
     "Deletes a game."
+    if DATABASE_VERSION >= 4 :
+        deleted = await Mongo_V4.delete_game(_mongo_client[Mongo_V4.V4DATABASE], ce_id)
+        invalidate_cached_games([ce_id])
+        if not deleted : raise Exception("Game not deleted properly.")
+        return
+
     collection = _mongo_client['database_name'][V3NAMETITLE]
 
     result = await collection.delete_one({"ce_id" : ce_id})
+    invalidate_cached_games([ce_id])
     if result.deleted_count == 0 :
         raise Exception("Game not deleted properly.")
 
 
-def __mongo_to_game(game : dict) -> CEGame :
-    return CEGame(
+# -- database name cache -- #
+
+DATABASE_NAME_MAX_STALENESS = 60
+"""When there's no change stream, the cached games are re-checked against mongo 
+if they're older than this many seconds."""
+
+DATABASE_NAME_POLL_OVERLAP = 24 * 60 * 60
+"""When polling, games with a `last_updated` up to this many seconds before the newest
+one already cached are re-read too (a game's `last_updated` comes from CE, not from when
+it was written, so they don't always show up in order)."""
+
+_name_cache : dict[str, CEGame] = {}
+_name_cache_loaded = False
+_name_cache_checked_at = 0.0
+_name_cache_newest = 0
+_name_cache_dirty : set[str] = set()
+_name_cache_resync = False
+_name_cache_watcher : asyncio.Task | None = None
+_name_cache_lock = asyncio.Lock()
+
+def invalidate_cached_games(ce_ids : list[str] | None = None) :
+    """Marks games in the cached database name as changed, so they're re-read next time.
+    Pass nothing to throw the whole cache away."""
+    global _name_cache_loaded
+    if ce_ids is None : _name_cache_loaded = False
+    else : _name_cache_dirty.update(ce_ids)
+
+def _cache_games(games : list[CEGame]) :
+    global _name_cache_newest
+    for game in games :
+        _name_cache[game.ce_id] = game
+        _name_cache_newest = max(_name_cache_newest, game.last_updated)
+
+async def _refresh_database_name_cache() :
+    "Brings the cached database name up to date, querying mongo as little as possible."
+    global _name_cache_loaded, _name_cache_checked_at, _name_cache_resync, _name_cache_newest
+    async with _name_cache_lock :
+        # first time (or after a full invalidation) - load everything.
+        if not _name_cache_loaded :
+            _name_cache.clear()
+            _name_cache_dirty.clear()
+            _name_cache_newest = 0
+            _cache_games(await _load_database_name())
+            _name_cache_loaded = True
+            _name_cache_checked_at = time.monotonic()
+            _start_database_name_watcher()
+            return
+        
+        # something in this process (or the change stream) said these changed.
+        if len(_name_cache_dirty) > 0 :
+            dirty = list(_name_cache_dirty)
+            _name_cache_dirty.clear()
+            found = await get_games(dirty)
+            for ce_id in dirty :
+                if ce_id not in found : _name_cache.pop(ce_id, None)
+            _cache_games(list(found.values()))
+
+        # a game was deleted somewhere that we don't know the ce_id of.
+        if _name_cache_resync :
+            _name_cache_resync = False
+            await _resync_cached_ids()
+
+        # the change stream keeps us current, so there's no need to poll.
+        if _name_cache_watcher is not None and not _name_cache_watcher.done() : return
+        if time.monotonic() - _name_cache_checked_at < DATABASE_NAME_MAX_STALENESS : return
+
+        # otherwise poll: anything recently updated, and anything added or removed.
+        since = _name_cache_newest - DATABASE_NAME_POLL_OVERLAP
+        _cache_games([__mongo_to_game(document) async for document 
+                      in _find_game_documents({"last_updated" : {"$gt" : since}})])
+        await _resync_cached_ids()
+        _name_cache_checked_at = time.monotonic()
+
+async def _resync_cached_ids() :
+    "Drops cached games that aren't in mongo anymore, and loads any that are missing."
+    ce_ids = set(await get_list("name"))
+    for ce_id in [ce_id for ce_id in _name_cache if ce_id not in ce_ids] :
+        del _name_cache[ce_id]
+    missing = [ce_id for ce_id in ce_ids if ce_id not in _name_cache]
+    if len(missing) > 0 : _cache_games(list((await get_games(missing)).values()))
+
+def _start_database_name_watcher() :
+    """Starts following the games collection's change stream, if it isn't being followed already.
+    \n(In v4 a game is spread over two collections, so this just polls.)"""
+    global _name_cache_watcher
+    if DATABASE_VERSION >= 4 : return
+    if _name_cache_watcher is None or _name_cache_watcher.done() :
+        _name_cache_watcher = asyncio.create_task(_watch_database_name())
+
+async def _watch_database_name() :
+    """Follows the games collection's change stream and puts changed games straight into the cache.
+    \nChange streams need a replica set. If mongo doesn't support them (or the stream drops),
+    this just ends, and the cache goes back to polling."""
+    global _name_cache_resync
+    collection = _mongo_client['database_name'][V3NAMETITLE]
+    try :
+        async with collection.watch(full_document="updateLookup") as stream :
+            # the games were loaded before the stream was opened, so anything written in
+            # between is only caught by loading them again, now that it's open.
+            invalidate_cached_games()
+            async for change in stream :
+                if change['operationType'] == "delete" :
+                    # the change only has the _id, so we can't tell which game it was.
+                    _name_cache_resync = True
+                elif change['operationType'] in ("insert", "replace", "update") :
+                    document = change.get('fullDocument')
+                    if document is not None : _cache_games([__mongo_to_game(document)])
+                else :
+                    # drop, rename, invalidate, etc. - start over.
+                    invalidate_cached_games()
+                    return
+    except Exception as e :
+        print(f"database name change stream stopped, polling every {DATABASE_NAME_MAX_STALENESS}s instead. ({e})")
+
+
+def __mongo_to_game(game : dict, lazy : bool = False) -> CEGame :
+    fields = dict(
         ce_id=game['ce_id'],
         game_name=game['name'],
         platform=game['platform'],
         platform_id=game['platform_id'],
         category=game['category'],
-        objectives=[__mongo_to_objective(obj) for obj in game['objectives']],
         last_updated=game['last_updated'],
         banner=game['banner']
     )
+    if lazy : return CELazyGame(objectives=_lazy_list(game, 'objectives', __mongo_to_objective), **fields)
+    return CEGame(objectives=[__mongo_to_objective(obj) for obj in game['objectives']], **fields)
 
 def __mongo_to_objective(obj : dict) -> CEObjective :
     return CEObjective(
@@ -145,68 +417,657 @@ def __mongo_to_objective(obj : dict) -> CEObjective :
         point_value_partial=obj['partial_value']
     )
 
+# -- partial games -- #
+
+GAME_VIEWS : dict[str, list[str]] = {
+    "header" : ["ce_id", "game_name", "platform", "platform_id", "category", "last_updated", "banner"]
+}
+"""The ways a game can be loaded with only some of its fields, for `get_game_view()`.
+Each view is a list of :class:`CEGame` constructor argument names."""
+
+_GAME_FIELD_KEYS : dict[str, str] = {"game_name" : "name"}
+"The mongo key for each game field, if it isn't the same as the field's name."
+
+def _game_projection(view : str) -> dict :
+    if view not in GAME_VIEWS : raise ValueError(f"There's no game view called '{view}'.")
+    projection = {_GAME_FIELD_KEYS.get(field, field) : 1 for field in GAME_VIEWS[view]}
+    projection["_id"] = 0
+    return projection
+
+async def get_game_view(ce_id : str, view : str = "header") -> CEPartialGame | None :
+    """Gets a game associated with `ce_id` with only the fields in `GAME_VIEWS[view]`,
+    or `None` if there isn't one."""
+    async for db in _find_game_documents({"ce_id" : ce_id}, _game_projection(view)) :
+        return _mongo_to_partial_game(db, GAME_VIEWS[view])
+    return None
+
+async def get_database_name_view(view : str = "header") -> list[CEPartialGame] :
+    "Returns every game in mongo with only the fields in `GAME_VIEWS[view]`."
+    projection = _game_projection(view)
+    return [_mongo_to_partial_game(document, GAME_VIEWS[view])
+            async for document in _find_game_documents(None, projection)]
+
+def _mongo_to_partial_game(game : dict, fields : list[str]) -> CEPartialGame :
+    loaded = {}
+    for field in fields :
+        if field == "objectives" : loaded[field] = [__mongo_to_objective(obj) for obj in game['objectives']]
+        else : loaded[field] = game.get(_GAME_FIELD_KEYS.get(field, field))
+    return CEPartialGame(**loaded)
+
 # -- users -- #
 
-async def get_user(ce_id : str, use_discord_id : bool = False) -> CEUser :
-    "Gets a user associated with `ce_id`."
+async def _find_user_documents(query : dict | None = None, projection : dict | None = None, raw : bool = False) :
+    """Yields the v3 document of every user matching `query`, from whichever database version is in use.
+    \n`projection` and `raw` (yield undecoded `RawBSONDocument`'s) only matter in v3.
+    (In v4, only the `rolls` and `owned_games` in the projection are read.)"""
+    if DATABASE_VERSION >= 4 :
+        parts = tuple(part for part in ("rolls", "owned_games") if projection is None or part in projection)
+        for document in await Mongo_V4.find_users(_mongo_client[Mongo_V4.V4DATABASE], query, parts) :
+            yield document
+        return
     collection = _mongo_client['database_name'][V3USERTITLE]
-    if not use_discord_id :
-        db = await collection.find_one({"ce_id" : ce_id})
-    else :
-        db = await collection.find_one({"discord_id" : ce_id})
-    
-    if db is None and use_discord_id : 
-        raise ValueError(f"No user found with discord id {ce_id} in mongo.")
-    elif db is None and not use_discord_id :
-        raise ValueError(f"No user found with ce id {ce_id} in mongo.")
+    if raw : collection = collection.with_options(codec_options=_RAW_BSON)
+    async for document in collection.find(query or {}, projection or {"_id" : 0}) :
+        yield document
+
+async def _find_user_document(ce_id : str, use_discord_id : bool = False, projection : dict | None = None) -> dict | None :
+    "Returns the v3 document of the user with ce_id (or discord id) `ce_id`, or `None` if there isn't one."
+    async for document in _find_user_documents({"discord_id" if use_discord_id else "ce_id" : ce_id}, projection) :
+        return document
+    return None
+
+async def get_user(ce_id : str, use_discord_id : bool = False) -> CEUser :
+    """Gets a user associated with `ce_id` (or with the discord id `ce_id`, if `use_discord_id`).
+    \nThis is served from the user cache when it can be, and every call gets its own `CEUser`."""
+    db = _get_cached_user_document(ce_id, use_discord_id)
+    if db is None :
+        db = await _find_user_document(ce_id, use_discord_id)
+        
+        if db is None and use_discord_id : 
+            raise ValueError(f"No user found with discord id {ce_id} in mongo.")
+        elif db is None and not use_discord_id :
+            raise ValueError(f"No user found with ce id {ce_id} in mongo.")
+        _cache_user_document(db)
 
     return __mongo_to_user(db)
 
+async def find_user(ce_id : str, use_discord_id : bool = False) -> CEUser | None :
+    "Same as `get_user()`, but returns `None` if the user isn't registered (or was unlinked)."
+    try : return await get_user(ce_id, use_discord_id)
+    except ValueError : return None
+
 async def dump_user(user : CEUser) :
-    "Dumps a user back to the backend."
+    """Dumps a user back to the backend, owned games and all.
+    \nIf someone else wrote to the user after they were loaded (a casino roll, say), what was
+    changed here is merged into what they wrote instead of written over it (see `_save_users()`).
+    A `UserConflictException` is raised if that can't be done, or if `user` is brand new
+    and someone's already registered with their ce_id."""
 
-    if type(user) is not CEUser :
+    if type(user) not in (CEUser, CELazyUser) :
         raise TypeError(f"Argument 'user' is of type {type(user)}, not CEUser.")
 
-    collection = _mongo_client['database_name'][V3USERTITLE]
-
-    if (await collection.find_one({"ce_id" : user.ce_id})) == None :
-        await collection.insert_one(user.to_dict())
-    else :
-        await collection.replace_one({"ce_id" : user.ce_id}, user.to_dict())
-    pass
-
-async def get_database_user() -> list[CEUser] :
-    collection = _mongo_client['database_name'][V3USERTITLE]
-
-    cursor = collection.find({}, {"_id" : 0})
-    objects = await cursor.to_list(length=None)
+    written, failed = await _save_users([user])
+    if len(failed) > 0 :
+        if failed[0][1].startswith((_USER_CONFLICT_MESSAGE, _USER_REGISTERED_MESSAGE)) :
+            raise UserConflictException(f"User {user.ce_id} {failed[0][1]}.")
+        raise Exception(f"User {user.ce_id} not dumped properly: {failed[0][1]}")
 
+async def get_database_user(lazy : bool = False) -> list[CEUser] :
+    """Returns every registered user in mongo.
+    \nIf `lazy`, the users are :class:`CELazyUser`'s (see "lazy bulk loads" below)."""
     database_user : list[CEUser] = []
-    for o in objects :
-        try : database_user.append(__mongo_to_user(o))
+    async for o in _find_user_documents(raw=lazy) :
+        try : database_user.append(__mongo_to_user(o, lazy))
         except Exception as e : 
             print(e)
             continue
     
     return database_user
 
-def __mongo_to_user(user : dict) -> CEUser :
+# -- partial users -- #
+
+USER_VIEWS : dict[str, list[str]] = {
+    "summary" : ["discord_id", "ce_id", "display_name", "avatar", "last_updated", "steam_id", "fingerprint"],
+    "rolls" : ["discord_id", "ce_id", "rolls"],
+    "games" : ["discord_id", "ce_id", "owned_games"]
+}
+"""The ways a user can be loaded with only some of their fields, for `get_user_view()`.
+Each view is a list of :class:`CEUser` constructor argument names."""
+
+_USER_FIELD_KEYS : dict[str, list[str]] = {"display_name" : ["display-name", "display_name"]}
+"The mongo key(s) for each user field, if they aren't the same as the field's name."
+
+def _user_projection(view : str) -> dict :
+    if view not in USER_VIEWS : raise ValueError(f"There's no user view called '{view}'.")
+    projection = {key : 1 for field in USER_VIEWS[view] for key in _USER_FIELD_KEYS.get(field, [field])}
+    projection["version"] = 1
+    projection["_id"] = 0
+    return projection
+
+async def get_user_view(ce_id : str, view : str, use_discord_id : bool = False) -> CEPartialUser :
+    """Gets a user associated with `ce_id` (or with the discord id `ce_id`, if `use_discord_id`)
+    with only the fields in `USER_VIEWS[view]`. Raises a `ValueError` if there isn't one, like `get_user()`.
+    \nIf the whole user is already in the user cache, this is built from that instead."""
+    projection = _user_projection(view)
+    db = _get_cached_user_document(ce_id, use_discord_id)
+    if db is None :
+        db = await _find_user_document(ce_id, use_discord_id, projection)
+        if db is None :
+            raise ValueError(f"No user found with {'discord' if use_discord_id else 'ce'} id {ce_id} in mongo.")
+
+    return _mongo_to_partial_user(db, USER_VIEWS[view])
+
+async def find_user_view(ce_id : str, view : str, use_discord_id : bool = False) -> CEPartialUser | None :
+    "Same as `get_user_view()`, but returns `None` if the user isn't registered (or was unlinked)."
+    try : return await get_user_view(ce_id, view, use_discord_id)
+    except ValueError : return None
+
+async def get_database_user_view(view : str) -> list[CEPartialUser] :
+    "Returns every (linked) user in mongo with only the fields in `USER_VIEWS[view]`."
+    database_user : list[CEPartialUser] = []
+    async for document in _find_user_documents({"discord_id" : {"$ne" : None}}, _user_projection(view)) :
+        database_user.append(_mongo_to_partial_user(document, USER_VIEWS[view]))
+    return database_user
+
+def _mongo_to_partial_user(user : dict, fields : list[str]) -> CEPartialUser :
+    if user.get('discord_id') is None :
+        raise ValueError(f"You either called 'get_user(None)' or this user {user.get('ce_id')} was removed.")
+    loaded = {}
+    for field in fields :
+        if field == "rolls" : loaded[field] = [__mongo_to_roll(roll) for roll in user['rolls']]
+        elif field == "owned_games" : loaded[field] = [__mongo_to_user_game(game) for game in user['owned_games']]
+        else : loaded[field] = next((user[key] for key in _USER_FIELD_KEYS.get(field, [field]) if key in user), None)
+    partial_user = CEPartialUser(version=user.get('version', 0), **loaded)
+    partial_user.set_synced_state(_synced_user_state(user))
+    return partial_user
+
+# -- lazy bulk loads -- #
+# bulk loads (the cached database name, `get_games_map(lazy=True)`, `get_database_user(lazy=True)`)
+# ask mongo for `RawBSONDocument`'s and only decode the top-level fields. A game's objectives
+# (or a user's owned games) stay as raw bytes until something uses them.
+
+_RAW_BSON = CodecOptions(document_class=RawBSONDocument)
+
+def _lazy_list(document : dict, key : str, convert : Callable[[dict], object]) -> Callable[[], list] :
+    """Returns a loader that runs `convert` on everything in `document[key]` when it's called.
+    \nIf `document` is a `RawBSONDocument`, only its bytes are kept until then (v4 documents
+    are already decoded, so those just keep the list)."""
+    if isinstance(document, RawBSONDocument) :
+        raw = document.raw
+        return lambda : [convert(item) for item in bson.decode(raw)[key]]
+    items = document[key]
+    return lambda : [convert(item) for item in items]
+
+def benchmark_lazy_loads(num_games : int = 10000, objectives_per_game : int = 8, num_users : int = 500,
+                         games_per_user : int = 300) :
+    """Builds a catalogue-sized set of game and user documents in memory (no mongo needed) and
+    compares loading them eagerly with loading them lazily: how long it takes, and how much
+    memory the loaded objects hold. Then times using every lazy field, for the worst case."""
+    import tracemalloc
+
+    objective = lambda g, o : {
+        "name" : f"Objective {o}", "ce_id" : f"game-{g}-objective-{o}", "value" : 10 * (o + 1),
+        "description" : "Complete the game on the hardest difficulty without dying. " * 2,
+        "game_ce_id" : f"game-{g}", "type" : "Primary" if o % 4 else "Community",
+        "achievements" : [f"achievement-{g}-{o}-{a}" for a in range(3)], "requirements" : None, "partial_value" : 0
+    }
+    games = [bson.encode({
+        "name" : f"Game {g}", "ce_id" : f"game-{g}", "platform" : "steam", "platform_id" : str(g),
+        "category" : "Action", "objectives" : [objective(g, o) for o in range(objectives_per_game)],
+        "last_updated" : g, "banner" : f"https://example.com/{g}.jpg"
+    }) for g in range(num_games)]
+    users = [bson.encode({
+        "discord_id" : u + 1, "ce_id" : f"user-{u}", "display_name" : f"User {u}", "avatar" : "", "rolls" : [],
+        "owned_games" : [{"name" : f"Game {g}", "ce_id" : f"game-{g}", "objectives" : [
+            {"name" : f"Objective {o}", "ce_id" : f"game-{g}-objective-{o}", "game_ce_id" : f"game-{g}",
+             "type" : "Primary", "user_points" : 10} for o in range(objectives_per_game // 2)
+        ]} for g in range(games_per_user)],
+        "last_updated" : 0, "steam_id" : "0", "fingerprint" : None, "version" : 1
+    }) for u in range(num_users)]
+
+    def measure(label : str, load : Callable[[], list]) -> list :
+        # timed on its own, since tracing memory slows everything down.
+        start = time.perf_counter()
+        loaded = load()
+        elapsed = time.perf_counter() - start
+        del loaded
+        tracemalloc.start()
+        loaded = load()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label}: {elapsed*1000:.0f} ms, {held / 2**20:.1f} MiB held")
+        return loaded
+
+    print(f"{num_games} games x {objectives_per_game} objectives, {num_users} users x {games_per_user} owned games")
+    for kind, documents, convert, field in (
+        ("games", games, __mongo_to_game, "all_objectives"),
+        ("users", users, __mongo_to_user, "owned_games")
+    ) :
+        # each document is copied first, like it just came from mongo, so the lazy objects pay for the bytes they keep.
+        measure(f"{kind}, eager", lambda : [convert(bson.decode(bytes(bytearray(raw)))) for raw in documents])
+        lazy = measure(f"{kind}, lazy", lambda : [convert(RawBSONDocument(bytes(bytearray(raw))), lazy=True) for raw in documents])
+        start = time.perf_counter()
+        for item in lazy : getattr(item, field)
+        print(f"{kind}, lazy, then using every {field}: +{(time.perf_counter() - start)*1000:.0f} ms")
+
+
+# -- user cache -- #
+
+USER_CACHE_SIZE = 2048
+"How many users are kept in memory. Past this, the least recently used ones are dropped."
+
+USER_CACHE_MAX_STALENESS = 30
+"""When there's no change stream, a cached user is read from mongo again once they've
+been cached for this many seconds (the scraper worker writes users from its own process)."""
+
+_user_cache : OrderedDict[str, tuple[int | None, int, bytes, float]] = OrderedDict()
+"""Each cached user's `(discord_id, version, document, when it was cached)` by ce_id, least recently used first.
+The document is kept as BSON so that every hit builds a brand new `CEUser`
+(commands change the users they get, and that can't leak back into the cache).
+The version is kept next to it, so checking it doesn't mean decoding the whole document."""
+_user_cache_discord_ids : dict[int, str] = {}
+"The ce_id of every cached user, by discord id."
+_user_cache_watcher : asyncio.Task | None = None
+_user_cache_watcher_started = -float("inf")
+
+USER_CACHE_WATCH_RETRY_SECONDS = 5 * 60
+"How long to wait before trying the users change stream again, after it's stopped (or mongo couldn't start it)."
+
+def invalidate_cached_users(ce_ids : list[str] | None = None) :
+    "Drops `ce_ids` (or everyone, if `None`) from the user cache, so they're read from mongo next time."
+    if ce_ids is None :
+        _user_cache.clear()
+        _user_cache_discord_ids.clear()
+        return
+    for ce_id in ce_ids :
+        discord_id, _, _, _ = _user_cache.pop(ce_id, (None, None, None, None))
+        if discord_id is not None and _user_cache_discord_ids.get(discord_id) == ce_id :
+            del _user_cache_discord_ids[discord_id]
+
+def _cache_user_document(document : dict) :
+    "Puts (or replaces) a user's document in the cache, and drops the least recently used users if it's full."
+    ce_id, discord_id = document['ce_id'], document.get('discord_id')
+    invalidate_cached_users([ce_id])
+    _user_cache[ce_id] = (discord_id, document.get('version') or 0, bson.encode(document), time.monotonic())
+    if discord_id is not None : _user_cache_discord_ids[discord_id] = ce_id
+    _start_user_cache_watcher()
+
+    while len(_user_cache) > USER_CACHE_SIZE :
+        old_ce_id, (old_discord_id, _, _, _) = _user_cache.popitem(last=False)
+        if old_discord_id is not None and _user_cache_discord_ids.get(old_discord_id) == old_ce_id :
+            del _user_cache_discord_ids[old_discord_id]
+
+def _get_cached_user_document(id : str | int, use_discord_id : bool = False) -> dict | None :
+    """Returns a fresh copy of the cached document for ce_id (or discord id) `id`, or `None` if
+    it isn't cached (or it's been cached too long, and there's no change stream keeping it current)."""
+    ce_id = _user_cache_discord_ids.get(id) if use_discord_id else id
+    if ce_id is None or ce_id not in _user_cache : return None
+    if (_user_cache_watcher is None or _user_cache_watcher.done()) and \
+       time.monotonic() - _user_cache[ce_id][3] >= USER_CACHE_MAX_STALENESS :
+        invalidate_cached_users([ce_id])
+        return None
+    _user_cache.move_to_end(ce_id)
+    return bson.decode(_user_cache[ce_id][2])
+
+def _start_user_cache_watcher() :
+    "Starts following the users collection's change stream, if it isn't being followed already (and it didn't just stop)."
+    global _user_cache_watcher, _user_cache_watcher_started
+    if _user_cache_watcher is not None and not _user_cache_watcher.done() : return
+    if time.monotonic() - _user_cache_watcher_started < USER_CACHE_WATCH_RETRY_SECONDS : return
+    _user_cache_watcher_started = time.monotonic()
+    _user_cache_watcher = asyncio.create_task(_watch_users())
+
+async def _watch_users() :
+    """Follows the users collection's change stream, and drops any cached user that someone else
+    (like the scraper worker) wrote to. Writes from this process are already in the cache, so a
+    change that leaves a user on the version that's cached is skipped.
+    \nIf mongo can't do change streams (or the stream drops), this just ends, and cached users
+    go back to expiring after `USER_CACHE_MAX_STALENESS` seconds."""
+    if DATABASE_VERSION >= 4 :
+        # every v4 write bumps the user document's version, so it's the only one that needs watching.
+        collection, key = _mongo_client[Mongo_V4.V4DATABASE][Mongo_V4.V4USERTITLE], "ce_id_user"
+    else :
+        collection, key = _mongo_client['database_name'][V3USERTITLE], "ce_id"
+    try :
+        async with collection.watch(full_document="updateLookup") as stream :
+            # anything cached before the stream started could already be out of date.
+            invalidate_cached_users()
+            async for change in stream :
+                document = change.get('fullDocument')
+                if change['operationType'] in ("insert", "replace", "update") and document is not None :
+                    ce_id = document[key]
+                    if ce_id in _user_cache and _user_cache[ce_id][1] != (document.get('version') or 0) :
+                        invalidate_cached_users([ce_id])
+                else :
+                    # a delete only has the _id (and drop, rename, etc. could be anything), so start over.
+                    invalidate_cached_users()
+    except Exception as e :
+        print(f"user change stream stopped, re-reading cached users every {USER_CACHE_MAX_STALENESS}s instead. ({e})")
+
+# -- partial user updates -- #
+
+_USER_STATE_ATTRIBUTES : dict[str, str] = {
+    "discord_id" : "_discord_id",
+    "display-name" : "_display_name",
+    "avatar" : "_avatar",
+    "last_updated" : "_last_updated",
+    "steam_id" : "_steam_id",
+    "fingerprint" : "_fingerprint"
+}
+"""The fields `update_user()` can `$set`, by their mongo key (and the :class:`CEUser` attribute they come from).
+`rolls` is handled on its own, and `owned_games` is never partially updated."""
+
+def _synced_user_state(document : dict) -> dict :
+    "Returns a copy of the rolls and other fields `update_user()` can write from a user's mongo document."
+    state = {key : document[key] for key in list(_USER_STATE_ATTRIBUTES) + ["rolls"] if key in document}
+    return bson.decode(bson.encode(state))
+
+def _user_state(user : CEUser) -> dict :
+    "Returns the rolls and other fields `update_user()` can write as they are on `user` right now (skipping any that weren't loaded)."
+    state = {}
+    for key, attribute in _USER_STATE_ATTRIBUTES.items() :
+        try : state[key] = getattr(user, attribute)
+        except FieldNotLoadedException : continue
+    try : state["rolls"] = [roll.to_dict() for roll in user.rolls]
+    except FieldNotLoadedException : pass
+    return bson.decode(bson.encode(state))
+
+def _removed_rolls(old : list[dict], new : list[dict]) -> list[dict] | None :
+    "Returns the rolls that were taken out of `old` to get `new`, or `None` if anything else changed."
+    removed, j = [], 0
+    for roll in old :
+        if j < len(new) and new[j] == roll : j += 1
+        else : removed.append(roll)
+    return removed if j == len(new) else None
+
+def _user_update(old : dict, new : dict) -> dict :
+    "Returns the mongo update that turns the synced state `old` into `new` (empty if nothing changed)."
+    update : dict[str, dict] = {}
+    sets = {key : value for key, value in new.items() if key != "rolls" and old.get(key) != value}
+
+    if "rolls" in new and new["rolls"] != old.get("rolls") :
+        old_rolls, new_rolls = old.get("rolls", []), new["rolls"]
+        removed = _removed_rolls(old_rolls, new_rolls)
+        if len(new_rolls) > len(old_rolls) and new_rolls[:len(old_rolls)] == old_rolls :
+            update["$push"] = {"rolls" : {"$each" : new_rolls[len(old_rolls):]}}
+        elif len(new_rolls) == len(old_rolls) :
+            for i, roll in enumerate(new_rolls) :
+                if roll != old_rolls[i] : sets[f"rolls.{i}"] = roll
+        elif removed is not None and not any(roll in new_rolls for roll in removed) :
+            # $pull takes out every match, so this is only safe if none of the removed rolls are staying.
+            update["$pull"] = {"rolls" : {"$in" : removed}}
+        else :
+            sets["rolls"] = new_rolls
+
+    if len(sets) > 0 : update["$set"] = sets
+    return update
+
+async def update_user(user : CEUser, session = None) :
+    """Writes only what's changed on `user` since it was loaded: a `$push`, `$pull` or `$set`
+    on `rolls`, and a `$set` on any other field that changed. `owned_games` is never
+    written (use `dump_user()` for that), and partial users from `get_user_view()` work too.
+    \nThis only goes through if nobody else has written to this user since it was loaded
+    (every write bumps the user's `version`). If someone has, a `UserConflictException` is
+    raised and nothing is written - reload the user and try again, or use `modify_user()`.
+    \nPass a `session` (see `outbox_transaction()`) to write inside its transaction."""
+    if user.synced_state is None :
+        raise ValueError(f"User {user.ce_id} wasn't loaded from mongo, so it has to be dumped with dump_user().")
+
+    state = _user_state(user)
+    if len(_user_update(user.synced_state, state)) == 0 : return
+    if not await _write_user_state(user.ce_id, user.version, user.synced_state, state, session) :
+        invalidate_cached_users([user.ce_id])
+        raise UserConflictException(f"User {user.ce_id} was changed by someone else after version {user.version} was loaded.")
+
+    _recache_updated_user(user.ce_id, user.version, state)
+    user.set_version(user.version + 1)
+    user.set_synced_state({**user.synced_state, **state})
+
+async def _write_user_state(ce_id : str, version : int, old : dict, new : dict, session = None) -> bool :
+    """Writes what's different between the synced states `old` and `new` to the user, if they're still
+    on `version` (and bumps it). Returns false if they aren't. (Nothing changed counts as written.)"""
+    update = _user_update(old, new)
+    if len(update) == 0 : return True
+    update["$inc"] = {"version" : 1}
+
+    if DATABASE_VERSION >= 4 :
+        # v4 keeps each roll in its own document, so it works out its own writes.
+        return await Mongo_V4.update_user(_mongo_client[Mongo_V4.V4DATABASE], ce_id, version, old, new, session)
+    collection = _mongo_client['database_name'][V3USERTITLE]
+    result = await collection.update_one({"ce_id" : ce_id, "version" : _version_query(version)}, update, session=session)
+    return result.matched_count > 0
+
+def _recache_updated_user(ce_id : str, old_version : int, state : dict) :
+    "Applies an `update_user()` write to the cached copy of that user (or drops it, if the cached copy is a different version)."
+    if ce_id not in _user_cache : return
+    if _user_cache[ce_id][1] != old_version :
+        return invalidate_cached_users([ce_id])
+    document = bson.decode(_user_cache[ce_id][2])
+    document.update(state)
+    document['version'] = old_version + 1
+    _cache_user_document(document)
+
+async def modify_user(ce_id : str, change : Callable[[CEUser], None], use_discord_id : bool = False, 
+                      tries : int = 3) -> CEUser :
+    """Loads a user, calls `change(user)` on them, and writes what changed with `update_user()`.
+    If someone else wrote to the user first, it's all done again on a fresh copy (up to `tries` times).
+    Returns the updated user."""
+    for attempt in range(tries) :
+        user = await get_user(ce_id, use_discord_id)
+        change(user)
+        try :
+            await update_user(user)
+            return user
+        except UserConflictException :
+            if attempt == tries - 1 : raise
+
+async def modify_users(ce_ids : list[str], change : Callable[[list[CEUser]], None], tries : int = 3) -> list[CEUser] :
+    """Same as `modify_user()`, but for users that have to change together (like a co-op roll's
+    user and partner). `change(users)` gets them in the same order as `ce_ids`, and they're returned that way.
+    \nEither every user is written or none of them are. They're written in one transaction if
+    mongo can do them. If it can't, and one of them conflicts after the ones before were written,
+    those writes are undone before it's all tried again. A `UserConflictException` is raised
+    (with nothing written) if it still conflicts after `tries` tries."""
+    for attempt in range(tries) :
+        users = [await get_user(ce_id) for ce_id in ce_ids]
+        change(users)
+        written : list[tuple[CEUser, int, dict]] = []
+        "Each user written so far, with the version and synced state they had before."
+        try :
+            async with outbox_transaction() as session :
+                for user in users :
+                    before = (user, user.version, user.synced_state)
+                    await update_user(user, session=session)
+                    written.append(before)
+            return users
+        except UserConflictException :
+            if session is None : await _undo_user_updates(written)
+            if attempt == tries - 1 : raise
+        except PyMongoError as e :
+            # a write conflict inside a transaction aborts it (nothing's written), so it's
+            # the same as a version conflict: try it all again.
+            if not e.has_error_label("TransientTransactionError") : raise
+            if attempt == tries - 1 :
+                raise UserConflictException(f"Users {ce_ids} kept being changed by someone else: {e}")
+
+async def _undo_user_updates(written : list[tuple[CEUser, int, dict]]) :
+    "Puts each `(user, version, synced state)` written by `modify_users()` back how it was, newest first."
+    for user, version, state in reversed(written) :
+        invalidate_cached_users([user.ce_id])
+        if not await _write_user_state(user.ce_id, user.version, user.synced_state, state) :
+            print(f"couldn't undo the write to user {user.ce_id} (version {version}), someone else wrote to them first.")
+
+# -- whole user writes -- #
+
+_USER_CONFLICT_MESSAGE = "was changed by someone else"
+"How a whole-user write that lost to someone else's write starts its failure message."
+_USER_REGISTERED_MESSAGE = "is already registered"
+"How a brand new user's write that would have gone over a registered user starts its failure message."
+
+def _version_query(version : int) :
+    "Matches a user that's on `version` (users saved before there were versions count as 0)."
+    return version if version != 0 else {"$in" : [0, None]}
+
+async def _stored_user_versions(ce_ids : list[str], session = None) -> dict[str, tuple[int, int | None]] :
+    "Returns the `(version, discord_id)` each of `ce_ids` has in mongo right now (leaving out any that aren't there)."
+    if len(ce_ids) == 0 : return {}
+    if DATABASE_VERSION >= 4 :
+        return await Mongo_V4.get_user_versions(_mongo_client[Mongo_V4.V4DATABASE], ce_ids, session)
+    collection = _mongo_client['database_name'][V3USERTITLE]
+    return {document['ce_id'] : (document.get('version') or 0, document.get('discord_id')) async for document
+            in collection.find({"ce_id" : {"$in" : ce_ids}}, {"ce_id" : 1, "version" : 1, "discord_id" : 1, "_id" : 0}, session=session)}
+
+def _roll_key(roll : dict) -> tuple :
+    "What tells one roll apart from the user's others, whatever's changed about it since."
+    return (roll.get('name'), roll.get('init_time'), roll.get('user_ce_id'))
+
+def _merge_rolls(base : list[dict], ours : list[dict], theirs : list[dict]) -> list[dict] :
+    """Merges two sets of changes to the rolls `base`: `ours` and `theirs`.
+    \nA roll that only one side changed (or took out) gets that side's change, and anything
+    either side added is kept. If both changed the same roll, `theirs` wins (the loop that
+    made `ours` will see it again next time)."""
+    base_rolls = {_roll_key(roll) : roll for roll in base}
+    our_rolls = {_roll_key(roll) : roll for roll in ours}
+    merged : list[dict] = []
+    for roll in theirs :
+        key = _roll_key(roll)
+        if key not in base_rolls or base_rolls[key] != roll : merged.append(roll)
+        elif key in our_rolls : merged.append(our_rolls[key])
+    theirs_keys = {_roll_key(roll) for roll in theirs}
+    merged += [roll for roll in ours if _roll_key(roll) not in base_rolls and _roll_key(roll) not in theirs_keys]
+    return merged
+
+def _merge_user_document(base : dict, ours : dict, theirs : dict) -> dict :
+    """Merges a whole user document written here (`ours`) with the one someone else wrote to mongo
+    after `ours` was loaded (`theirs`). `base` is the synced state `ours` was loaded with.
+    \nOwned games come from `ours` (only the loop and admins write them, and from the site).
+    A field only `ours` changed comes from `ours`, rolls are merged with `_merge_rolls()`,
+    and everything else stays as it is in `theirs`."""
+    merged = dict(theirs)
+    merged['owned_games'] = ours['owned_games']
+    for key in _USER_STATE_ATTRIBUTES :
+        if key in ours and ours[key] != base.get(key) : merged[key] = ours[key]
+    merged['rolls'] = _merge_rolls(base.get('rolls', []), ours.get('rolls', []), theirs.get('rolls', []))
+    return merged
+
+def _apply_user_state(user : CEUser, state : dict) :
+    "Puts the rolls and other fields in `state` (like `_synced_user_state()` makes) onto `user`."
+    for key, attribute in _USER_STATE_ATTRIBUTES.items() :
+        if key in state : setattr(user, attribute, state[key])
+    if "rolls" in state : user._rolls = [__mongo_to_roll(roll) for roll in state['rolls']]
+
+async def _save_users(users : list[CEUser], session = None) -> tuple[list[tuple[CEUser, dict]], list[tuple[str, str]]] :
+    """Writes whole users (owned games and all), each only if it's still on the version it was loaded at.
+    \nIf someone else wrote to a user after they were loaded, that user is read again and the
+    changes made here are merged into theirs (see `_merge_user_document()`), instead of written
+    over them. A user that wasn't loaded from mongo (a brand new one) is written as it is,
+    unless someone's already registered with that ce_id.
+    Every user that's written gets its new version, synced state and any merged-in rolls and fields.
+    \nReturns each user that was written with the document they were written as, and
+    `(ce_id, message)` for any that weren't. Inside a transaction (`session`), a user who's
+    changed partway through the write fails the whole transaction, so it's raised instead."""
+    failed : list[tuple[str, str]] = []
+    pending : dict[str, tuple[CEUser, dict, int | None]] = {}
+    "Each user's `(user, document, the version it has to be on to be written over)`, by ce_id."
+    for user in users :
+        try : document = user.to_dict()
+        except Exception as e :
+            failed.append((user.ce_id, f"couldn't be turned into a document ({e})"))
+            continue
+        pending[user.ce_id] = (user, document, None if user.synced_state is None else user.version)
+
+    # merge anyone who's been written to since they were loaded.
+    stored = await _stored_user_versions(list(pending), session)
+    for ce_id, (version, discord_id) in stored.items() :
+        user, document, loaded_version = pending[ce_id]
+        if loaded_version is None and discord_id is not None :
+            del pending[ce_id]
+            failed.append((ce_id, f"{_USER_REGISTERED_MESSAGE} to <@{discord_id}>"))
+            continue
+        if loaded_version is None or version == loaded_version : continue
+        theirs = await _find_user_document(ce_id)
+        if theirs is None or (theirs.get('version') or 0) != version :
+            del pending[ce_id]
+            failed.append((ce_id, f"{_USER_CONFLICT_MESSAGE} while it was being merged"))
+            continue
+        print(f"user {ce_id} was changed after version {loaded_version} was loaded, so merging into version {version}.")
+        pending[ce_id] = (user, _merge_user_document(user.synced_state, document, theirs), version)
+
+    for user, document, version in pending.values() :
+        document['version'] = (version if version is not None else user.version) + 1
+
+    ce_ids = list(pending)
+    documents = [document for _, document, _ in pending.values()]
+    # brand new users are upserted. everyone else is only written over if they're still on
+    # the version in the filter (never upserted, so someone who's changed since isn't written over).
+    new_ids = [ce_id for ce_id, (_, _, version) in pending.items() if version is None]
+    write_errors : list[tuple[str, str]] = []
+    try :
+        if len(documents) == 0 : pass
+        elif DATABASE_VERSION >= 4 :
+            versions = {ce_id : version for ce_id, (_, _, version) in pending.items() if version is not None}
+            write_errors = await Mongo_V4.save_users(_mongo_client[Mongo_V4.V4DATABASE], documents, session=session, versions=versions)
+        else :
+            collection = _mongo_client['database_name'][V3USERTITLE]
+            guarded = [(ce_id, {"ce_id" : ce_id, "version" : _version_query(version)}, document)
+                       for ce_id, (_, document, version) in pending.items() if version is not None]
+            write_errors = await Mongo_V4.replace_matching(
+                collection, [(filter, document) for _, filter, document in guarded], [ce_id for ce_id, _, _ in guarded],
+                f"{_USER_CONFLICT_MESSAGE} while it was being written", session
+            )
+            if len(new_ids) > 0 :
+                await collection.bulk_write([ReplaceOne({"ce_id" : ce_id}, pending[ce_id][1], upsert=True) for ce_id in new_ids],
+                                            ordered=False, session=session)
+    except BulkWriteError as e :
+        if session is not None : raise
+        # a brand new user that someone else has just written trips the ce_id index.
+        write_errors += [(new_ids[error['index']],
+                          f"{_USER_CONFLICT_MESSAGE} while it was being written" if error.get('code') == 11000
+                          and "discord_id" not in error.get('errmsg', "") else error.get('errmsg', "unknown error"))
+                         for error in e.details.get('writeErrors', [])]
+    except Exception :
+        invalidate_cached_users(ce_ids)
+        raise
+    if session is not None and len(write_errors) > 0 :
+        # the rest of the transaction can't be written without this user.
+        invalidate_cached_users(ce_ids)
+        raise UserConflictException(f"User {write_errors[0][0]} {write_errors[0][1]}.")
+
+    failed += write_errors
+    failed_ids = {ce_id for ce_id, _ in failed}
+    invalidate_cached_users(list(failed_ids))
+    written : list[tuple[CEUser, dict]] = []
+    for ce_id, (user, document, _) in pending.items() :
+        if ce_id in failed_ids : continue
+        _cache_user_document(document)
+        state = _synced_user_state(document)
+        if state != _user_state(user) : _apply_user_state(user, state)
+        user.set_version(document['version'])
+        user.set_synced_state(state)
+        written.append((user, document))
+    return written, failed
+
+def __mongo_to_user(user : dict, lazy : bool = False) -> CEUser :
     if user['discord_id'] is None :
         raise ValueError(f"You either called 'get_user(None)' or this user {user['ce_id']} was removed.")
     display_name : str = None
     if 'display-name' in user : display_name = user['display-name']
     elif 'display_name' in user : display_name = user['display_name']
-    return CEUser(
+    fields = dict(
         discord_id=user['discord_id'],
         ce_id=user['ce_id'],
         display_name=display_name,
         avatar=user['avatar'],
         rolls=[__mongo_to_roll(roll) for roll in user['rolls']],
-        owned_games=[__mongo_to_user_game(game) for game in user['owned_games']],
         last_updated=user['last_updated'],
-        steam_id=user['steam_id']
+        steam_id=user['steam_id'],
+        fingerprint=user.get('fingerprint'),
+        version=user.get('version', 0)
     )
+    if lazy : ce_user = CELazyUser(owned_games=_lazy_list(user, 'owned_games', __mongo_to_user_game), **fields)
+    else : ce_user = CEUser(owned_games=[__mongo_to_user_game(game) for game in user['owned_games']], **fields)
+    ce_user.set_synced_state(_synced_user_state(user))
+    return ce_user
 
 def __mongo_to_roll(roll : dict) -> CERoll :
     return CERoll(
@@ -307,6 +1168,493 @@ def __mongo_to_individual_value_input(i : dict) -> CEIndividualValueInput :
     )
 
 
+# -- bulk writes -- #
+
+class BulkDumper() :
+    """Collects games or users and writes them all at once, in one unordered `bulk_write`
+    of upserts, instead of one round-trip each.
+    \nA batch is written once it has `max_batch` documents, once its oldest document has
+    waited `max_wait` seconds, or when `flush()` is called (or the `async with` block ends).
+    Either limit can be None, so that batches are only written when they're flushed.
+    Nothing is turned into a document until its batch is written, so an object that's still
+    being changed after `add()` gets written as it is at that point.
+    \nIf some documents in a batch fail, the rest are still written. The failures are
+    printed and collected in `errors` as `(ce_id, message)`.
+    \nUsers are written with `_save_users()`, so a user someone else wrote to after they
+    were loaded has the changes merged into theirs instead of written over them."""
+    def __init__(self, database : Literal["name", "user"], max_batch : int | None = 500, max_wait : float | None = 5.0) :
+        if database == "name" :
+            self._collection = _mongo_client['database_name'][V3NAMETITLE]
+            self._types = (CEGame, CEAPIGame)
+        elif database == "user" :
+            self._collection = _mongo_client['database_name'][V3USERTITLE]
+            self._types = (CEUser,)
+        else :
+            raise ValueError(f"Can't bulk dump to database '{database}'.")
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+
+        self._pending : dict[str, CEGame | CEUser] = {}
+        self._in_flight : dict[str, CEGame | CEUser] = {}
+        self._oldest : float | None = None
+        self._timer : asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+        self.errors : list[tuple[str, str]] = []
+        "Every document that failed to write, as `(ce_id, message)`."
+        self.written = 0
+        "How many documents have been written."
+
+    async def __aenter__(self) -> 'BulkDumper' :
+        return self
+
+    async def __aexit__(self, *exc_info) :
+        await self.flush()
+        if self._timer is not None : self._timer.cancel()
+
+    def get_pending(self, ce_id : str) -> CEGame | CEUser | None :
+        """Returns the object for `ce_id` if it's waiting to be written (or being written right now).
+        Read from this before reading from mongo, or you might get an outdated copy."""
+        if ce_id in self._pending : return self._pending[ce_id]
+        return self._in_flight.get(ce_id)
+
+    async def get(self, ce_id : str) -> CEGame | CEUser | None :
+        "Returns the pending object for `ce_id` if there is one, and reads it from mongo if not."
+        pending = self.get_pending(ce_id)
+        if pending is not None : return pending
+        if CEUser in self._types : return await get_user(ce_id)
+        return await get_game(ce_id)
+
+    async def add(self, item : CEGame | CEUser) :
+        "Queues `item` to be written. Adding the same ce_id again just replaces it."
+        if not isinstance(item, self._types) :
+            raise TypeError(f"Argument 'item' is of type {type(item)}, not {self._types[0].__name__}.")
+        
+        self._pending[item.ce_id] = item
+        if self._oldest is None :
+            self._oldest = time.monotonic()
+            if self._max_wait is not None and (self._timer is None or self._timer.done()) :
+                self._timer = asyncio.create_task(self._flush_later())
+
+        if (self._max_batch is not None and len(self._pending) >= self._max_batch) or \
+           (self._max_wait is not None and time.monotonic() - self._oldest >= self._max_wait) :
+            await self.flush()
+
+    async def _flush_later(self) :
+        "Flushes whatever's pending once the oldest of it has waited `max_wait` seconds."
+        while self._oldest is not None :
+            await asyncio.sleep(max(0, self._oldest + self._max_wait - time.monotonic()))
+            if self._oldest is not None and time.monotonic() - self._oldest >= self._max_wait :
+                await self.flush()
+
+    def _put_back(self, ce_ids : list[str]) :
+        "Nothing in flight was written, so puts it all back (unless it's been re-added since)."
+        for ce_id, item in self._in_flight.items() : self._pending.setdefault(ce_id, item)
+        if self._oldest is None : self._oldest = time.monotonic()
+        if CEUser in self._types : invalidate_cached_users(ce_ids)
+
+    async def flush(self, session = None) -> list[tuple[str, str]] :
+        """Writes everything that's pending. Returns the `(ce_id, message)` of any
+        documents in this batch that failed.
+        \nPass a `session` (see `outbox_transaction()`) to write inside its transaction.
+        Then nothing can fail on its own: if anything fails, it's all put back and raised."""
+        async with self._lock :
+            if len(self._pending) == 0 : return []
+
+            self._in_flight, self._pending = self._pending, {}
+            self._oldest = None
+
+            if CEUser in self._types :
+                try : written, failed = await _save_users(list(self._in_flight.values()), session)
+                except Exception :
+                    self._put_back(list(self._in_flight))
+                    raise
+                finally :
+                    self._in_flight = {}
+                for ce_id, message in failed :
+                    print(f"bulk dump failed for {ce_id}: {message}")
+                self.errors += failed
+                self.written += len(written)
+                return failed
+
+            failed : list[tuple[str, str]] = []
+            ce_ids : list[str] = []
+            documents : list[dict] = []
+            operations : list[ReplaceOne] = []
+            for ce_id, item in self._in_flight.items() :
+                try : document = item.to_dict()
+                except Exception as e :
+                    failed.append((ce_id, f"couldn't be turned into a document ({e})"))
+                    continue
+                operations.append(ReplaceOne({"ce_id" : ce_id}, document, upsert=True))
+                documents.append(document)
+                ce_ids.append(ce_id)
+
+            write_errors : list[tuple[str, str]] = []
+            try :
+                if len(operations) == 0 : pass
+                elif DATABASE_VERSION >= 4 :
+                    write_errors = await Mongo_V4.save_games(_mongo_client[Mongo_V4.V4DATABASE], documents, session=session)
+                else : await self._collection.bulk_write(operations, ordered=False, session=session)
+            except BulkWriteError as e :
+                if session is not None :
+                    self._put_back(ce_ids)
+                    raise
+                write_errors = [(ce_ids[error['index']], error.get('errmsg', "unknown error"))
+                                for error in e.details.get('writeErrors', [])]
+            except Exception :
+                self._put_back(ce_ids)
+                raise
+            finally :
+                self._in_flight = {}
+
+            failed += write_errors
+            invalidate_cached_games(ce_ids)
+            for ce_id, message in failed :
+                print(f"bulk dump failed for {ce_id}: {message}")
+            self.errors += failed
+            self.written += len(operations) - len({ce_id for ce_id, _ in write_errors})
+            return failed
+
+async def dump_games(games : list[CEGame | CEAPIGame]) -> list[tuple[str, str]] :
+    "Dumps a list of games in as few round-trips as possible. Returns any that failed as `(ce_id, message)`."
+    async with BulkDumper("name") as dumper :
+        for game in games : await dumper.add(game)
+    return dumper.errors
+
+async def dump_users(users : list[CEUser]) -> list[tuple[str, str]] :
+    "Dumps a list of users in as few round-trips as possible. Returns any that failed as `(ce_id, message)`."
+    async with BulkDumper("user") as dumper :
+        for user in users : await dumper.add(user)
+    return dumper.errors
+
+
+
+# -- stats -- #
+# completions and points are counted in mongo (over registered users only) instead of pulling
+# every game's leaderboard or adding up someone's whole owned_games. `refresh_stats()` saves the
+# results into V3STATSTITLE at the end of every loop, and embeds read them from there.
+
+_REGISTERED = {"$match" : {"discord_id" : {"$ne" : None}}}
+_COMPLETED = {"$and" : [{"$gt" : ["$game_points", 0]}, {"$eq" : ["$points", "$game_points"]}]}
+"True for a `{points, game_points}` row that's a completion (same rule as `CEUser.get_completed_games_2()`)."
+_STARTED = {"$and" : [{"$not" : [_COMPLETED]}, {"$ne" : ["$points", 0]}]}
+"True for a `{points, game_points}` row that has progress but isn't a completion."
+
+def _user_game_points_pipeline() -> list[dict] :
+    """v3 : one `{ce_id, game_ce_id, points, game_points}` row per game a registered user owns.
+    
+`points` is the user's Primary points (`CEUserGame.get_user_points()`) and `game_points`
+    is everything the game is worth (`CEGame.get_total_points()`)."""
+    return [
+        _REGISTERED,
+        {"$unwind" : "$owned_games"},
+        {"$project" : {
+            "_id" : 0, "ce_id" : 1, "game_ce_id" : "$owned_games.ce_id",
+            "points" : {"$sum" : {"$map" : {
+                "input" : {"$filter" : {"input" : "$owned_games.objectives", "as" : "objective",
+                                        "cond" : {"$eq" : ["$$objective.type", "Primary"]}}},
+                "as" : "objective", "in" : "$$objective.user_points"
+            }}}
+        }},
+        {"$lookup" : {"from" : V3NAMETITLE, "localField" : "game_ce_id", "foreignField" : "ce_id", "as" : "game"}},
+        {"$unwind" : {"path" : "$game", "preserveNullAndEmptyArrays" : True}},
+        {"$project" : {"ce_id" : 1, "game_ce_id" : 1, "points" : 1, "game_points" : {"$sum" : "$game.objectives.value"}}}
+    ]
+
+def _v4_user_game_points_pipeline() -> list[dict] :
+    """v4 : the same rows as `_user_game_points_pipeline()`, except games where the user has
+    no Primary points at all are left out (they're only counted as owned, see `_v4_owners_pipeline()`)."""
+    return [
+        {"$match" : {"type" : "Primary"}},
+        {"$group" : {"_id" : {"ce_id" : "$ce_id_user", "game_ce_id" : "$ce_id_game"}, "points" : {"$sum" : "$user_points"}}},
+        {"$lookup" : {"from" : Mongo_V4.V4USERTITLE, "localField" : "_id.ce_id", "foreignField" : "ce_id_user", "as" : "user"}},
+        {"$match" : {"user.discord_id" : {"$ne" : None}}},
+        {"$lookup" : {"from" : Mongo_V4.V4OBJECTIVETITLE, "localField" : "_id.game_ce_id", "foreignField" : "ce_id_game", "as" : "objectives"}},
+        {"$project" : {"_id" : 0, "ce_id" : "$_id.ce_id", "game_ce_id" : "$_id.game_ce_id", "points" : 1,
+                       "game_points" : {"$sum" : "$objectives.value"}}}
+    ]
+
+def _v4_owners_pipeline(group_by : str, count_as : str) -> list[dict] :
+    "v4 : counts the owned games of registered users, grouped by `group_by` (`ce_id_game` or `ce_id_user`)."
+    return [
+        {"$lookup" : {"from" : Mongo_V4.V4USERTITLE, "localField" : "ce_id_user", "foreignField" : "ce_id_user", "as" : "user"}},
+        {"$match" : {"user.discord_id" : {"$ne" : None}}},
+        {"$group" : {"_id" : f"${group_by}", count_as : {"$sum" : 1}}}
+    ]
+
+async def _aggregate(collection, pipeline : list[dict]) -> dict[str, dict] :
+    "Runs `pipeline` and returns its results by `_id`."
+    return {row.pop('_id') : row async for row in collection.aggregate(pipeline)}
+
+async def get_game_completion_stats() -> dict[str, CECompletion] :
+    """Returns the completions, started and owner counts of every game
+    that a registered user owns, by ce_id."""
+    by_game = {"$group" : {
+        "_id" : "$game_ce_id",
+        "completed" : {"$sum" : {"$cond" : [_COMPLETED, 1, 0]}},
+        "started" : {"$sum" : {"$cond" : [_STARTED, 1, 0]}},
+        "total" : {"$sum" : 1}
+    }}
+    if DATABASE_VERSION >= 4 :
+        database = _mongo_client[Mongo_V4.V4DATABASE]
+        stats = await _aggregate(database[Mongo_V4.V4USEROBJECTIVETITLE], _v4_user_game_points_pipeline() + [by_game])
+        owners = await _aggregate(database[Mongo_V4.V4USERGAMETITLE], _v4_owners_pipeline("ce_id_game", "total"))
+        stats = {ce_id : {"completed" : 0, "started" : 0, **stats.get(ce_id, {}), **owner}
+                 for ce_id, owner in owners.items()}
+    else :
+        stats = await _aggregate(_mongo_client['database_name'][V3USERTITLE], _user_game_points_pipeline() + [by_game])
+    return {ce_id : CECompletion(data) for ce_id, data in stats.items()}
+
+async def get_user_point_stats() -> dict[str, CEUserStats] :
+    """Returns the points, completed games and owned games of every
+    registered user that owns at least one game, by ce_id."""
+    by_user = {"$group" : {
+        "_id" : "$ce_id",
+        "points" : {"$sum" : "$points"},
+        "completed_games" : {"$sum" : {"$cond" : [_COMPLETED, 1, 0]}},
+        "owned_games" : {"$sum" : 1}
+    }}
+    if DATABASE_VERSION >= 4 :
+        database = _mongo_client[Mongo_V4.V4DATABASE]
+        by_user["$group"].pop("owned_games")
+        stats = await _aggregate(database[Mongo_V4.V4USEROBJECTIVETITLE], _v4_user_game_points_pipeline() + [by_user])
+        owners = await _aggregate(database[Mongo_V4.V4USERGAMETITLE], _v4_owners_pipeline("ce_id_user", "owned_games"))
+        stats = {ce_id : {"points" : 0, "completed_games" : 0, **stats.get(ce_id, {}), **owner}
+                 for ce_id, owner in owners.items()}
+    else :
+        stats = await _aggregate(_mongo_client['database_name'][V3USERTITLE], _user_game_points_pipeline() + [by_user])
+    return {ce_id : CEUserStats(data) for ce_id, data in stats.items()}
+
+async def refresh_stats() -> tuple[int, int] :
+    """Recounts `get_game_completion_stats()` and `get_user_point_stats()` and saves them
+    into the stats collection, replacing what was there. Games nobody owns are saved as all zeros.
+    
+Returns how many games and users were saved."""
+    refreshed = time.time()
+    games = await get_game_completion_stats()
+    users = await get_user_point_stats()
+    for ce_id in await get_list("name") :
+        if ce_id not in games : games[ce_id] = CECompletion({"completed" : 0, "started" : 0, "total" : 0})
+
+    operations = [
+        ReplaceOne({"kind" : kind, "ce_id" : ce_id}, {"kind" : kind, "ce_id" : ce_id, **stats.raw_data, "refreshed" : refreshed}, upsert=True)
+        for kind, all_stats in (("game", games), ("user", users)) for ce_id, stats in all_stats.items()
+    ]
+    collection = _mongo_client['database_name'][V3STATSTITLE]
+    if len(operations) > 0 : await collection.bulk_write(operations, ordered=False)
+    # anything that wasn't just saved belongs to a game or user that's gone.
+    await collection.delete_many({"refreshed" : {"$lt" : refreshed}})
+    return len(games), len(users)
+
+async def _get_stats(kind : Literal["game", "user"], ce_id : str) -> dict | None :
+    return await _mongo_client['database_name'][V3STATSTITLE].find_one(
+        {"kind" : kind, "ce_id" : ce_id}, {"_id" : 0, "kind" : 0, "ce_id" : 0, "refreshed" : 0}
+    )
+
+async def get_game_stats(ce_id : str) -> CECompletion | None :
+    "Returns this game's saved completion stats, or None if there aren't any yet."
+    stats = await _get_stats("game", ce_id)
+    return None if stats is None else CECompletion(stats)
+
+async def get_user_stats(ce_id : str) -> CEUserStats | None :
+    "Returns this user's saved point stats, or None if there aren't any (not registered, no games, or not counted yet)."
+    stats = await _get_stats("user", ce_id)
+    return None if stats is None else CEUserStats(stats)
+
+
+# -- loop checkpoints -- #
+# the master loop saves how far it's gotten into V3LOOPTITLE after each phase (and each chunk of games and users),
+# with what the games it changed were before in V3LOOPGAMETITLE (one document each, so there's no limit on how many),
+# and puts the messages it makes into the outbox along with the changes they announce (see below).
+# so a loop that dies partway through picks up where it stopped, and nothing goes out twice.
+
+LOOP_RESUME_SECONDS = 6 * 60 * 60
+"A loop that died partway through is picked back up if it started less than this many seconds ago."
+
+async def start_loop_run() -> dict :
+    """Returns the checkpoint of the last loop if it died partway through less than
+    `LOOP_RESUME_SECONDS` ago, or starts a new one. Older unfinished loops are given up on.
+    \nA checkpoint has `run_id`, `started`, `phases_done`, and whatever the loop has saved
+    with `save_loop_checkpoint()`/`add_loop_progress()`. Its `old_games` are the games saved
+    with `save_loop_old_games()`, as :class:`CEGame`s."""
+    collection = _mongo_client['database_name'][V3LOOPTITLE]
+    now = time.time()
+    run = await collection.find_one(
+        {"finished" : None, "started" : {"$gt" : now - LOOP_RESUME_SECONDS}}, {"_id" : 0}, sort=[("started", -1)]
+    )
+    abandoned = {"finished" : None}
+    if run is not None : abandoned["run_id"] = {"$ne" : run['run_id']}
+    await collection.update_many(abandoned, {"$set" : {"finished" : now, "abandoned" : True}})
+
+    if run is None :
+        run = {"run_id" : str(ObjectId()), "started" : now, "finished" : None, "phases_done" : []}
+        await collection.insert_one(dict(run))
+    else :
+        await collection.update_one({"run_id" : run['run_id']}, {"$inc" : {"resumes" : 1}})
+
+    # only this loop's old games are ever needed again. (checkpoints from before they had
+    # their own collection kept them in the checkpoint itself.)
+    old_games = _mongo_client['database_name'][V3LOOPGAMETITLE]
+    await old_games.delete_many({"run_id" : {"$ne" : run['run_id']}})
+    run['old_games'] = [__mongo_to_game(game) for game in run.get('old_games', [])] + \
+        [__mongo_to_game(document['game']) async for document in old_games.find({"run_id" : run['run_id']}, {"_id" : 0})]
+    return run
+
+async def save_loop_checkpoint(run_id : str, fields : dict, phase_done : str | None = None, session = None) :
+    "Saves `fields` into this loop's checkpoint, and marks `phase_done` as done if it's passed."
+    update : dict = {"$set" : fields}
+    if phase_done is not None : update["$addToSet"] = {"phases_done" : phase_done}
+    await _mongo_client['database_name'][V3LOOPTITLE].update_one({"run_id" : run_id}, update, session=session)
+
+async def save_loop_old_games(run_id : str, games : list[CEGame], session = None) :
+    """Saves what `games` were before this loop changed them. A game that's already saved
+    for this loop keeps its first (oldest) version."""
+    if len(games) == 0 : return
+    await _mongo_client['database_name'][V3LOOPGAMETITLE].bulk_write([UpdateOne(
+        {"run_id" : run_id, "ce_id" : game.ce_id}, {"$setOnInsert" : {"game" : game.to_dict()}}, upsert=True
+    ) for game in games], ordered=False, session=session)
+
+async def add_loop_progress(run_id : str, field : str, values : list, session = None) :
+    "Adds `values` to the list under `field` in this loop's checkpoint."
+    if len(values) == 0 : return
+    await _mongo_client['database_name'][V3LOOPTITLE].update_one(
+        {"run_id" : run_id}, {"$addToSet" : {field : {"$each" : values}}}, session=session
+    )
+
+async def finish_loop_run(run_id : str) :
+    "Marks this loop as finished, and drops the parts of its checkpoint that were only needed to resume it."
+    await _mongo_client['database_name'][V3LOOPTITLE].update_one(
+        {"run_id" : run_id}, {"$set" : {"finished" : time.time()}, "$unset" : {"old_games" : "", "users_done" : ""}}
+    )
+    await _mongo_client['database_name'][V3LOOPGAMETITLE].delete_many({"run_id" : run_id})
+
+
+
+# -- outbox -- #
+# every update message goes into the outbox instead of straight to discord, in the same transaction as
+# the changes it's about. the bot reads it back out and sends it (see `Outbox`), so whatever makes
+# the updates (the master loop, or the scraper in its own process) never has to wait on discord.
+# a message is a dict of `location`, `content`, `embed` (a `discord.Embed.to_dict()`) and
+# `file` (`{"filename", "data"}`), any of which can be None except `location`.
+
+OUTBOX_TRY_LIMIT = 5
+"How many times the bot tries to send an outbox message before it gives up on it."
+
+_transactions_supported : bool | None = None
+
+async def supports_transactions() -> bool :
+    "Returns true if mongo can do multi-document transactions (it has to be a replica set or sharded)."
+    global _transactions_supported
+    if _transactions_supported is None :
+        try :
+            hello = await _mongo_client.admin.command("hello")
+            _transactions_supported = "setName" in hello or hello.get('msg') == "isdbgrid"
+        except Exception :
+            _transactions_supported = False
+    return _transactions_supported
+
+@contextlib.asynccontextmanager
+async def outbox_transaction() :
+    """Starts a transaction for outbox messages and the writes they're about, so either all of
+    it is saved or none of it is. Pass the session it gives you to `save_to_outbox()`,
+    `BulkDumper.flush()` and `save_loop_checkpoint()`/`add_loop_progress()`.
+    \nIf mongo can't do transactions, this gives you None and everything's written one after
+    another, so save the messages first: saving them again later (with the same keys) is harmless."""
+    if not await supports_transactions() :
+        yield None
+        return
+    try :
+        async with await _mongo_client.start_session() as session :
+            async with session.start_transaction() :
+                yield session
+    except BaseException :
+        # the caches might have picked up writes that were rolled back.
+        invalidate_cached_users()
+        invalidate_cached_games()
+        raise
+
+def _key_outbox_messages(source_id : str, messages : list[dict]) :
+    """Gives each message a key made from where it's from (the run that made it) and what it says,
+    with the nth copy of the same message getting its own key. So a message that's made again
+    (when a loop is resumed, say) gets the same key as the first time."""
+    copies : dict[str, int] = {}
+    for message in messages :
+        embed = dict(message['embed'] or {})
+        embed.pop('timestamp', None)
+        body = json.dumps([source_id, message['location'], message['content'], embed], sort_keys=True, default=str)
+        copies[body] = copies.get(body, 0) + 1
+        message['key'] = hashlib.sha256(f"{body}|{copies[body]}".encode()).hexdigest()
+        message['source_id'] = source_id
+
+async def save_to_outbox(source_id : str, messages : list[dict], session = None) -> set[str] :
+    """Puts `messages` in the outbox to be sent, in order. A message that's already in the outbox
+    (same source and contents, see `_key_outbox_messages()`) is left as it is.
+    \nReturns the keys of the messages that weren't there before."""
+    if len(messages) == 0 : return set()
+    _key_outbox_messages(source_id, messages)
+    created = datetime.datetime.now(datetime.timezone.utc)
+    operations = [
+        UpdateOne({"key" : message['key']}, {"$setOnInsert" : {
+            **message, "sent" : False, "tries" : 0, "created" : created, "order" : i
+        }}, upsert=True)
+        for i, message in enumerate(messages)
+    ]
+    result = await _mongo_client['database_name'][V3OUTBOXTITLE].bulk_write(operations, ordered=True, session=session)
+    return {messages[i]['key'] for i in result.upserted_ids}
+
+async def get_outbox(limit : int = 0) -> list[dict] :
+    "Returns the oldest `limit` messages (or all of them, if it's 0) in the outbox that still need to be sent."
+    cursor = _mongo_client['database_name'][V3OUTBOXTITLE].find(
+        {"sent" : False, "tries" : {"$lt" : OUTBOX_TRY_LIMIT}}, {"_id" : 0}
+    ).sort([("created", 1), ("order", 1)]).limit(limit)
+    return [message async for message in cursor]
+
+async def mark_outbox_sent(keys : list[str]) :
+    "Marks these outbox messages as sent."
+    if len(keys) == 0 : return
+    await _mongo_client['database_name'][V3OUTBOXTITLE].update_many(
+        {"key" : {"$in" : keys}}, {"$set" : {"sent" : True, "sent_at" : time.time()}}
+    )
+
+async def mark_outbox_failed(keys : list[str]) :
+    "Counts a failed try against these outbox messages. They're given up on after `OUTBOX_TRY_LIMIT`."
+    if len(keys) == 0 : return
+    await _mongo_client['database_name'][V3OUTBOXTITLE].update_many({"key" : {"$in" : keys}}, {"$inc" : {"tries" : 1}})
+
+async def watch_outbox() :
+    """Yields every time a message is put in the outbox, by following its change stream.
+    Raises if mongo can't do change streams (they need a replica set)."""
+    collection = _mongo_client['database_name'][V3OUTBOXTITLE]
+    async with collection.watch([{"$match" : {"operationType" : "insert"}}]) as stream :
+        async for _ in stream :
+            yield
+
+
+
+# -- scraper worker -- #
+# when the scraper runs in its own process (see `web_scraper.worker`), it keeps its status in
+# the misc collection, so the bot can tell whether it's alive and ask it to loop early.
+
+async def save_worker_status(fields : dict) :
+    "Sets these fields of the scraper worker's status."
+    collection = _mongo_client['database_name'][V3MISCTITLE]
+    await collection.update_one(
+        {"worker_status" : {"$exists" : True}},
+        {"$set" : {f"worker_status.{key}" : value for key, value in fields.items()}}, upsert=True
+    )
+
+async def get_worker_status() -> dict | None :
+    "Returns the scraper worker's status, or None if it's never run."
+    collection = _mongo_client['database_name'][V3MISCTITLE]
+    db = await collection.find_one({"worker_status" : {"$exists" : True}})
+    return None if db is None else db['worker_status']
+
+async def request_worker_loop() :
+    "Asks the scraper worker to loop as soon as it can, instead of at its next time."
+    await save_worker_status({"requested" : time.time()})
+
+
 # -- curator count -- #
 async def get_curator_count() -> int :
     "Gets the current curator count."
@@ -754,4 +2102,8 @@ async def dump_input(input : CEInput) :
 
     await dump_inputs_v2(inputs)
     return
-"""
\ No newline at end of file
+"""
+
+
+if __name__ == "__main__" :
+    benchmark_lazy_loads()
@@ -0,0 +1,327 @@
+"""
+Database v4 : the same games and users as v3, split into one collection per kind of thing
+(following the schema drafts in `Reformatter`), so that a write only touches what changed.
+
+In v3, each user is one document holding every owned game and objective, so changing one
+roll rewrites all of it. Here every game, objective, user, owned game, user objective and
+roll is its own small document, and every save compares what's being written with what's
+stored and only writes the documents that are different.
+
+Nothing outside `Mongo_Reader` should need this module. It reads and writes documents in the
+v3 shape (what `CEGame.to_dict()` and `CEUser.to_dict()` return), so `Mongo_Reader` can use
+the same converters whichever version is in use. Every function takes the motor database
+(`V4DATABASE`).
+\nValues are stored the same way as in v3 (categories, platforms and roll statuses are still
+strings), so the drafts' `$jsonSchema`s aren't applied. Inputs and the misc documents
+(curator count, tiers) haven't changed, and stay in v3.
+"""
+
+import asyncio
+from typing import Literal
+from pymongo import ASCENDING, DeleteOne, IndexModel, ReplaceOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+
+V4DATABASE = "ce_v4"
+"The mongo database the v4 collections are in."
+V4GAMETITLE = "games"
+V4OBJECTIVETITLE = "objectives"
+V4USERTITLE = "users"
+V4USERGAMETITLE = "user_games"
+V4USEROBJECTIVETITLE = "user_objectives"
+V4USERROLLTITLE = "user_rolls"
+
+# the v3 keys that are named differently in v4. everything else keeps its name.
+GAME_KEYS = {"ce_id" : "ce_id_game"}
+OBJECTIVE_KEYS = {"ce_id" : "ce_id_objective", "game_ce_id" : "ce_id_game"}
+USER_KEYS = {"ce_id" : "ce_id_user", "display-name" : "display_name"}
+USER_GAME_KEYS = {"ce_id" : "ce_id_game"}
+USER_OBJECTIVE_KEYS = {"ce_id" : "ce_id_objective", "game_ce_id" : "ce_id_game"}
+
+V4_INDEXES : dict[str, list[IndexModel]] = {
+    V4GAMETITLE : [
+        IndexModel([("ce_id_game", ASCENDING)], unique=True, name="ce_id_game_unique"),
+        IndexModel([("last_updated", ASCENDING)], name="last_updated")
+    ],
+    V4OBJECTIVETITLE : [
+        IndexModel([("ce_id_objective", ASCENDING)], unique=True, name="ce_id_objective_unique"),
+        IndexModel([("ce_id_game", ASCENDING)], name="ce_id_game")
+    ],
+    V4USERTITLE : [
+        IndexModel([("ce_id_user", ASCENDING)], unique=True, name="ce_id_user_unique"),
+        IndexModel([("discord_id", ASCENDING)], unique=True, name="discord_id_unique",
+                   partialFilterExpression={"discord_id" : {"$gt" : 0}})
+    ],
+    V4USERGAMETITLE : [
+        IndexModel([("ce_id_user", ASCENDING), ("ce_id_game", ASCENDING)], unique=True, name="user_game_unique")
+    ],
+    V4USEROBJECTIVETITLE : [
+        IndexModel([("ce_id_user", ASCENDING), ("ce_id_objective", ASCENDING)], unique=True, name="user_objective_unique")
+    ],
+    V4USERROLLTITLE : [
+        IndexModel([("ce_id_user", ASCENDING), ("position", ASCENDING)], unique=True, name="user_roll_unique")
+    ]
+}
+"The indexes every v4 collection should have."
+
+HOT_QUERIES : list[tuple[str, dict]] = [
+    (V4GAMETITLE, {"ce_id_game" : ""}),
+    (V4OBJECTIVETITLE, {"ce_id_game" : ""}),
+    (V4USERTITLE, {"ce_id_user" : ""}),
+    (V4USERTITLE, {"discord_id" : 1}),
+    (V4USERGAMETITLE, {"ce_id_user" : ""}),
+    (V4USEROBJECTIVETITLE, {"ce_id_user" : ""}),
+    (V4USERROLLTITLE, {"ce_id_user" : ""})
+]
+"The v4 queries that run all the time, as `(collection, filter)`."
+
+
+
+# -- helpers -- #
+
+def _to_row(document : dict, keys : dict[str, str], **extra) -> dict :
+    "Renames a v3 (sub)document's keys to their v4 names, and adds `extra`."
+    row = {keys.get(key, key) : value for key, value in document.items() if key != "_id"}
+    row.update(extra)
+    return row
+
+def _from_row(row : dict, keys : dict[str, str], drop : tuple[str, ...] = ()) -> dict :
+    "Renames a v4 document's keys back to their v3 names, leaving out `drop`."
+    v3_names = {v4 : v3 for v3, v4 in keys.items()}
+    return {v3_names.get(key, key) : value for key, value in row.items() if key not in drop and key != "_id"}
+
+def _query(query : dict | None, keys : dict[str, str]) -> dict :
+    "Turns a query on top-level v3 keys into the same query on v4 keys."
+    return {keys.get(key, key) : value for key, value in (query or {}).items()}
+
+async def _bulk_write(collection, operations : list, owners : list[str], session = None) -> list[tuple[str, str]] :
+    """Writes `operations` unordered. Returns `(owner, message)` for each one that failed.
+    \nInside a transaction (`session`), a failed write fails the whole transaction, so it's raised instead."""
+    if len(operations) == 0 : return []
+    try : await collection.bulk_write(operations, ordered=False, session=session)
+    except BulkWriteError as e :
+        if session is not None : raise
+        return [(owners[error['index']], error.get('errmsg', "unknown error"))
+                for error in e.details.get('writeErrors', [])]
+    return []
+
+async def replace_matching(collection, replacements : list[tuple[dict, dict]], owners : list[str],
+                           unmatched_message : str, session = None) -> list[tuple[str, str]] :
+    """Replaces the document matching each `(filter, document)` in `replacements` (never inserting one).
+    Returns `(owner, unmatched_message)` for each filter that matched nothing, and `(owner, message)`
+    for each write that failed.
+    \nThey're written one at a time (side by side outside a transaction), since a bulk write
+    can't say which of its writes matched. Inside a transaction (`session`), a failed write
+    fails the whole transaction, so it's raised instead."""
+    async def replace(filter : dict, document : dict, owner : str) -> tuple[str, str] | None :
+        try : result = await collection.replace_one(filter, document, session=session)
+        except PyMongoError as e :
+            if session is not None : raise
+            return (owner, str(e))
+        return None if result.matched_count > 0 else (owner, unmatched_message)
+
+    if session is None :
+        results = await asyncio.gather(*[replace(filter, document, owner)
+                                         for (filter, document), owner in zip(replacements, owners)])
+    else :
+        results = [await replace(filter, document, owner) for (filter, document), owner in zip(replacements, owners)]
+    return [result for result in results if result is not None]
+
+async def _sync_rows(collection, key : list[str], parent_key : str, parent_ids : list[str],
+                     rows : list[dict], session = None) -> list[tuple[str, str]] :
+    """Makes the documents in `collection` that belong to `parent_ids` match `rows`, writing
+    only the ones that are new or different and deleting the ones that aren't in `rows`.
+    \nDocuments are matched up by the fields in `key`. Returns `(parent id, message)` for anything that failed."""
+    if len(parent_ids) == 0 : return []
+    stored : dict[tuple, dict] = {}
+    async for row in collection.find({parent_key : {"$in" : parent_ids}}, {"_id" : 0}, session=session) :
+        stored[tuple(row.get(k) for k in key)] = row
+
+    operations, owners = [], []
+    for row in rows :
+        row_key = tuple(row[k] for k in key)
+        if stored.pop(row_key, None) == row : continue
+        operations.append(ReplaceOne({k : row[k] for k in key}, row, upsert=True))
+        owners.append(row[parent_key])
+    for row_key, row in stored.items() :
+        operations.append(DeleteOne(dict(zip(key, row_key))))
+        owners.append(row[parent_key])
+
+    return await _bulk_write(collection, operations, owners, session)
+
+async def ensure_indexes(database) -> list[str] :
+    "Creates any of the indexes in `V4_INDEXES` that don't exist yet. Returns a message for each one that couldn't be made."
+    problems : list[str] = []
+    for title, indexes in V4_INDEXES.items() :
+        for index in indexes :
+            try : await database[title].create_indexes([index])
+            except OperationFailure as e :
+                problems.append(f"couldn't create index {index.document['name']} on {title}: {e.details.get('errmsg', e)}")
+    return problems
+
+async def get_ce_ids(database, kind : Literal["name", "user"]) -> list[str] :
+    "Returns every game's (or user's) ce_id."
+    title, key = (V4GAMETITLE, "ce_id_game") if kind == "name" else (V4USERTITLE, "ce_id_user")
+    return [row[key] async for row in database[title].find({}, {key : 1, "_id" : 0})]
+
+
+
+# -- games -- #
+
+def _game_rows(game : dict) -> tuple[dict, list[dict]] :
+    "Splits a v3 game document into its game document and its objective documents."
+    row = _to_row({key : value for key, value in game.items() if key != "objectives"}, GAME_KEYS)
+    objectives = [_to_row(objective, OBJECTIVE_KEYS, ce_id_game=game['ce_id'], position=i)
+                  for i, objective in enumerate(game.get('objectives', []))]
+    return row, objectives
+
+async def find_games(database, query : dict | None = None, objectives : bool = True) -> list[dict] :
+    """Returns the v3 document of every game matching `query` (on the top-level v3 keys).
+    \nIf not `objectives`, only the game documents are read and `objectives` is left out."""
+    games : dict[str, dict] = {}
+    async for row in database[V4GAMETITLE].find(_query(query, GAME_KEYS), {"_id" : 0}) :
+        games[row['ce_id_game']] = _from_row(row, GAME_KEYS)
+    if not objectives : return list(games.values())
+
+    for game in games.values() : game['objectives'] = []
+    objective_query = {} if query is None else {"ce_id_game" : {"$in" : list(games)}}
+    async for row in database[V4OBJECTIVETITLE].find(objective_query, {"_id" : 0}) :
+        if row['ce_id_game'] in games : games[row['ce_id_game']]['objectives'].append(row)
+    for game in games.values() :
+        game['objectives'] = [_from_row(row, OBJECTIVE_KEYS, drop=("position",))
+                              for row in sorted(game['objectives'], key=lambda row : row['position'])]
+    return list(games.values())
+
+async def save_games(database, games : list[dict], session = None) -> list[tuple[str, str]] :
+    """Saves v3 game documents, only writing the game and objective documents that changed.
+    Returns `(ce_id, message)` for any game that didn't fully save. Pass `session` to write inside its transaction."""
+    game_rows, objective_rows = [], []
+    for game in games :
+        row, objectives = _game_rows(game)
+        game_rows.append(row)
+        objective_rows += objectives
+    ce_ids = [row['ce_id_game'] for row in game_rows]
+
+    failed = await _sync_rows(database[V4GAMETITLE], ["ce_id_game"], "ce_id_game", ce_ids, game_rows, session)
+    failed += await _sync_rows(database[V4OBJECTIVETITLE], ["ce_id_objective"], "ce_id_game", ce_ids, objective_rows, session)
+    return failed
+
+async def delete_game(database, ce_id : str) -> bool :
+    "Deletes a game and its objectives. Returns false if there wasn't one."
+    result = await database[V4GAMETITLE].delete_one({"ce_id_game" : ce_id})
+    await database[V4OBJECTIVETITLE].delete_many({"ce_id_game" : ce_id})
+    return result.deleted_count > 0
+
+
+
+# -- users -- #
+
+def _roll_rows(ce_id : str, rolls : list[dict]) -> list[dict] :
+    return [_to_row(roll, {}, ce_id_user=ce_id, position=i) for i, roll in enumerate(rolls)]
+
+def _user_rows(user : dict) -> tuple[dict, list[dict], list[dict], list[dict]] :
+    "Splits a v3 user document into its user, owned game, user objective and roll documents."
+    ce_id = user['ce_id']
+    row = _to_row({key : value for key, value in user.items() if key not in ("rolls", "owned_games")}, USER_KEYS)
+    games, objectives = [], []
+    for i, game in enumerate(user.get('owned_games', [])) :
+        games.append(_to_row({key : value for key, value in game.items() if key != "objectives"},
+                             USER_GAME_KEYS, ce_id_user=ce_id, position=i))
+        objectives += [_to_row(objective, USER_OBJECTIVE_KEYS, ce_id_user=ce_id, position=j)
+                       for j, objective in enumerate(game.get('objectives', []))]
+    return row, games, objectives, _roll_rows(ce_id, user.get('rolls', []))
+
+async def find_users(database, query : dict | None = None,
+                     parts : tuple[str, ...] = ("rolls", "owned_games")) -> list[dict] :
+    """Returns the v3 document of every user matching `query` (on the top-level v3 keys).
+    \nOnly the `parts` asked for (`rolls` and/or `owned_games`) are read and put in the documents."""
+    users : dict[str, dict] = {}
+    async for row in database[V4USERTITLE].find(_query(query, USER_KEYS), {"_id" : 0}) :
+        users[row['ce_id_user']] = _from_row(row, USER_KEYS)
+    if len(users) == 0 : return []
+    child_query = {} if query is None else {"ce_id_user" : {"$in" : list(users)}}
+
+    if "rolls" in parts :
+        for user in users.values() : user['rolls'] = []
+        async for row in database[V4USERROLLTITLE].find(child_query, {"_id" : 0}).sort([("ce_id_user", 1), ("position", 1)]) :
+            if row['ce_id_user'] in users :
+                users[row['ce_id_user']]['rolls'].append(_from_row(row, {}, drop=("ce_id_user", "position")))
+
+    if "owned_games" in parts :
+        owned_games : dict[tuple[str, str], dict] = {}
+        async for row in database[V4USERGAMETITLE].find(child_query, {"_id" : 0}) :
+            if row['ce_id_user'] in users :
+                owned_games[(row['ce_id_user'], row['ce_id_game'])] = {**row, 'objectives' : []}
+        async for row in database[V4USEROBJECTIVETITLE].find(child_query, {"_id" : 0}) :
+            game = owned_games.get((row['ce_id_user'], row['ce_id_game']))
+            if game is not None : game['objectives'].append(row)
+
+        for user in users.values() : user['owned_games'] = []
+        for game in sorted(owned_games.values(), key=lambda game : game['position']) :
+            objectives = sorted(game.pop('objectives'), key=lambda row : row['position'])
+            document = _from_row(game, USER_GAME_KEYS, drop=("ce_id_user", "position"))
+            document['objectives'] = [_from_row(row, USER_OBJECTIVE_KEYS, drop=("ce_id_user", "position"))
+                                      for row in objectives]
+            users[game['ce_id_user']]['owned_games'].append(document)
+    return list(users.values())
+
+async def get_user_versions(database, ce_ids : list[str], session = None) -> dict[str, tuple[int, int | None]] :
+    "Returns the stored `(version, discord_id)` of each of `ce_ids` that's a user (version 0 for users saved before versions)."
+    return {row['ce_id_user'] : (row.get('version') or 0, row.get('discord_id')) async for row
+            in database[V4USERTITLE].find({"ce_id_user" : {"$in" : ce_ids}},
+                                          {"ce_id_user" : 1, "version" : 1, "discord_id" : 1, "_id" : 0}, session=session)}
+
+async def save_users(database, users : list[dict], session = None,
+                     versions : dict[str, int] | None = None) -> list[tuple[str, str]] :
+    """Saves v3 user documents, only writing the user, owned game, user objective and roll
+    documents that changed. Returns `(ce_id, message)` for any user that didn't fully save.
+    Pass `session` to write inside its transaction.
+    \nA user whose ce_id is in `versions` is only saved if they're still on that version.
+    If they aren't, nothing of theirs is written, and they're returned as failed."""
+    failed : list[tuple[str, str]] = []
+    if versions :
+        # the user documents go first, so that a user who's changed since keeps all their other documents too.
+        # (without an upsert, so a user who's changed since, or gone, just isn't matched.)
+        guarded = [user for user in users if user['ce_id'] in versions]
+        replacements = [(
+            {"ce_id_user" : user['ce_id'], "version" : versions[user['ce_id']] if versions[user['ce_id']] != 0 else {"$in" : [0, None]}},
+            _user_rows(user)[0]
+        ) for user in guarded]
+        failed = await replace_matching(database[V4USERTITLE], replacements, [user['ce_id'] for user in guarded],
+                                        "was changed by someone else while it was being written", session)
+        conflicted = {ce_id for ce_id, _ in failed}
+        users = [user for user in users if user['ce_id'] not in conflicted]
+
+    user_rows, game_rows, objective_rows, roll_rows = [], [], [], []
+    for user in users :
+        row, games, objectives, rolls = _user_rows(user)
+        user_rows.append(row)
+        game_rows += games
+        objective_rows += objectives
+        roll_rows += rolls
+    ce_ids = [row['ce_id_user'] for row in user_rows]
+
+    failed += await _sync_rows(database[V4USERTITLE], ["ce_id_user"], "ce_id_user", ce_ids, user_rows, session)
+    failed += await _sync_rows(database[V4USERGAMETITLE], ["ce_id_user", "ce_id_game"], "ce_id_user", ce_ids, game_rows, session)
+    failed += await _sync_rows(database[V4USEROBJECTIVETITLE], ["ce_id_user", "ce_id_objective"], "ce_id_user", ce_ids, objective_rows, session)
+    failed += await _sync_rows(database[V4USERROLLTITLE], ["ce_id_user", "position"], "ce_id_user", ce_ids, roll_rows, session)
+    return failed
+
+async def update_user(database, ce_id : str, version : int, old_state : dict, new_state : dict, session = None) -> bool :
+    """Writes the fields and rolls in `new_state` (keyed like a v3 document) that are different
+    from `old_state`, if the user is still on `version`. Returns false (and writes nothing) if they aren't.
+    Pass `session` to write inside its transaction."""
+    sets = {USER_KEYS.get(key, key) : value for key, value in new_state.items()
+            if key != "rolls" and old_state.get(key) != value}
+    update = {"$inc" : {"version" : 1}}
+    if len(sets) > 0 : update["$set"] = sets
+
+    matched_version = version if version != 0 else {"$in" : [0, None]}
+    result = await database[V4USERTITLE].update_one({"ce_id_user" : ce_id, "version" : matched_version}, update, session=session)
+    if result.matched_count == 0 : return False
+
+    if "rolls" in new_state and new_state["rolls"] != old_state.get("rolls") :
+        failed = await _sync_rows(database[V4USERROLLTITLE], ["ce_id_user", "position"], "ce_id_user",
+                                  [ce_id], _roll_rows(ce_id, new_state["rolls"]), session)
+        if len(failed) > 0 : raise Exception(f"Couldn't write rolls for {ce_id}: {failed[0][1]}")
+    return True
@@ -0,0 +1,154 @@
+"""
+Sends the messages waiting in the outbox (see `Mongo_Reader.save_to_outbox()`) to Discord.
+
+Nothing that makes update messages sends them itself. The master loop and the scraper
+(which can run in its own process) put them in the outbox, in the same transaction as the
+games and users they're about. The bot follows the outbox and hands it to `Discord_Dispatcher`
+a batch at a time. It follows the change stream if mongo has one, and checks every
+`POLL_SECONDS` either way. Each message is marked as sent once Discord has it.
+The next batch isn't read until the last one has been sent (or given up on), so a message
+that failed goes again before anything newer does.
+So a slow Discord never holds up scraping, and a message isn't lost or sent twice
+if either side dies partway through.
+
+Call `start()` once the client is ready, `wake()` after putting something in the outbox from
+this process, and `stop()` before shutting down.
+"""
+
+import asyncio
+import io
+
+import discord
+
+from Modules import Discord_Dispatcher, Mongo_Reader
+import Modules.hm as hm
+
+
+POLL_SECONDS = 10.0
+"How often the outbox is checked when nothing's woken it up."
+
+BATCH_SIZE = 200
+"The most messages read out of the outbox at once."
+
+LOCATION_CHANNEL_IDS : dict[str, int] = {
+    "userlog" : hm.USER_LOG_ID, "casinolog" : hm.CASINO_LOG_ID, "gameadditions" : hm.GAME_ADDITIONS_ID,
+    "casino" : hm.CASINO_ID, "privatelog" : hm.PRIVATE_LOG_ID
+}
+"The channel each message location goes to."
+
+COALESCED_LOCATIONS = ("userlog", "casinolog")
+"The locations whose messages can be sent several to a message."
+
+_queued_keys : set[str] = set()
+"The keys of messages handed to the dispatcher that haven't been marked sent (or failed) in mongo yet."
+_unfinished_keys : set[str] = set()
+"The keys of messages handed to the dispatcher that it hasn't sent (or given up on) yet."
+_batch_done = asyncio.Event()
+_batch_done.set()
+_sent_keys : list[str] = []
+_failed_keys : list[str] = []
+_wake = asyncio.Event()
+_consumer : asyncio.Task | None = None
+
+
+
+def start(client : discord.Client) :
+    "Starts following the outbox, if it isn't already."
+    global _consumer
+    if _consumer is None or _consumer.done() :
+        _consumer = asyncio.create_task(_consume(client))
+
+def wake() :
+    "Checks the outbox straight away, instead of waiting for the change stream or the next poll."
+    _wake.set()
+
+async def stop(timeout : float | None = None) :
+    "Stops following the outbox, waits (up to `timeout` seconds) for what's queued to be sent, and saves which messages were."
+    global _consumer
+    if _consumer is not None :
+        _consumer.cancel()
+        try : await _consumer
+        except (asyncio.CancelledError, Exception) : pass
+        _consumer = None
+    await Discord_Dispatcher.drain(timeout)
+    await _save_results()
+
+async def deliver(client : discord.Client) -> int :
+    """Queues the next batch of unsent messages with the dispatcher, once the last batch has
+    been sent (or given up on). Returns how many were read (so a full `BATCH_SIZE` means there might be more)."""
+    await _batch_done.wait()
+    await _save_results()
+    messages = await Mongo_Reader.get_outbox(BATCH_SIZE)
+    for message in messages :
+        key = message['key']
+        if key in _queued_keys : continue
+
+        channel = client.get_channel(LOCATION_CHANNEL_IDS.get(message['location'], 0))
+        if channel is None :
+            print(f"outbox message {key} is for '{message['location']}', which isn't a channel.")
+            _failed_keys.append(key)
+            continue
+
+        embed = None if message['embed'] is None else discord.Embed.from_dict(message['embed'])
+        file = None
+        if message['file'] is not None :
+            file = discord.File(io.BytesIO(message['file']['data']), filename=message['file']['filename'])
+
+        _queued_keys.add(key)
+        _unfinished_keys.add(key)
+        _batch_done.clear()
+        Discord_Dispatcher.send(
+            channel, message['content'], embed=embed, file=file,
+            coalesce=message['location'] in COALESCED_LOCATIONS, on_done=_on_done(key)
+        )
+    return len(messages)
+
+
+
+def _on_done(key : str) :
+    "Makes the dispatcher callback for one message. What happened is saved to mongo with the next batch."
+    async def on_done(sent : bool) :
+        (_sent_keys if sent else _failed_keys).append(key)
+        _unfinished_keys.discard(key)
+        if len(_unfinished_keys) == 0 : _batch_done.set()
+    return on_done
+
+async def _save_results() :
+    "Marks every message that's been sent (or failed) since last time, in one write each."
+    sent, failed = _sent_keys[:], _failed_keys[:]
+    _sent_keys.clear()
+    _failed_keys.clear()
+    try :
+        await Mongo_Reader.mark_outbox_sent(sent)
+        await Mongo_Reader.mark_outbox_failed(failed)
+    except Exception :
+        _sent_keys.extend(sent)
+        _failed_keys.extend(failed)
+        raise
+    _queued_keys.difference_update(sent)
+    _queued_keys.difference_update(failed)
+
+async def _watch() :
+    "Wakes the consumer whenever something's put in the outbox. Ends if mongo can't do change streams."
+    try :
+        async for _ in Mongo_Reader.watch_outbox() : _wake.set()
+    except Exception as e :
+        print(f"outbox change stream stopped, polling every {POLL_SECONDS}s instead. ({e})")
+
+async def _consume(client : discord.Client) :
+    "Sends whatever's in the outbox, then waits to be woken up (or for the next poll), forever."
+    watcher = asyncio.create_task(_watch())
+    try :
+        while True :
+            _wake.clear()
+            try :
+                # (each batch waits for the one before it to be sent.)
+                while await deliver(client) >= BATCH_SIZE : pass
+            except Exception as e :
+                print(f"couldn't read the outbox: {e}")
+            try :
+                async with asyncio.timeout(POLL_SECONDS) :
+                    await _wake.wait()
+            except TimeoutError : pass
+    finally :
+        watcher.cancel()
@@ -261,6 +261,49 @@ def create_tags():
     }
     pass
 
+"""""""""""""""""""""""""""""""""""""""""""""""
+
+---- Moving from database v3 to v4. ----
+
+"""""""""""""""""""""""""""""""""""""""""""""""
+
+async def reformat_database_v3_to_v4(batch_size : int = 200) -> list[tuple[str, str]] :
+    """Copies database name and database user from v3 into the v4 collections (see `Mongo_V4`).
+    \nThe v3 collections are streamed through in batches of `batch_size`, so they never have to
+    fit in memory. Saving only writes what's different from what's already in v4, so this can be
+    run again (right before setting `database_version` to 4) to catch up on anything that
+    changed since the last run. Games that aren't in v3 anymore are removed from v4.
+    \nReturns `(ce_id, message)` for anything that didn't copy over."""
+    from Modules import Mongo_Reader, Mongo_V4
+
+    source = Mongo_Reader._mongo_client['database_name']
+    target = Mongo_Reader._mongo_client[Mongo_V4.V4DATABASE]
+    for problem in await Mongo_V4.ensure_indexes(target) : print(problem)
+
+    failed : list[tuple[str, str]] = []
+    for title, save in ((Mongo_Reader.V3NAMETITLE, Mongo_V4.save_games), 
+                        (Mongo_Reader.V3USERTITLE, Mongo_V4.save_users)) :
+        seen : set[str] = set()
+        batch : list[dict] = []
+        async for document in source[title].find({}, {"_id" : 0}).batch_size(batch_size) :
+            batch.append(document)
+            seen.add(document['ce_id'])
+            if len(batch) >= batch_size :
+                failed += await save(target, batch)
+                batch = []
+                print(f"copied {len(seen)} documents from {title}")
+        if len(batch) > 0 : failed += await save(target, batch)
+        print(f"copied {len(seen)} documents from {title}")
+
+        if title == Mongo_Reader.V3NAMETITLE :
+            for ce_id in [ce_id for ce_id in await Mongo_V4.get_ce_ids(target, "name") if ce_id not in seen] :
+                await Mongo_V4.delete_game(target, ce_id)
+                print(f"removed {ce_id} from v4")
+
+    for ce_id, message in failed : print(f"couldn't copy {ce_id}: {message}")
+    return failed
+
+
 with open('secret_info.json') as f :
     """The :class:`ObjectID` values stored under the `_id` value in each document."""
     local_json_data = json.load(f)
@@ -0,0 +1,331 @@
+"""
+A local stand-in for https://cedb.me, https://store.steampowered.com and https://steamhunters.com
+that replays responses recorded from the real sites, so the scraping side of CE Assistant
+can be run (and benchmarked) without the internet.
+
+Record a set of fixtures from the live sites first:
+    `python -m Modules.Replay_Server record --max-games 1000 --max-users 200`
+then serve them:
+    `python -m Modules.Replay_Server serve --latency 0.15 --jitter 0.05 --error-rate 0.02`
+and point the bot (or a benchmark) at the server with the one switch in `HTTP_Client`:
+    `CE_ASSISTANT_REPLAY_URL=http://127.0.0.1:8089` (or `HTTP_Client.use_replay_server(...)`).
+`start_replay_server()` does both at once from inside a script.
+
+Paginated endpoints (`api/games/full`, `api/users/all`) are sliced from the recorded catalogue
+using whatever `limit` and `offset` are asked for, `api/users/query`, Steam's `appdetails`
+and SteamHunters' `apps` are answered per id, and anything else is replayed word for word
+if that exact request was recorded.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+from aiohttp import web
+
+from Modules import HTTP_Client
+
+
+DEFAULT_FIXTURE_DIRECTORY = "replay_fixtures"
+"Where fixtures are recorded to and served from, unless told otherwise."
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8089
+
+CURATOR_URL = "https://store.steampowered.com/curator/36185934"
+CURATOR_PARAMS = {'cc' : 'us', 'l' : 'english'}
+
+
+#  ______   _____  __   __  _______   _    _   _____    ______    _____
+# |  ____| |_   _| \ \ / / |__   __| | |  | | |  __ \  |  ____|  / ____|
+# | |__      | |    \ V /     | |    | |  | | | |__) | | |__    | (___
+# |  __|     | |     > <      | |    | |  | | |  _  /  |  __|    \___ \
+# | |       _| |_   / . \     | |    | |__| | | | \ \  | |____   ____) |
+# |_|      |_____| /_/ \_\    |_|     \____/  |_|  \_\ |______| |_____/
+
+def _exchange_key(method : str, host : str, path : str, query : dict | list = {}) -> str :
+    "Returns the key that an exact request is stored under (the query is sorted, so order doesn't matter)."
+    items = sorted((str(k), str(v)) for k, v in (query.items() if isinstance(query, dict) else query))
+    key = f"{method.upper()} {host}/{path.strip('/')}"
+    if len(items) > 0 : key += f"?{urlencode(items)}"
+    return key
+
+
+class ReplayFixtures() :
+    """Everything the replay server knows how to answer with.
+    \n`games` and `users` are the raw cedb.me payloads, `appdetails` is Steam's appdetails
+    entries by app id, `steamhunters` is SteamHunters' app payloads by app id, and
+    `exchanges` holds any other responses word for word, keyed by `_exchange_key()`."""
+    FILE_NAMES = {
+        'games' : "ce_games.json",
+        'users' : "ce_users.json",
+        'appdetails' : "steam_appdetails.json",
+        'steamhunters' : "steamhunters_apps.json",
+        'exchanges' : "exchanges.json"
+    }
+
+    def __init__(self) :
+        self.games : list[dict] = []
+        self.users : list[dict] = []
+        self.appdetails : dict[str, dict] = {}
+        self.steamhunters : dict[str, dict] = {}
+        self.exchanges : dict[str, dict] = {}
+
+    def add_exchange(self, method : str, live_url : str, query : dict, status : int,
+                     content_type : str, body : str) :
+        "Stores one exact response."
+        parts = urlsplit(live_url)
+        self.exchanges[_exchange_key(method, parts.hostname, parts.path, query)] = {
+            'status' : status,
+            'content_type' : content_type,
+            'body' : body
+        }
+
+    def save(self, directory : str) :
+        "Writes every fixture to `directory`."
+        os.makedirs(directory, exist_ok=True)
+        for attribute, file_name in self.FILE_NAMES.items() :
+            with open(os.path.join(directory, file_name), 'w') as f :
+                json.dump(getattr(self, attribute), f)
+
+    @classmethod
+    def load(cls, directory : str) -> 'ReplayFixtures' :
+        "Reads every fixture in `directory`. Missing files are just left empty."
+        fixtures = cls()
+        for attribute, file_name in cls.FILE_NAMES.items() :
+            path = os.path.join(directory, file_name)
+            if not os.path.exists(path) : continue
+            with open(path) as f :
+                setattr(fixtures, attribute, json.load(f))
+        return fixtures
+
+
+
+#   _____   ______   _____   __      __  ______   _____
+#  / ____| |  ____| |  __ \  \ \    / / |  ____| |  __ \
+# | (___   | |__    | |__) |  \ \  / /  | |__    | |__) |
+#  \___ \  |  __|   |  _  /    \ \/ /   |  __|   |  _  /
+#  ____) | | |____  | | \ \     \  /    | |____  | | \ \
+# |_____/  |______| |_|  \_\     \/     |______| |_|  \_\
+
+def _page(items : list, request : web.Request) -> list :
+    "Returns the slice of `items` asked for by the request's `limit` and `offset`."
+    limit = int(request.query.get('limit', 50))
+    offset = int(request.query.get('offset', 0))
+    return items[offset:offset+limit]
+
+
+def _appids(request : web.Request) -> list[str] :
+    "Returns the app ids in a request's `appids` parameter (`220,480, 730` -> `['220', '480', '730']`)."
+    return [appid.strip() for appid in request.query.get('appids', '').split(',') if appid.strip() != '']
+
+
+def build_app(fixtures : ReplayFixtures, latency : float = 0.0, jitter : float = 0.0,
+              error_rate : float = 0.0, error_status : int = 503) -> web.Application :
+    """Returns the replay server's :class:`aiohttp.web.Application`.
+    \nEvery good GET gets an `ETag`, and a matching `If-None-Match` gets a `304`.
+    Every response waits `latency` seconds plus up to `jitter` more, and fails with
+    `error_status` (with a `Retry-After` for 429s and 503s) `error_rate` of the time."""
+    games_by_id = {game['id'] : game for game in fixtures.games}
+    users_by_id = {user['id'] : user for user in fixtures.users}
+
+    @web.middleware
+    async def conditions(request : web.Request, handler) :
+        "Adds the latency and the injected errors."
+        delay = latency + random.uniform(0, jitter)
+        if delay > 0 : await asyncio.sleep(delay)
+        if error_rate > 0 and random.random() < error_rate :
+            headers = {'Retry-After' : "1"} if error_status in (429, 503) else {}
+            return web.Response(text=f"{error_status} (injected by the replay server)",
+                                status=error_status, headers=headers)
+        response = await handler(request)
+
+        # tag every good response, so conditional GETs can be answered with a 304.
+        if request.method == "GET" and response.status == 200 and response.body is not None :
+            etag = f'"{hashlib.sha1(response.body).hexdigest()}"'
+            if request.headers.get('If-None-Match') == etag :
+                return web.Response(status=304, headers={'ETag' : etag})
+            response.headers['ETag'] = etag
+        return response
+
+    async def replay(request : web.Request) -> web.StreamResponse :
+        "Answers any request for `/{host}/{path}`."
+        host = request.match_info['host']
+        path = request.match_info['path'].strip('/')
+
+        # -- cedb.me --
+        if host == "cedb.me" :
+            if request.method == "GET" and path == "api/games/full" :
+                return web.json_response(_page(fixtures.games, request))
+            if request.method == "GET" and path == "api/users/all" :
+                return web.json_response(_page(fixtures.users, request))
+            if request.method == "POST" and path == "api/users/query" :
+                body = await request.json()
+                return web.json_response([users_by_id[id] for id in body['id'] if id in users_by_id])
+            if request.method == "GET" and path.startswith("api/game/") and path.count('/') == 2 :
+                return web.json_response(games_by_id.get(path.split('/')[2], {}))
+            if request.method == "GET" and path.startswith("api/user/") and path.count('/') == 2 :
+                return web.json_response(users_by_id.get(path.split('/')[2], {}))
+
+        # -- steam --
+        elif host == "store.steampowered.com" and path == "api/appdetails" :
+            response = {}
+            for appid in _appids(request) :
+                entry = fixtures.appdetails.get(appid, {'success' : False})
+
+                # steam only sends the filtered fields back (and an empty list if there aren't any)
+                if 'filters' in request.query and entry['success'] :
+                    fields = request.query['filters'].split(',')
+                    data = {field : entry['data'][field] for field in fields if field in entry['data']}
+                    entry = {'success' : True, 'data' : data if len(data) > 0 else []}
+                response[appid] = entry
+            return web.json_response(response)
+
+        # -- steamhunters --
+        elif host == "steamhunters.com" and path == "api/apps" :
+            return web.json_response(
+                [fixtures.steamhunters[appid] for appid in _appids(request) if appid in fixtures.steamhunters]
+            )
+        elif host == "steamhunters.com" and path.startswith("api/apps/") :
+            return web.json_response(fixtures.steamhunters.get(path.split('/')[2]))
+
+        # -- everything else --
+        exchange = fixtures.exchanges.get(_exchange_key(request.method, host, path, request.query.items()))
+        if exchange is None :
+            return web.json_response({'error' : f"nothing recorded for {request.method} {host}/{path}"}, status=404)
+        return web.Response(status=exchange['status'], text=exchange['body'],
+                            content_type=exchange['content_type'])
+
+    app = web.Application(middlewares=[conditions])
+    app.router.add_route('*', '/{host}/{path:.*}', replay)
+    return app
+
+
+async def start_replay_server(fixture_directory : str = DEFAULT_FIXTURE_DIRECTORY,
+                              host : str = DEFAULT_HOST, port : int = DEFAULT_PORT,
+                              **conditions) -> web.AppRunner :
+    """Starts the replay server in this event loop and points `HTTP_Client` at it.
+    \n`conditions` are passed on to `build_app()`. Call `stop_replay_server()` with the
+    returned runner when you're done."""
+    runner = web.AppRunner(build_app(ReplayFixtures.load(fixture_directory), **conditions))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    HTTP_Client.use_replay_server(f"http://{host}:{port}")
+    return runner
+
+
+async def stop_replay_server(runner : web.AppRunner) :
+    "Stops the replay server and points `HTTP_Client` back at the live sites."
+    HTTP_Client.use_replay_server(None)
+    await runner.cleanup()
+
+
+
+#  _____    ______    _____    ____    _____    _____    ______   _____
+# |  __ \  |  ____|  / ____|  / __ \  |  __ \  |  __ \  |  ____| |  __ \
+# | |__) | | |__    | |      | |  | | | |__) | | |  | | | |__    | |__) |
+# |  _  /  |  __|   | |      | |  | | |  _  /  | |  | | |  __|   |  _  /
+# | | \ \  | |____  | |____  | |__| | | | \ \  | |__| | | |____  | | \ \
+# |_|  \_\ |______|  \_____|  \____/  |_|  \_\ |_____/  |______| |_|  \_\
+
+async def _record_pages(session : aiohttp.ClientSession, live_url : str, max_items : int) -> list[dict] :
+    "Walks a paginated cedb.me endpoint until it runs out (or `max_items` are pulled)."
+    PULL_LIMIT = 50
+    items : list[dict] = []
+    while len(items) < max_items :
+        params = {'limit' : PULL_LIMIT, 'offset' : len(items)}
+        async with session.get(live_url, params=params) as response :
+            page = await response.json()
+        if len(page) == 0 : break
+        items += page
+        print(f"recorded {len(items)} from {live_url}")
+    return items[:max_items]
+
+
+async def record_fixtures(fixture_directory : str = DEFAULT_FIXTURE_DIRECTORY,
+                          max_games : int = 1_000_000, max_users : int = 1_000_000,
+                          detailed_apps : int = 20) -> ReplayFixtures :
+    """Records fixtures from the live sites and saves them to `fixture_directory`.
+    \nSteam's appdetails are recorded in batches with only `price_overview`, except for the
+    first `detailed_apps` steam games, which get their full details (for `get_price_async()`)."""
+    STEAM_BATCH = 100
+    session = HTTP_Client.get_session()
+    fixtures = ReplayFixtures()
+
+    # -- cedb.me --
+    fixtures.games = await _record_pages(session, "https://cedb.me/api/games/full", max_games)
+    fixtures.users = await _record_pages(session, "https://cedb.me/api/users/all", max_users)
+
+    # -- steam and steamhunters --
+    steam_ids = [game['platformId'] for game in fixtures.games if game['platform'] == "steam"]
+    for i in range(0, len(steam_ids), STEAM_BATCH) :
+        batch = ','.join(str(id) for id in steam_ids[i:i+STEAM_BATCH])
+        print(f"recording steam and steamhunters data for apps {i} through {i+STEAM_BATCH-1}")
+
+        params = {'appids' : batch, 'cc' : 'US', 'filters' : 'price_overview'}
+        async with session.get("https://store.steampowered.com/api/appdetails", params=params) as response :
+            fixtures.appdetails.update(await response.json())
+
+        async with session.get("https://steamhunters.com/api/apps/", params={'appids' : batch}) as response :
+            for app in await response.json() :
+                fixtures.steamhunters[str(app['appId'])] = app
+
+    for steam_id in steam_ids[:detailed_apps] :
+        params = {'appids' : steam_id, 'cc' : 'US'}
+        async with session.get("https://store.steampowered.com/api/appdetails", params=params) as response :
+            fixtures.appdetails.update(await response.json())
+
+    # -- the curator page --
+    async with session.get(CURATOR_URL, params=CURATOR_PARAMS) as response :
+        fixtures.add_exchange("GET", CURATOR_URL, CURATOR_PARAMS, response.status,
+                              response.content_type, await response.text())
+
+    fixtures.save(fixture_directory)
+    print(f"recorded {len(fixtures.games)} games, {len(fixtures.users)} users, "
+          + f"and {len(fixtures.appdetails)} steam apps to {fixture_directory}.")
+    return fixtures
+
+
+
+async def _serve_forever(args : argparse.Namespace) :
+    runner = await start_replay_server(
+        args.fixtures, args.host, args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, error_status=args.error_status
+    )
+    print(f"replaying {args.fixtures} at http://{args.host}:{args.port} "
+          + f"(set {HTTP_Client.REPLAY_URL_ENVIRONMENT_VARIABLE} to use it).")
+    try : await asyncio.Event().wait()
+    finally : await stop_replay_server(runner)
+
+
+async def _record(args : argparse.Namespace) :
+    try : await record_fixtures(args.fixtures, args.max_games, args.max_users, args.detailed_apps)
+    finally : await HTTP_Client.close_session()
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description="Record or replay cedb.me, Steam and SteamHunters responses.")
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURE_DIRECTORY, help="the fixture directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="replay recorded fixtures")
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    serve.add_argument('--jitter', type=float, default=0.0, help="up to this many more seconds, at random")
+    serve.add_argument('--error-rate', type=float, default=0.0, help="the fraction of requests that fail")
+    serve.add_argument('--error-status', type=int, default=503, help="the status failed requests get")
+
+    record = commands.add_parser('record', help="record fixtures from the live sites")
+    record.add_argument('--max-games', type=int, default=1_000_000)
+    record.add_argument('--max-users', type=int, default=1_000_000)
+    record.add_argument('--detailed-apps', type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == 'serve' : asyncio.run(_serve_forever(args))
+    else : asyncio.run(_record(args))
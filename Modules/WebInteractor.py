@@ -1,20 +1,19 @@
 import asyncio
+import contextlib
 import datetime
 import functools
 import sys
 import time
 import typing
-import aiohttp
 from discord.ext import tasks
 import discord
-import requests
 from Classes.CE_Cooldown import CECooldown
 from Classes.CE_User import CEUser, CEAPIUser
 from Classes.CE_User_Game import CEUserGame
 from Classes.CE_Game import CEAPIGame, CEGame
 from Classes.OtherClasses import EmbedMessage, UpdateMessage
 from Exceptions.FailedScrapeException import FailedScrapeException
-from Modules import CEAPIReader, Discord_Helper, Mongo_Reader
+from Modules import CEAPIReader, Discord_Helper, HTTP_Client, Mongo_Reader, Outbox
 from Modules.Screenshot import Screenshot
 import Modules.hm as hm
 from web_scraper import scraper
@@ -332,46 +331,144 @@ times = [
 # | |  | |  / ____ \   ____) |    | |    | |____  | | \ \    | |____  | |__| | | |__| | | |     
 # |_|  |_| /_/    \_\ |_____/     |_|    |______| |_|  \_\   |______|  \____/   \____/  |_|     
 
+GAME_CHECKPOINT_SIZE = 100
+"How many changed games are diffed (and written, in one transaction) between the master loop's checkpoints."
+
+USER_CHECKPOINT_SIZE = 100
+"How many users are updated (and written, in one transaction) between the master loop's checkpoints."
+
+def _loop_message(location : str, content : str | None = None, embed : discord.Embed | None = None,
+                  file : discord.File | None = None) -> dict :
+    "Turns a message the master loop wants to send into one for the outbox."
+    message = {"location" : location, "content" : content,
+               "embed" : None if embed is None else embed.to_dict(), "file" : None}
+    if file is not None :
+        file.reset()
+        message['file'] = {"filename" : file.filename, "data" : file.fp.read()}
+        file.reset()
+    return message
+
+async def _post(run_id : str, messages : list[dict], session = None) :
+    """Puts `messages` (from `_loop_message()`) in the outbox for the bot to send.
+    Any that an earlier try at this loop already put there are left alone."""
+    await Mongo_Reader.save_to_outbox(run_id, messages, session=session)
+    Outbox.wake()
+
+def _old_database_name(new_games : list[CEGame], changed_old_games : dict[str, CEGame],
+                       added_game_ids : set[str]) -> list[CEGame] :
+    "Puts together every game as it was before this loop, from the games now and the old versions of the ones that changed."
+    new_ids = {game.ce_id for game in new_games}
+    return [changed_old_games.get(game.ce_id, game) for game in new_games if game.ce_id not in added_game_ids] \
+        + [game for ce_id, game in changed_old_games.items() if ce_id not in new_ids]
+
+async def _finish_game_chunk(run_id : str, embeds : list[EmbedMessage], exceptions : list[UpdateMessage],
+                             updated_game_ids : list[str], added_game_ids : list[str], old_games : list[CEGame],
+                             dumper : Mongo_Reader.BulkDumper) :
+    """Puts a chunk of changed games' messages in the outbox, writes the games, and checkpoints
+    which games changed (and what they were before), all in one transaction (or in that order,
+    if mongo can't do transactions)."""
+    messages : list[dict] = []
+    for embed in embeds :
+        if len(embed.embed.description) > 4096:
+            embed.embed.description = embed.embed.description[0:4060] + "errortoolong"
+        messages.append(_loop_message("gameadditions", embed=embed.embed, file=embed.file))
+    for exc in exceptions :
+        messages.append(_loop_message("privatelog", f"{exc.message} \n<@413427677522034727>"))
+
+    async with Mongo_Reader.outbox_transaction() as session :
+        await _post(run_id, messages, session)
+        await Mongo_Reader.add_loop_progress(run_id, "updated_game_ids", updated_game_ids, session=session)
+        await Mongo_Reader.add_loop_progress(run_id, "added_game_ids", added_game_ids, session=session)
+        await Mongo_Reader.save_loop_old_games(run_id, old_games, session=session)
+        failed = await dumper.flush(session=session)
+        await _post(run_id, [_loop_message("privatelog", f"failed to save game {ce_id}: {message}") for ce_id, message in failed], session)
+
+async def _finish_user_chunk(run_id : str, users : list[CEAPIUser], updates : list[UpdateMessage],
+                             dumper : Mongo_Reader.BulkDumper) :
+    """Puts a chunk of users' messages in the outbox, writes the users, and checkpoints them
+    as done, all in one transaction (or in that order, if mongo can't do transactions)."""
+    async with Mongo_Reader.outbox_transaction() as session :
+        await _post(run_id, [_loop_message(update.location, update.message) for update in updates], session)
+        failed = await dumper.flush(session=session)
+        await _post(run_id, [_loop_message("privatelog", f"failed to save user {ce_id}: {message}") for ce_id, message in failed], session)
+        failed_ids = {ce_id for ce_id, _ in failed}
+        await Mongo_Reader.add_loop_progress(
+            run_id, "users_done", [user.ce_id for user in users if user.ce_id not in failed_ids], session=session
+        )
+
 @tasks.loop(time=times)
 async def master_loop(client : discord.Client, guild_id : int) :
-    """The main looping function that runs every half hour."""
+    """The main looping function that runs every half hour, when the bot runs the loop itself
+    (see `web_scraper.worker` for running it in its own process)."""
+    await run_loop()
+
+async def run_loop() :
+    """Runs the loop once: games, users, curator, database tier and stats. Doesn't need Discord.
+    \nEach phase (games, users, curator, database tier) is checkpointed in mongo, and every
+    update goes into the outbox along with what it's about (see `Outbox`), so if the loop dies
+    partway through, the next one picks up where it stopped and doesn't send anything twice."""
     print('---- loop began... ----')
-    # get channels
-    casino_log_channel = client.get_channel(hm.CASINO_LOG_ID)
-    user_log_channel = client.get_channel(hm.USER_LOG_ID)
-    casino_channel = client.get_channel(hm.CASINO_ID)
-    private_log_channel = client.get_channel(hm.PRIVATE_LOG_ID)
-    game_additions_channel = client.get_channel(hm.GAME_ADDITIONS_ID)
+
+    # ---- checkpoint ----
+    run = await Mongo_Reader.start_loop_run()
+    run_id : str = run['run_id']
+    phases_done : list[str] = run['phases_done']
+    if len(phases_done) > 0 : print(f"resuming loop {run_id} (already done: {', '.join(phases_done)})")
+
+    # a resumed loop still needs to know which games changed, and what they were before.
+    updated_game_ids : set[str] = set(run.get('updated_game_ids', []))
+    added_game_ids : set[str] = set(run.get('added_game_ids', []))
+    changed_old_games : dict[str, CEGame] = {game.ce_id : game for game in run['old_games']}
     
     # ---- game ----
     SKIP_GAME_SCRAPE = False
-    if not SKIP_GAME_SCRAPE :
+    if "games" in phases_done :
+        new_games : list[CEGame] = await Mongo_Reader.get_database_name()
+        old_database_name = _old_database_name(new_games, changed_old_games, added_game_ids)
+
+    elif not SKIP_GAME_SCRAPE :
+        # changed games are written a chunk at a time, in the same transaction as the chunk's messages.
+        game_dumper = Mongo_Reader.BulkDumper("name", max_batch=None, max_wait=None)
+        removed_game_ids : list[str] = []
+        # what's changed since the last chunk was written.
+        embeds : list[EmbedMessage] = []
+        exceptions : list[UpdateMessage] = []
+        chunk_updated_ids : list[str] = []
+        chunk_added_ids : list[str] = []
+        chunk_old_games : list[CEGame] = []
+
+        async def finish_chunk() :
+            await _finish_game_chunk(run_id, embeds, exceptions, chunk_updated_ids, chunk_added_ids,
+                                     chunk_old_games, game_dumper)
+            for chunk in (embeds, exceptions, chunk_updated_ids, chunk_added_ids, chunk_old_games) : chunk.clear()
+
         try :
-            old_database_name : list[CEGame] = []
-            d = await Mongo_Reader.get_database_name()
-            print(len(d))
-            new_games : list[CEAPIGame] = await CEAPIReader.get_api_games_full()
-            game_list = await Mongo_Reader.get_list("name")
-            print(f"games: {len(game_list)}")
-            embeds : list[EmbedMessage] = []
-            exceptions : list[UpdateMessage] = []
-
-            for i, new_game in enumerate(new_games) :
-                if i % 50 == 0 : print(f"game {i} of {len(new_games)}", end="... ")
 
-                # grab the old game
-                old_game = await Mongo_Reader.get_game(new_game.ce_id)
+            # every game in mongo, in one query. games are popped out of this as CE sends them,
+            # so whatever's left at the end has been removed from the site.
+            # (lazily - only the games that changed ever need their objectives.)
+            old_games : dict[str, CEGame] = await Mongo_Reader.get_games_map(lazy=True)
+            print(f"games: {len(old_games)}")
 
-                # and add it to database name
-                if old_game is not None :
-                    old_database_name.append(old_game)
+            # games come in page by page, so we can diff this page while the next one downloads.
+            # (only the changed games are kept, until they're written. everything else is let go.)
+            i = 0
+            async for new_game in CEAPIReader.iter_api_games_full() :
+                if i % 50 == 0 : print(f"game {i}", end="... ")
+                i += 1
 
-                # and the game list (which keeps track of all the old games)
-                # needs to be updated.
-                if new_game.ce_id in game_list : 
-                    game_list.remove(new_game.ce_id)
+                # grab the old game
+                old_game = old_games.pop(new_game.ce_id, None)
 
                 if old_game is not None and old_game.last_updated == new_game.last_updated : continue
+                updated_game_ids.add(new_game.ce_id)
+                chunk_updated_ids.append(new_game.ce_id)
+                if old_game is None :
+                    added_game_ids.add(new_game.ce_id)
+                    chunk_added_ids.append(new_game.ce_id)
+                elif new_game.ce_id not in changed_old_games :
+                    changed_old_games[new_game.ce_id] = old_game
+                    chunk_old_games.append(old_game)
 
                 # get the update
                 game_returns = await thread_single_game_update(
@@ -385,16 +482,18 @@ async def master_loop(client : discord.Client, guild_id : int) :
                     exceptions += game_returns[1]
 
                 # and dump the new game
-                await Mongo_Reader.dump_game(new_game)
-
-
+                await game_dumper.add(new_game)
+                if len(chunk_updated_ids) >= GAME_CHECKPOINT_SIZE : await finish_chunk()
             
-            # now at this point, game_list only has the list of games that were in old_games
-            # but not in new_games.
-            print(game_list)
-            print(f'removed games: {len(game_list)}')
-            for removed_game in game_list :
-                old_game = await Mongo_Reader.get_game(removed_game)
+            # now at this point, old_games only has the games that were in mongo
+            # but not on the site.
+            print(f'removed games: {len(old_games)}')
+            for removed_game, old_game in old_games.items() :
+                updated_game_ids.add(removed_game)
+                chunk_updated_ids.append(removed_game)
+                if removed_game not in changed_old_games :
+                    changed_old_games[removed_game] = old_game
+                    chunk_old_games.append(old_game)
 
                 # get the update
                 game_returns = await thread_single_game_update(
@@ -407,148 +506,157 @@ async def master_loop(client : discord.Client, guild_id : int) :
                         embeds.append(game_returns[0])
                     exceptions += game_returns[1]
 
-                # delete the game
-                await Mongo_Reader.delete_game(old_game.ce_id)
-
-                # and add it to database name
-                old_database_name.append(old_game)
-
-            # send embeds
-            for embed in embeds :
-                if len(embed.embed.description) > 4096:
-                    embed.embed.description = embed.embed.description[0:4060] + "errortoolong"
-                if embed.file is not None :
-                    await game_additions_channel.send(embed=embed.embed, file=embed.file)
-                else :
-                    await game_additions_channel.send(embed=embed.embed)
-            
-            # send exceptions
-            print(exceptions)
-            for exc in exceptions :
-                await private_log_channel.send(f"{exc.message} \n<@413427677522034727>")
+                # the game's deleted once its messages are saved
+                removed_game_ids.append(removed_game)
 
         except FailedScrapeException as e :
-            await private_log_channel.send(f":warning: {e.get_message()}")
+            await _post(run_id, [_loop_message("privatelog", f":warning: {e.get_message()}")])
             print('fetching games failed.')
             return
 
         except Exception as e :
+            # the rest of the loop needs every game, so it stops here (the next loop picks the games back up).
             tb = sys.exception().__traceback__
-            await private_log_channel.send(f":warning: {e.with_traceback(tb)}")
+            await _post(run_id, [_loop_message("privatelog", f":warning: {e.with_traceback(tb)}")])
+            print('scraping games failed partway through.')
+            return
+
+        # whatever happened, don't lose the games that were already diffed:
+        # the last chunk's messages, what changed and the games themselves are all saved together.
+        finally :
+            await finish_chunk()
+            # (if this doesn't finish, a resumed loop finds these games again and deletes them then.)
+            for ce_id in removed_game_ids : await Mongo_Reader.delete_game(ce_id)
+
+        # every game on the site is in mongo now, so read them back (from the cache) instead of keeping them all.
+        new_games : list[CEGame] = await Mongo_Reader.get_database_name()
+        old_database_name = _old_database_name(new_games, changed_old_games, added_game_ids)
+        await Mongo_Reader.save_loop_checkpoint(run_id, {}, phase_done="games")
     
     print(f"old database name: {len(old_database_name)}")
 
     # ---- users ----
     SKIP_USER_SCRAPE = False
-    if not SKIP_USER_SCRAPE :
+    skipped_users = 0
+    if "users" not in phases_done and not SKIP_USER_SCRAPE :
         if SKIP_GAME_SCRAPE : return
+        # users are written a chunk at a time, in the same transaction as the chunk's messages.
+        # (a user whose write fails is just updated again next time.)
+        user_dumper = Mongo_Reader.BulkDumper("user", max_batch=None, max_wait=None)
         try :
             database_user = await Mongo_Reader.get_list("user")
             new_users : list[CEAPIUser] = await CEAPIReader.get_api_users_all(database_user)
 
-            # guild
-            guild = await client.fetch_guild(guild_id)
-
-            # updates
-            updates : list[UpdateMessage] = []
-
-            # get the updates
-            # we can iterate over old or new here, the amount of users in both places will be the same.
-            for i, new_user in enumerate(new_users) :
-                if i % 50 == 0 : print(f"user {i} of {len(new_users)}")
+            # skip anyone an earlier try at this loop already finished.
+            users_done = set(run.get('users_done', []))
+            remaining_users = [user for user in new_users if user.ce_id not in users_done]
+            if len(users_done) > 0 : print(f"{len(new_users) - len(remaining_users)} user(s) already done")
 
-                # grab old user
-                old_user = await Mongo_Reader.get_user(new_user.ce_id)
+            for start in range(0, len(remaining_users), USER_CHECKPOINT_SIZE) :
+                chunk = remaining_users[start:start + USER_CHECKPOINT_SIZE]
 
-                # grab the update
-                updates += (await single_user_update_v2(
-                    user=old_user,
-                    site_data=new_user,
+                # get the updates (several users at a time, see update_users())
+                updates, skipped = await update_users(
+                    new_users=chunk,
+                    updated_game_ids=updated_game_ids,
                     old_database_name=old_database_name,
                     new_database_name=new_games,
-                ))
-
-                # the user was already dumped, so we can just loop again
-                continue
-
-            for update_message in updates :
-                match(update_message.location) :
-                    case "userlog" : await user_log_channel.send(update_message.message)
-                    case "casinolog" : await casino_log_channel.send(update_message.message)
-                    case "gameadditions" : await game_additions_channel.send(update_message.message)
-                    case "casino" : await casino_channel.send(update_message.message)
-                    case "privatelog" : await private_log_channel.send(update_message.message)
+                    dumper=user_dumper
+                )
+                skipped_users += skipped
+                await _finish_user_chunk(run_id, chunk, updates, user_dumper)
+            
+            print(f"skipped {skipped_users} unchanged user(s) of {len(remaining_users)}")
+            await Mongo_Reader.save_loop_checkpoint(run_id, {}, phase_done="users")
 
         except FailedScrapeException as e :
-            await private_log_channel.send(f":warning: {e.get_message()}")
+            await _post(run_id, [_loop_message("privatelog", f":warning: {e.get_message()}")])
             print('fetching users failed.')
             return
         
         except Exception as e :
+            # the loop isn't finished without every user, so it stops here (the next loop picks this one back up).
             tb = sys.exception().__traceback__
-            await private_log_channel.send(f":warning: {e.with_traceback(tb)}")
+            await _post(run_id, [_loop_message("privatelog", f":warning: {e.with_traceback(tb)}")])
+            print('updating users failed partway through.')
+            return
     
     # ---- curator ----
-
-    # pull the data
-    print("checking curator")
-    mongo_recent_curated = await Mongo_Reader.get_curator_ids()
-    steam_recent_curated, descriptions = await get_recent_curated()
-    print(f'{steam_recent_curated=}')
-    print(f'{mongo_recent_curated=}')
-
-    uncurated: list[str] = []
-    for item in steam_recent_curated:
-        if item not in mongo_recent_curated:
-            uncurated.append(item)
-
-    # if steam didn't fail and the numbers are different
-    if steam_recent_curated is not None and len(uncurated) != 0 :
-        print(f"curating {len(uncurated)} update(s)")
-        curator_embeds = await thread_curator(uncurated, new_games, descriptions)
-        for embed in curator_embeds :
-            await game_additions_channel.send(embed=embed)
-        await Mongo_Reader.dump_curator_ids(uncurated)
+    if "curator" not in phases_done :
+        # pull the data
+        print("checking curator")
+        mongo_recent_curated = await Mongo_Reader.get_curator_ids()
+        steam_recent_curated, descriptions = await get_recent_curated()
+        print(f'{steam_recent_curated=}')
+        print(f'{mongo_recent_curated=}')
+
+        uncurated: list[str] = []
+        for item in steam_recent_curated:
+            if item not in mongo_recent_curated:
+                uncurated.append(item)
+
+        # if steam didn't fail and the numbers are different
+        if steam_recent_curated is not None and len(uncurated) != 0 :
+            print(f"curating {len(uncurated)} update(s)")
+            curator_embeds = await thread_curator(uncurated, new_games, descriptions)
+            await _post(run_id, [_loop_message("gameadditions", embed=embed) for embed in curator_embeds])
+            await Mongo_Reader.dump_curator_ids(uncurated)
+            
         
-    
-    else : print('no new curator updates.')
+        else : print('no new curator updates.')
+        await Mongo_Reader.save_loop_checkpoint(run_id, {}, phase_done="curator")
 
     # ---- database tier ----
-    database_tier = scraper.generate_database_tier(new_games)
-    await Mongo_Reader.dump_database_tier(database_tier)
-    
+    if "tier" not in phases_done :
+        database_tier = await scraper.generate_database_tier(new_games)
+        await Mongo_Reader.dump_database_tier(database_tier)
+        await Mongo_Reader.save_loop_checkpoint(run_id, {}, phase_done="tier")
+
+    # ---- stats ----
+    game_stats, user_stats = await Mongo_Reader.refresh_stats()
+    print(f"refreshed stats for {game_stats} games and {user_stats} users")
+
+    await Mongo_Reader.finish_loop_run(run_id)
     print('---- loop complete. ----')
-    return await private_log_channel.send(f":white_check_mark: loop complete at <t:{hm.get_unix('now')}>.")
+    await _post(run_id, [_loop_message(
+        "privatelog",
+        f":white_check_mark: loop complete at <t:{hm.get_unix('now')}>. "
+        + f"skipped {skipped_users} unchanged user(s)."
+        + (f" (resumed after {', '.join(phases_done)}.)" if len(phases_done) > 0 else "")
+    )])
 
 async def get_recent_curated():
     # set the payload and pull from the curator
     payload = {'cc' : 'us', 'l' : 'english'}
-    async with aiohttp.ClientSession(headers={'User-Agent':"andy's-super-duper-bot/0.1"}) as session :
-        async with session.get("https://store.steampowered.com/curator/36185934", params=payload) as response :
-
-            # beautiful soupify
-            soup_data = BeautifulSoup(await response.text(), features="html.parser")
-
-            # set up variables
-            descriptions, ce_ids = [], []
-
-            # get all divs
-            divs = soup_data.find_all('div')
-
-            # iterate through them
-            for item in divs :
-                try :
-                    CONSOLE_MESSAGES = False
-                    if item['class'][0] == 'recommendation_readmore' :
-                        if CONSOLE_MESSAGES : print('-- readmore --')
-                        ce_ids.append(item.contents[0]['href'][-36:])
-                        if CONSOLE_MESSAGES : print(ce_ids[-1])
-                    if item['class'][0] == "recommendation_desc" :
-                        if CONSOLE_MESSAGES : print('-- description --')
-                        descriptions.append(item.string.replace('\t','').replace('\r','').replace('\n',''))
-                        if CONSOLE_MESSAGES : print(descriptions[-1])
-                except : continue
-            return ce_ids, descriptions
+    try :
+        page = await HTTP_Client.fetch_text("GET", "https://store.steampowered.com/curator/36185934", params=payload)
+    except FailedScrapeException as e :
+        print(f"curator scrape failed. {e.get_message()}")
+        return [], []
+
+    # beautiful soupify
+    soup_data = BeautifulSoup(page, features="html.parser")
+
+    # set up variables
+    descriptions, ce_ids = [], []
+
+    # get all divs
+    divs = soup_data.find_all('div')
+
+    # iterate through them
+    for item in divs :
+        try :
+            CONSOLE_MESSAGES = False
+            if item['class'][0] == 'recommendation_readmore' :
+                if CONSOLE_MESSAGES : print('-- readmore --')
+                ce_ids.append(item.contents[0]['href'][-36:])
+                if CONSOLE_MESSAGES : print(ce_ids[-1])
+            if item['class'][0] == "recommendation_desc" :
+                if CONSOLE_MESSAGES : print('-- description --')
+                descriptions.append(item.string.replace('\t','').replace('\r','').replace('\n',''))
+                if CONSOLE_MESSAGES : print(descriptions[-1])
+        except : continue
+    return ce_ids, descriptions
 
 
 #  _______   _    _   _____    ______              _____       _____              __  __   ______ 
@@ -573,11 +681,76 @@ async def thread_single_game_update(old_game : CEGame | None, new_game : CEGame
 #    |_|    |_|  |_| |_|  \_\ |______| /_/    \_\ |_____/     \____/  |_____/  |______| |_|  \_\
 
 
+USER_UPDATE_CONCURRENCY = 8
+"How many users `update_users()` works on at once."
+
+async def update_users(new_users : list[CEUser], updated_game_ids : set[str], old_database_name : list[CEGame],
+                       new_database_name : list[CEAPIGame], dumper : Mongo_Reader.BulkDumper,
+                       concurrency : int = USER_UPDATE_CONCURRENCY) -> tuple[list[UpdateMessage], int] :
+    """Runs `single_user_update_v2()` on every user in `new_users` (skipping the ones that didn't
+    change), `concurrency` users at a time.
+    \nA user with co-op rolls is locked together with their partners, so two partners are never
+    updated at the same moment - one of them always goes second and sees the other's new games
+    (which is what lets co-op rolls be won, see `single_user_update_v2()`). Locks are taken in
+    ce_id order, so two partners waiting on each other can't get stuck.
+    \nReturns the update messages in the same order as `new_users` (whatever order the users
+    actually finished in), and how many users were skipped. If a user's update fails, a
+    privatelog message says so and everyone else still gets updated."""
+    semaphore = asyncio.Semaphore(concurrency)
+    locks : dict[str, asyncio.Lock] = {}
+    results : list[list[UpdateMessage]] = [[] for _ in new_users]
+    skipped_users = 0
+
+    def partner_ids(user : CEUser) -> set[str] :
+        return {roll.partner_ce_id for roll in user.rolls if roll.partner_ce_id is not None}
+
+    async def update(i : int, new_user : CEUser) :
+        nonlocal skipped_users
+        async with semaphore :
+            if i % 50 == 0 : print(f"user {i} of {len(new_users)}")
+            try :
+                ce_ids = {new_user.ce_id} | partner_ids(await dumper.get(new_user.ce_id))
+                while True :
+                    async with contextlib.AsyncExitStack() as stack :
+                        for ce_id in sorted(ce_ids) :
+                            await stack.enter_async_context(locks.setdefault(ce_id, asyncio.Lock()))
+
+                        # grab old user now that it's locked (the dumper might have a newer copy, if they were someone's partner)
+                        old_user = await dumper.get(new_user.ce_id)
+                        if not partner_ids(old_user) <= ce_ids :
+                            # they got a new partner in the meantime, so lock them too and start over.
+                            ce_ids |= partner_ids(old_user)
+                            continue
+
+                        # if nothing about them changed, there's nothing to update (or write back)
+                        if old_user.can_skip_update(new_user, updated_game_ids) :
+                            skipped_users += 1
+                            return
+
+                        # grab the update (the user is dumped in here)
+                        results[i] = await single_user_update_v2(
+                            user=old_user,
+                            site_data=new_user,
+                            old_database_name=old_database_name,
+                            new_database_name=new_database_name,
+                            dumper=dumper
+                        )
+                        return
+            except Exception as e :
+                results[i] = [UpdateMessage("privatelog", f"failed to update user {new_user.ce_id}: {e}")]
+
+    await asyncio.gather(*[update(i, new_user) for i, new_user in enumerate(new_users)])
+    return [message for user_updates in results for message in user_updates], skipped_users
+
 async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_name : list[CEGame],
-                                    new_database_name : list[CEAPIGame]) -> list[UpdateMessage] :
+                                    new_database_name : list[CEAPIGame], 
+                                    dumper : Mongo_Reader.BulkDumper | None = None) -> list[UpdateMessage] :
     """Updates a user using the 'multiple documents' style of backend.
     The whole point of this is to no longer have a "database-user". However,
-    this is only being used for reading, not for writing, so it's okay to pass it in here."""
+    this is only being used for reading, not for writing, so it's okay to pass it in here.
+    \nIf `dumper` is passed, the user (and any partners) are queued on it instead of dumped right away."""
+    get_user = dumper.get if dumper is not None else Mongo_Reader.get_user
+    dump_user = dumper.add if dumper is not None else Mongo_Reader.dump_user
     
     updates : list[UpdateMessage] = []
 
@@ -597,6 +770,7 @@ async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_
     user._steam_id = site_data._steam_id
     user._avatar = site_data.avatar
     user._display_name = site_data.display_name
+    user.set_fingerprint(site_data.fingerprint)
 
     new_points = user.get_total_points()
     new_completed_games = user.get_completed_games_2(new_database_name)
@@ -680,7 +854,7 @@ async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_
         #       this if statement just preps for the next one.
         if not roll.status == "current" : continue
         partner = None
-        if roll.partner_ce_id is not None : partner = await Mongo_Reader.get_user(roll.partner_ce_id)
+        if roll.partner_ce_id is not None : partner = await get_user(roll.partner_ce_id)
         if (roll.is_multi_stage() and not roll.in_final_stage() and 
             (roll.is_won(database_name=new_database_name, user=user, partner=partner))) :
             # if we've already hit this roll before, keep moving
@@ -727,7 +901,7 @@ async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_
             """
             if roll.is_co_op() :
                 # get the partner and their roll
-                partner = await Mongo_Reader.get_user(roll.partner_ce_id)
+                partner = await get_user(roll.partner_ce_id)
                 if partner.has_current_roll(roll.roll_name) :
                     partner_roll = partner.get_current_roll(roll.roll_name)
 
@@ -740,7 +914,7 @@ async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_
                         partner.win_current_roll(partner_roll.roll_name)
 
                     # and append it to partners
-                    await Mongo_Reader.dump_user(partner)
+                    await dump_user(partner)
 
         
         elif roll.is_expired() :
@@ -755,13 +929,13 @@ async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_
             # remove this roll from current rolls
             user.fail_current_roll(roll.roll_name)
             if roll.is_co_op() :
-                partner = await Mongo_Reader.get_user(roll.partner_ce_id)
+                partner = await get_user(roll.partner_ce_id)
                 if partner.has_current_roll(roll.roll_name) :
                     partner.fail_current_roll(roll.roll_name)
-                    await Mongo_Reader.dump_user(user)
+                    await dump_user(user)
     
     user.set_last_updated(hm.get_unix("now"))
-    await Mongo_Reader.dump_user(user)
+    await dump_user(user)
 
     return updates
 
@@ -777,14 +951,17 @@ async def single_user_update_v2(user : CEUser, site_data : CEUser, old_database_
 #  \_____|  \____/  |_|  \_\ /_/    \_\    |_|     \____/  |_|  \_\    \_____|  \____/   \____/  |_| \_|    |_|   
 
 async def get_curator_count() -> int | None :
-    "Returns the current curator count. Uses `requests` but I don't care!"
+    "Returns the current curator count."
 
     # set the payload and pull from the curator
     payload = {"cc" : "us", "l" : "english"}
-    data = requests.get("https://store.steampowered.com/curator/36185934", params=payload)
+    try :
+        page = await HTTP_Client.fetch_text("GET", "https://store.steampowered.com/curator/36185934", params=payload)
+    except FailedScrapeException :
+        return None
 
     # beautiful soupify
-    soup_data = BeautifulSoup(data.text, features="html.parser")
+    soup_data = BeautifulSoup(page, features="html.parser")
 
     # get all spans
     spans = soup_data.find_all("span")
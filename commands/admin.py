@@ -4,9 +4,11 @@ import datetime
 import discord
 from discord import app_commands
 from Classes.CE_Roll import CERoll
+from Classes.CE_User import CEUser
 from Modules.WebInteractor import master_loop
 from commands.user import register
 from Modules import CEAPIReader, Mongo_Reader, Reformatter, hm
+from web_scraper import worker
 import requests
 import json
 
@@ -69,6 +71,11 @@ def setup(cli : discord.Client, tree : app_commands.CommandTree, gui : discord.G
     @tree.command(name='force-unlink', description="Unlink someone from the bot.", guild=guild)
     async def force_unlink_command(interaction: discord.Interaction, member: discord.Member):
         await force_unlink(interaction, member)
+
+    # ---- query plans command ----
+    @tree.command(name='query-plans', description="Check that the bot's most common database queries use an index.", guild=guild)
+    async def query_plans_command(interaction : discord.Interaction) :
+        await query_plans(interaction)
     pass
 
 
@@ -124,7 +131,15 @@ async def scrape(interaction : discord.Interaction) :
     database_user = await CEAPIReader.get_api_users_all(user_list)
     database_name = await CEAPIReader.get_api_games_full()
 
-    for user in database_user :
+    for site_user in database_user :
+        # only what comes from the site is replaced (their rolls stay as they are).
+        user = await Mongo_Reader.find_user(site_user.ce_id)
+        if user is None : continue
+        user.owned_games = site_user.owned_games
+        user._steam_id = site_user._steam_id
+        user._avatar = site_user.avatar
+        user._display_name = site_user.display_name
+        user.set_fingerprint(site_user.fingerprint)
         await Mongo_Reader.dump_user(user)
 
     for game in database_name :
@@ -144,11 +159,41 @@ async def scrape(interaction : discord.Interaction) :
 
 
 
+# ---- query plans ----
+
+async def query_plans(interaction : discord.Interaction) :
+    await interaction.response.defer()
+
+    # log this interaction
+    private_log_channel = client.get_channel(hm.PRIVATE_LOG_ID)
+    await private_log_channel.send(f":white_large_square: dev command run by <@{interaction.user.id}>: /query-plans",
+                             allowed_mentions=discord.AllowedMentions.none())
+
+    # make sure the indexes are there first
+    problems = await Mongo_Reader.ensure_indexes()
+
+    lines : list[str] = []
+    for query, stages, is_collection_scan in await Mongo_Reader.explain_hot_queries() :
+        emoji = ":warning:" if is_collection_scan else ":white_check_mark:"
+        lines.append(f"{emoji} `{query}`: {' -> '.join(stages)}")
+    for problem in problems :
+        lines.append(f":x: {problem}")
+
+    return await interaction.followup.send("\n".join(lines)[:2000])
+
+
+
 # ---- initiate loop ----
 
 async def loop(interaction : discord.Interaction) :
     await interaction.response.defer()
 
+    # the scraper worker runs the loop in its own process, so just ask it to.
+    if worker.WORKER_MODE != "bot" :
+        await Mongo_Reader.request_worker_loop()
+        status = await Mongo_Reader.get_worker_status()
+        return await interaction.followup.send(f"asked the scraper worker to loop. ({worker.describe_status(status)})")
+
     if hm.IN_CE :
         if datetime.datetime.now().minute < 30 and datetime.datetime.now().minute >= 25 :
             return await interaction.followup.send('this loop will run in less than five minutes. please wait!')
@@ -246,14 +291,13 @@ async def clear_roll(interaction : discord.Interaction, member : discord.Member,
                      + f"params: member=<@{member.id}>, roll_name={roll_name}, current={current}, completed={completed}, "
                      + f"pending={pending}", allowed_mentions=discord.AllowedMentions.none())
 
-    # get database user and the user
-    user = await Mongo_Reader.get_user(member.id, use_discord_id=True)
-
-    if current : user.remove_current_roll(roll_name)
-    if completed : user.remove_completed_rolls(roll_name)
-    if pending : user.remove_pending(roll_name)
+    # clear the rolls (only the rolls are written, see update_user())
+    def clear(user : CEUser) :
+        if current : user.remove_current_roll(roll_name)
+        if completed : user.remove_completed_rolls(roll_name)
+        if pending : user.remove_pending(roll_name)
 
-    await Mongo_Reader.dump_user(user)
+    await Mongo_Reader.modify_user(member.id, clear, use_discord_id=True)
     return await interaction.followup.send("Done!")
 
 
@@ -266,25 +310,29 @@ async def clear_roll_portion(interaction: discord.Interaction, member: discord.M
                      + f"params: member=<@{member.id}>, roll_name={roll_name}")
     
     user = await Mongo_Reader.get_user(member.id, use_discord_id=True)
-
-    roll = user.get_current_roll(roll_name)
-    if roll is None:
+    if user.get_current_roll(roll_name) is None:
         return await interaction.followup.send("User does not have roll that is current")
-    game_removed = roll.remove_game_last()
+
+    # (this is redone on a fresh copy if the user changes in the meantime, see modify_user())
+    game_removed = None
+    def clear_portion(user : CEUser) :
+        nonlocal game_removed
+        roll = user.get_current_roll(roll_name)
+        if roll is None : raise ValueError(f"User {user.ce_id} has no current roll {roll_name}.")
+        game_removed = roll.remove_game_last()
+        roll.set_status('waiting')
+        roll.due_time = None
+        print(roll.to_dict())
+
+    user = await Mongo_Reader.modify_user(user.ce_id, clear_portion)
+    for roll in user.rolls:
+        print (roll.to_dict())
+
     game_removed = await Mongo_Reader.get_game(game_removed)
     if game_removed is None :
         game_removed = "<error, removed game was 'null'>"
     else :
         game_removed = game_removed.name_with_link()
-    roll.set_status('waiting')
-    roll.due_time = None
-
-    print(roll.to_dict())
-
-    for roll in user.rolls:
-        print (roll.to_dict())
-
-    await Mongo_Reader.dump_user(user)
     return await interaction.followup.send(f"Removed {game_removed} from {user.display_name}'s {roll_name} roll. " +
                                            f"Status set to 'waiting'.")
 
@@ -303,16 +351,12 @@ async def force_add(interaction : discord.Interaction, member : discord.Member,
                      + f"params: member=<@{member.id}>, roll_name={roll_name}", 
                      allowed_mentions=discord.AllowedMentions.none())
     
-    # get database user and the user
-    user = await Mongo_Reader.get_user(member.id, use_discord_id=True)
-
-    user.add_completed_roll(CERoll(
+    # add the roll to the user
+    await Mongo_Reader.modify_user(member.id, lambda user : user.add_completed_roll(CERoll(
         roll_name=roll_name,
         user_ce_id=user.ce_id,
         games=None
-    ))
-
-    await Mongo_Reader.dump_user(user)
+    )), use_discord_id=True)
     return await interaction.followup.send("Done!")
 
 
@@ -324,9 +368,9 @@ class UnlinkView(discord.ui.View):
     
     @discord.ui.button(label="Yes", style=discord.ButtonStyle.green)
     async def yes_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user = await Mongo_Reader.get_user(self._member_id, use_discord_id=True)
-        user._discord_id = None
-        await Mongo_Reader.dump_user(user)
+        def unlink(user : CEUser) :
+            user._discord_id = None
+        user = await Mongo_Reader.modify_user(self._member_id, unlink, use_discord_id=True)
 
         self.clear_items()
         await interaction.response.edit_message(content=f"{user.display_name} has been removed.", view=self)
@@ -358,12 +402,8 @@ class RerollView(discord.ui.View) :
     
     @discord.ui.button(label="Yes", style=discord.ButtonStyle.green)
     async def yes_button(self, interaction : discord.Interaction, button : discord.ui.Button) :
-        # pull database user and get user
-        user = await Mongo_Reader.get_user(self.__user_ce_id)
-
-        user.remove_current_roll(self.__event_name) # remove the current roll
-
-        await Mongo_Reader.dump_user(user)
+        # remove the current roll
+        await Mongo_Reader.modify_user(self.__user_ce_id, lambda user : user.remove_current_roll(self.__event_name))
 
         self.clear_items()
         await interaction.response.edit_message(content=f"You can now reroll {self.__event_name}.", view=self)
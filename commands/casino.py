@@ -2,12 +2,13 @@
 import datetime
 import random
 import sys
-from typing import get_args
+from typing import Callable, get_args
 import discord 
 from discord import app_commands
 from Classes.CE_User import CEUser
 from Classes.CE_Game import CEGame
 from Classes.CE_Roll import CERoll
+from Exceptions.UserConflictException import UserConflictException
 from Modules import Discord_Helper, Mongo_Reader, hm
 
 """ === GETTING CLIENT TO WORK === """
@@ -103,8 +104,7 @@ class TripleThreatDropdown(discord.ui.Select) :
             ))
 
         if None in rolled_games :
-            user.remove_pending("Triple Threat")
-            await Mongo_Reader.dump_user(user)
+            await update_solo_user(user.ce_id, lambda user : user.remove_pending("Triple Threat"))
             return await interaction.followup.send("Not enough qualifiable games. Please try again later!")
 
         roll : CERoll = CERoll(
@@ -114,11 +114,11 @@ class TripleThreatDropdown(discord.ui.Select) :
             is_current=True
         )
 
-        user.remove_pending("Triple Threat")
-        user.add_current_roll(roll)
-        await Mongo_Reader.dump_user(user)
-
-        database_user = await Mongo_Reader.get_database_user()
+        def add_roll(user : CEUser) :
+            user.remove_pending("Triple Threat")
+            user.add_current_roll(roll)
+        if await update_solo_user(user.ce_id, add_roll) is None :
+            return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
 
         view = discord.ui.View()
         embeds = await Discord_Helper.get_roll_embeds(roll=roll, database_name=database_name)
@@ -187,11 +187,11 @@ class LetFateDecideDropdown(discord.ui.Select) :
             is_current=True
         )
 
-        user.remove_pending("Let Fate Decide")
-        user.add_current_roll(roll)
-        await Mongo_Reader.dump_user(user)
-
-        database_user = await Mongo_Reader.get_database_user()
+        def add_roll(user : CEUser) :
+            user.remove_pending("Let Fate Decide")
+            user.add_current_roll(roll)
+        if await update_solo_user(user.ce_id, add_roll) is None :
+            return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
 
         view = discord.ui.View()
         embeds = await Discord_Helper.get_roll_embeds(roll=roll, database_name=database_name)
@@ -248,6 +248,7 @@ class FourwardThinkingDropdown(discord.ui.Select) :
 
         # get past_roll
         past_roll = user.get_waiting_roll("Fourward Thinking")
+        had_past_roll = past_roll is not None
         if past_roll is None :
             past_roll = CERoll(
                 roll_name="Fourward Thinking",
@@ -273,15 +274,26 @@ class FourwardThinkingDropdown(discord.ui.Select) :
             hours_restriction=self.__hours_restriction
         )
 
-        # add the new game and reset the due time.
-        past_roll.add_game(game_id)
-        past_roll.reset_due_time()
-
-        # replace the roll and push the user to mongo
-        user.update_waiting_roll(past_roll)
-        user.unwait_waiting_roll("Fourward Thinking")
-        user.remove_pending("Fourward Thinking")
-        await Mongo_Reader.dump_user(user)
+        # add the new game to the waiting roll (or a new one if this is the first phase),
+        # reset the due time, and push the user to mongo.
+        def add_game(user : CEUser) :
+            roll = user.get_waiting_roll("Fourward Thinking")
+            if (roll is not None) != had_past_roll : raise UserConflictException(
+                f"User {user.ce_id}'s waiting Fourward Thinking roll was changed by someone else."
+            )
+            if roll is None : roll = CERoll(
+                roll_name="Fourward Thinking",
+                user_ce_id=user.ce_id,
+                games=[],
+                is_current=True
+            )
+            roll.add_game(game_id)
+            roll.reset_due_time()
+            user.update_waiting_roll(roll)
+            user.unwait_waiting_roll("Fourward Thinking")
+            user.remove_pending("Fourward Thinking")
+        if await update_solo_user(user.ce_id, add_game) is None :
+            return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
 
         # now send the message
         game_object = hm.get_item_from_list(game_id, database_name)
@@ -300,12 +312,8 @@ class RerollView(discord.ui.View) :
     
     @discord.ui.button(label="Yes", style=discord.ButtonStyle.green)
     async def yes_button(self, interaction : discord.Interaction, button : discord.ui.Button) :
-        # pull database user and get user
-        user = await Mongo_Reader.get_user(self.__user_ce_id)
-
-        user.remove_current_roll(self.__event_name) # remove the current roll
-
-        await Mongo_Reader.dump_user(user)
+        # remove the current roll
+        await Mongo_Reader.modify_user(self.__user_ce_id, lambda user : user.remove_current_roll(self.__event_name))
 
         self.clear_items()
         await interaction.response.edit_message(content=f"You can now reroll {self.__event_name}.", view=self)
@@ -531,12 +539,10 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
                         price_restriction=price_restriction,
                         hours_restriction=hours_restriction
                     )
-                    past_roll.add_game(new_game_id)
-                    past_roll.reset_due_time()
+                    written = await update_solo_user(user.ce_id, next_phase("Two Week T2 Streak", new_game_id))
+                    if written is None : return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
+                    past_roll = written.get_current_roll("Two Week T2 Streak")
                     new_game_object = hm.get_item_from_list(new_game_id, database_name)
-                    user.update_waiting_roll(past_roll)
-                    user.unwait_waiting_roll("Two Week T2 Streak")
-                    await Mongo_Reader.dump_user(user)
                     return await interaction.followup.send(
                         f"Your next game is [{new_game_object.game_name}](https://cedb.me/game/{new_game_object.ce_id}). " +
                         f"It is due on <t:{past_roll.due_time}>. "
@@ -583,12 +589,10 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
                         price_restriction=price_restriction,
                         hours_restriction=hours_restriction
                     )
-                    past_roll.add_game(new_game_id)
-                    past_roll.reset_due_time()
+                    written = await update_solo_user(user.ce_id, next_phase("Two \"Two Week T2 Streak\" Streak", new_game_id))
+                    if written is None : return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
+                    past_roll = written.get_current_roll("Two \"Two Week T2 Streak\" Streak")
                     new_game_object = hm.get_item_from_list(new_game_id, database_name)
-                    user.update_waiting_roll(past_roll)
-                    user.unwait_waiting_roll("Two \"Two Week T2 Streak\" Streak")
-                    await Mongo_Reader.dump_user(user)
                     return await interaction.followup.send(
                         f"Your next game is [{new_game_object.game_name}](https://cedb.me/game/{new_game_object.ce_id}). " +
                         f"It is due on <t:{past_roll.due_time}>. " +
@@ -623,8 +627,8 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
         case "Triple Threat" :
             if not user.has_completed_roll("Never Lucky") :
                 return await interaction.followup.send("You need to complete Never Lucky before rolling Triple Threat!")
-            user.add_pending("Triple Threat")
-            await Mongo_Reader.dump_user(user)
+            if await update_solo_user(user.ce_id, lambda user : user.add_pending("Triple Threat")) is None :
+                return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
 
             view.add_item(TripleThreatDropdown(user.ce_id, price_restriction, hours_restriction))
             view.timeout = 600
@@ -635,8 +639,8 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
         
         case "Let Fate Decide" :
             # add the pending
-            user.add_pending("Let Fate Decide")
-            await Mongo_Reader.dump_user(user)
+            if await update_solo_user(user.ce_id, lambda user : user.add_pending("Let Fate Decide")) is None :
+                return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
 
             view.add_item(LetFateDecideDropdown(user, price_restriction, hours_restriction))
             view.timeout = 600
@@ -660,8 +664,8 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
             past_roll = user.get_waiting_roll("Fourward Thinking")
             
             # add the pending and dump it
-            user.add_pending("Fourward Thinking")
-            await Mongo_Reader.dump_user(user)
+            if await update_solo_user(user.ce_id, lambda user : user.add_pending("Fourward Thinking")) is None :
+                return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
             
             view.timeout = 600
             view.add_item(FourwardThinkingDropdown(past_roll, database_name, price_restriction, hours_restriction, 
@@ -687,7 +691,10 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
         games=rolled_games,
         is_current=True
     )
-    user.add_current_roll(roll)
+
+    # -- dump the user --
+    if await update_solo_user(user.ce_id, lambda user : user.add_current_roll(roll)) is None :
+        return await interaction.followup.send(SOLO_CONFLICT_MESSAGE)
 
     # -- create embeds --
 
@@ -697,10 +704,54 @@ async def solo_roll(interaction : discord.Interaction, event_name : hm.SOLO_ROLL
     )
 
     await Discord_Helper.get_buttons(view=view, embeds=embeds)
-    await Mongo_Reader.dump_user(user=user)
     return await interaction.followup.send(embed=embeds[0], view=view)
 
 
+SOLO_CONFLICT_MESSAGE = "You were changed by something else at the same time, so nothing was rolled. Please try again!"
+"What a solo roll says when `update_solo_user()` couldn't write the user."
+
+async def update_solo_user(user_ce_id : str, change : Callable[[CEUser], None]) -> CEUser | None :
+    """Calls `change` on the user and writes it, doing it again on a fresh copy if someone
+    else wrote to them first (see `Mongo_Reader.modify_user()`). Returns the written user,
+    or `None` if someone else kept changing them (send `SOLO_CONFLICT_MESSAGE`)."""
+    try :
+        return await Mongo_Reader.modify_user(user_ce_id, change)
+    except UserConflictException :
+        return None
+
+def next_phase(roll_name : hm.ALL_ROLL_EVENT_NAMES, game_id : str) -> Callable[[CEUser], None] :
+    """Returns a change (for `update_solo_user()`) that adds `game_id` to the user's waiting
+    `roll_name` roll, resets its due time, and makes it current again."""
+    def change(user : CEUser) :
+        roll = user.get_waiting_roll(roll_name)
+        if roll is None : raise UserConflictException(
+            f"User {user.ce_id}'s waiting {roll_name} roll was changed by someone else."
+        )
+        roll.add_game(game_id)
+        roll.reset_due_time()
+        user.unwait_waiting_roll(roll_name)
+    return change
+
+
+COOP_CONFLICT_MESSAGE = ("You or your partner were changed by something else at the same time, " +
+                         "so nothing was rolled. Please try again!")
+"What a co-op roll says when `update_coop_users()` couldn't write both users."
+
+async def update_coop_users(user_ce_id : str, partner_ce_id : str, change_user : Callable[[CEUser], None],
+                            change_partner : Callable[[CEUser], None]) -> tuple[CEUser, CEUser] | None :
+    """Calls `change_user` on the user and `change_partner` on the partner, and writes them
+    both or neither (see `Mongo_Reader.modify_users()`). Returns the written user and partner,
+    or `None` if someone else kept changing them (send `COOP_CONFLICT_MESSAGE`)."""
+    def change(users : list[CEUser]) :
+        change_user(users[0])
+        change_partner(users[1])
+    try :
+        user, partner = await Mongo_Reader.modify_users([user_ce_id, partner_ce_id], change)
+    except UserConflictException :
+        return None
+    return user, partner
+
+
 """ === CLASSES === """
 
 
@@ -774,26 +825,32 @@ class DestinyAlignmentAgreeView(discord.ui.View) :
             )
 
         # add the roll to the user...
-        user.add_current_roll(CERoll(
+        user_roll = CERoll(
             roll_name="Destiny Alignment",
             user_ce_id=user.ce_id,
             games=[game_for_user, game_for_partner],
             partner_ce_id=partner.ce_id,
             is_current=True
-        ))
+        )
 
         # ...and the partner.
-        partner.add_current_roll(CERoll(
+        partner_roll = CERoll(
             roll_name="Destiny Alignment",
             user_ce_id=partner.ce_id,
             games=[game_for_partner, game_for_user],
             partner_ce_id=user.ce_id,
             is_current=True
-        ))
+        )
 
-        # and then dump them both.
-        await Mongo_Reader.dump_user(user)
-        await Mongo_Reader.dump_user(partner)
+        # and then dump them both (or neither).
+        written = await update_coop_users(
+            user.ce_id, partner.ce_id,
+            lambda user : user.add_current_roll(user_roll), lambda partner : partner.add_current_roll(partner_roll)
+        )
+        if written is None :
+            self.__button_clicked = False
+            return await interaction.followup.send(COOP_CONFLICT_MESSAGE)
+        user, partner = written
 
         self.clear_items()
 
@@ -936,11 +993,14 @@ class SoulMatesAgreeView(discord.ui.View) :
             tier_num=tier_num
         )
 
-        user.add_current_roll(user_roll)
-        partner.add_current_roll(partner_roll)
-
-        await Mongo_Reader.dump_user(user)
-        await Mongo_Reader.dump_user(partner)
+        written = await update_coop_users(
+            user.ce_id, partner.ce_id,
+            lambda user : user.add_current_roll(user_roll), lambda partner : partner.add_current_roll(partner_roll)
+        )
+        if written is None :
+            self.__button_clicked = False
+            return await interaction.followup.send(COOP_CONFLICT_MESSAGE)
+        user, partner = written
 
         game_object = hm.get_item_from_list(rolled_game, database_name)
 
@@ -1023,16 +1083,21 @@ class TeamworkMakesTheDreamWorkAgreeView(discord.ui.View) :
             partner_ce_id=partner.ce_id,
             is_current=True
         )
-        user.add_current_roll(user_roll)
-        partner.add_current_roll(CERoll(
+        partner_roll = CERoll(
             roll_name="Teamwork Makes the Dream Work",
             user_ce_id=partner.ce_id,
             games=rolled_games,
             partner_ce_id=user.ce_id,
             is_current=True
-        ))
-        await Mongo_Reader.dump_user(user)
-        await Mongo_Reader.dump_user(partner)
+        )
+        written = await update_coop_users(
+            user.ce_id, partner.ce_id,
+            lambda user : user.add_current_roll(user_roll), lambda partner : partner.add_current_roll(partner_roll)
+        )
+        if written is None :
+            self.__button_clicked = False
+            return await interaction.followup.send(COOP_CONFLICT_MESSAGE)
+        user, partner = written
 
         rolled_games_objects = [hm.get_item_from_list(game_id, database_name) for game_id in rolled_games]
 
@@ -1169,10 +1234,12 @@ async def coop_roll(interaction : discord.Interaction, event_name : hm.COOP_ROLL
             " (P.S. This is not a cooldown. Just has to do with how the bot backend works.)"
         )
 
-    user.add_pending(event_name)
-    partner.add_pending(event_name)
-    await Mongo_Reader.dump_user(user)
-    await Mongo_Reader.dump_user(partner)
+    written = await update_coop_users(
+        user.ce_id, partner.ce_id,
+        lambda user : user.add_pending(event_name), lambda partner : partner.add_pending(event_name)
+    )
+    if written is None : return await interaction.followup.send(COOP_CONFLICT_MESSAGE)
+    user, partner = written
 
 
     match(event_name) :
@@ -1229,7 +1296,7 @@ async def check_rolls(interaction : discord.Interaction) :
     view = discord.ui.View(timeout=None)
 
     # find the user
-    user = await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)
+    user = await Mongo_Reader.get_user_view(interaction.user.id, "summary", use_discord_id=True)
     if user is None : return await interaction.followup.send(content="You're not registered! Please run /register.")
 
     return await interaction.followup.send(f'[click me :)](https://ce-assistant-frontend.vercel.app/users/{user.ce_id})')
@@ -3,6 +3,7 @@ import discord
 from discord import app_commands
 
 from Classes.CE_User import CEUser
+from Exceptions.UserConflictException import UserConflictException
 from Modules import CEAPIReader, Discord_Helper, Mongo_Reader, hm
 
 
@@ -72,17 +73,13 @@ async def register(interaction : discord.Interaction, ce_id : str, discord_user
     ce_id = hm.format_ce_link(ce_id)
     if ce_id is None : return await interaction.followup.send(f"'{ce_id}' is not a valid link or ID. Please try again!")
 
-    # get database_user
-    users = await Mongo_Reader.get_database_user()
-    
     # make sure they're not already registered
-    for user in users :
-        if user.discord_id == interaction.user.id :
-            return await interaction.followup.send("This discord account is already registered in the " +
-                                                   "CE Assistant database!")
-        if user.ce_id == ce_id : 
-            return await interaction.followup.send("This Challenge Enthusiast page is " +
-                                                   "already connected to another account!")
+    if await Mongo_Reader.find_user(interaction.user.id, use_discord_id=True) is not None :
+        return await interaction.followup.send("This discord account is already registered in the " +
+                                               "CE Assistant database!")
+    if await Mongo_Reader.find_user(ce_id) is not None : 
+        return await interaction.followup.send("This Challenge Enthusiast page is " +
+                                               "already connected to another account!")
     
     # grab their data from CE
     ce_user : CEUser = await CEAPIReader.get_api_page_data("user", ce_id)
@@ -100,7 +97,12 @@ async def register(interaction : discord.Interaction, ce_id : str, discord_user
         ce_user.add_completed_roll(roll)
 
     # add the user to users and dump it
-    await Mongo_Reader.dump_user(ce_user)
+    # (a brand new user is never written over someone who's registered, see dump_user())
+    try :
+        await Mongo_Reader.dump_user(ce_user)
+    except UserConflictException :
+        return await interaction.followup.send("This Challenge Enthusiast page is " +
+                                               "already connected to another account!")
 
     # get the role and attach it
     cea_registered_role = discord.utils.get(interaction.guild.roles, name = "CEA Registered")
@@ -156,7 +158,7 @@ async def set_color(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
 
     # grab the user data
-    user_ce = await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)
+    user_ce = await Mongo_Reader.get_user_view(interaction.user.id, "games", use_discord_id=True)
     user_rank_num = user_ce.rank_num()
 
     # the actual assigning role function
@@ -243,7 +245,7 @@ async def show_summary(interaction: discord.Interaction, user: discord.User = No
     if user is None: user = interaction.user
 
     try: 
-        user_ce = await Mongo_Reader.get_user(user.id, use_discord_id=True)
+        user_ce = await Mongo_Reader.get_user_view(user.id, "summary", use_discord_id=True)
     except ValueError:
         return await interaction.followup.send(
             "The user you requested is not registered with the bot."
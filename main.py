@@ -16,6 +16,9 @@ from Classes.OtherClasses import CEInput
 from Modules.WebInteractor import master_loop
 import Modules.hm as hm
 import Modules.Mongo_Reader as Mongo_Reader
+import Modules.HTTP_Client as HTTP_Client
+import Modules.Outbox as Outbox
+from web_scraper import worker
 from commands import load_commands
 
 # ----------- to-be-sorted imports -------------
@@ -51,7 +54,15 @@ with open('secret_info.json') as f :
         guild_id = local_json_data['test_guild_ID']
 
 # set up client
-client = discord.Client(intents=intents)
+class CEAssistantClient(discord.Client) :
+    "The bot's client. Stops the scraper worker, sends any queued messages and closes the shared HTTP session when the bot shuts down."
+    async def close(self) :
+        await worker.stop_supervised(timeout=30)
+        await Outbox.stop(timeout=30)
+        await HTTP_Client.close_session()
+        await super().close()
+
+client = CEAssistantClient(intents=intents)
 tree = app_commands.CommandTree(client)
 guild = discord.Object(id=guild_id)
 
@@ -309,8 +320,7 @@ async def on_message(message : discord.Message) :
         "The message is in the #proof-submissions channel."
 
         # pull the user
-        database_user = await Mongo_Reader.get_database_user()
-        user = Discord_Helper.get_user_by_discord_id(message.author.id, database_user)
+        user = await Mongo_Reader.find_user(message.author.id, use_discord_id=True)
         
         # scenario 2: is registered but forget link
         if "cedb.me/user" not in message.content and user is not None :
@@ -511,7 +521,7 @@ class ValueModal(discord.ui.Modal) :
         # add the value input for the newly grabbed data.
         curr_input.add_value_input(
             objective_id=self.__objective.ce_id,
-            user_id=(await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)).ce_id,
+            user_id=(await Mongo_Reader.get_user_view(interaction.user.id, "summary", use_discord_id=True)).ce_id,
             value=int(self.new_value.value)
         )
 
@@ -611,7 +621,7 @@ class CurateButtonYesOrNoView(discord.ui.View) :
 
         # add the curate input
         input_object.add_curate_input(
-            (await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)).ce_id,
+            (await Mongo_Reader.get_user_view(interaction.user.id, "summary", use_discord_id=True)).ce_id,
             1
         )
 
@@ -658,7 +668,7 @@ class CurateButtonYesOrNoView(discord.ui.View) :
 
         # add the curate input
         input_object.add_curate_input(
-            (await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)).ce_id,
+            (await Mongo_Reader.get_user_view(interaction.user.id, "summary", use_discord_id=True)).ce_id,
             2
         )
 
@@ -704,7 +714,7 @@ class CurateButtonYesOrNoView(discord.ui.View) :
 
         # add the curate input
         input_object.add_curate_input(
-            (await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)).ce_id,
+            (await Mongo_Reader.get_user_view(interaction.user.id, "summary", use_discord_id=True)).ce_id,
             0
         )
 
@@ -806,7 +816,7 @@ class GameInputView(discord.ui.View) :
 
         # pull from mongo
         game = await Mongo_Reader.get_game(self.ce_id)
-        user = await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)
+        user = await Mongo_Reader.get_user_view(interaction.user.id, "games", use_discord_id=True)
 
         # if this game hasn't been evaluated yet, add it to `inputs`.
         found = await Mongo_Reader.get_input(self.ce_id) != None
@@ -844,8 +854,8 @@ class GameInputView(discord.ui.View) :
         await interaction.response.defer()
 
         # pull from mongo
-        game = await Mongo_Reader.get_game(self.ce_id)
-        user = await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)
+        game = await Mongo_Reader.get_game_view(self.ce_id)
+        user = await Mongo_Reader.get_user_view(interaction.user.id, "summary", use_discord_id=True)
 
         # if this game hasn't been evaluated yet, add it to `inputs`.
         found = await Mongo_Reader.get_input(self.ce_id) != None
@@ -883,8 +893,8 @@ class GameInputView(discord.ui.View) :
 async def game_input(interaction : discord.Interaction, game : str) :
     await interaction.response.defer(ephemeral=INPUT_MESSAGES_ARE_EPHEMERAL)
 
-    game_object = await Mongo_Reader.get_game(game)
-    user = await Mongo_Reader.get_user(interaction.user.id, use_discord_id=True)
+    game_object = await Mongo_Reader.get_game_view(game)
+    user = await Mongo_Reader.get_user_view(interaction.user.id, "games", use_discord_id=True)
 
     # make sure a valid game was passed
     if game_object is None : 
@@ -924,7 +934,7 @@ async def check_inputs(interaction : discord.Interaction, game : str, simple : b
     await interaction.response.defer()
 
     # pull from mongo
-    game_object = await Mongo_Reader.get_game(game)
+    game_object = await Mongo_Reader.get_game_view(game)
     input_object = await Mongo_Reader.get_input(game)
 
     # make sure a valid game was passed
@@ -942,7 +952,7 @@ async def check_inputs(interaction : discord.Interaction, game : str, simple : b
         )
     
     # now get the actual to_string()
-    database_user = await Mongo_Reader.get_database_user()
+    database_user = await Mongo_Reader.get_database_user_view("summary")
     database_name = await Mongo_Reader.get_database_name()
     if not simple : input_object_string = input_object.to_string(database_name, database_user)
     else : input_object_string = input_object.to_string_simple(database_name)
@@ -965,9 +975,19 @@ async def check_inputs(interaction : discord.Interaction, game : str, simple : b
 
 @tasks.loop(minutes=1)
 async def monitor_loop():
-    if not master_loop.is_running():
-        logging.warning("Main task loop is not running. Restarting...")
-        await master_loop.start(client, guild_id)
+    if worker.WORKER_MODE == "bot" :
+        if not master_loop.is_running():
+            logging.warning("Main task loop is not running. Restarting...")
+            await master_loop.start(client, guild_id)
+        return
+
+    # the loop runs in the scraper worker instead
+    if worker.WORKER_MODE == "supervised" and not worker.supervised_is_running() :
+        logging.warning("Scraper worker is not running. Restarting...")
+        await worker.start_supervised()
+    warning = await worker.check_worker()
+    if warning is not None :
+        await client.get_channel(hm.PRIVATE_LOG_ID).send(f":warning: {warning}")
 
 
 
@@ -992,12 +1012,19 @@ async def on_ready() :
     # send online update
     await private_log_channel.send(f":arrow_right_hook: bot started at <t:{hm.get_unix('now')}>")
 
+    # make sure mongo has its indexes (this does nothing if they're already there)
+    for problem in await Mongo_Reader.ensure_indexes() :
+        await private_log_channel.send(f":warning: {problem}")
+
     #asyncio.create_task(start_webhook_server())
     
-    # master loop
+    # master loop (or the scraper worker), and the outbox it leaves its messages in
     if hm.IN_CE :
-        if not master_loop.is_running():
+        Outbox.start(client)
+        if worker.WORKER_MODE == "bot" and not master_loop.is_running():
             await master_loop.start(client, guild_id)
+        if worker.WORKER_MODE == "supervised" :
+            await worker.start_supervised()
         if not monitor_loop.is_running():
             await monitor_loop.start()
 
@@ -1,5 +1,6 @@
 import calendar
 import datetime
+import functools
 import time
 
 def months_to_days(num_months : int) -> int:
@@ -61,6 +62,24 @@ def previous_month_str() -> str :
     return datetime.datetime(year=2024, month=previous_month_num, day = 1).strftime('%B')
 
 
+CE_TIMESTAMP_CACHE_SIZE = 1 << 16
+"The most CE timestamps remembered by `cetimestamp_to_unix()` and `cetimestamp_to_datetime()`."
+
+_UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+@functools.lru_cache(maxsize=CE_TIMESTAMP_CACHE_SIZE)
+def cetimestamp_to_unix(timestamp : str) -> int :
+    """Takes in a CE timestamp (`"2024-02-25T07:04:38.000Z"`) and returns
+    the unix timestamp (`1708844678`). CE timestamps are always UTC.
+    \nCE always sends the same format, so the numbers are sliced straight out
+    instead of going through `strptime`. Results are memoized, since the same
+    `updatedAt` values get parsed over and over."""
+    days = datetime.date(
+        int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10])
+    ).toordinal() - _UNIX_EPOCH_ORDINAL
+    return days * 86400 + int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+@functools.lru_cache(maxsize=CE_TIMESTAMP_CACHE_SIZE)
 def cetimestamp_to_datetime(timestamp : str) -> datetime.datetime :
-    "Takes in a CE timestamp and returns a datetime."
-    return datetime.datetime.strptime(str(timestamp[:-5:]), "%Y-%m-%dT%H:%M:%S")
\ No newline at end of file
+    "Takes in a CE timestamp and returns a (UTC) datetime."
+    return datetime.datetime.fromtimestamp(cetimestamp_to_unix(timestamp), tz=datetime.timezone.utc)
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+Runs the scraper in its own process, so the Discord bot's event loop only has to handle Discord.
+
+    python -m web_scraper.worker          loops at every time in `WebInteractor.times`, forever
+    python -m web_scraper.worker --once   loops once, then exits
+
+Everything it finds goes into mongo, and every update it makes goes into the outbox, which
+the bot sends (see `Modules.Outbox`). It reports back through mongo too: its status (what it's
+doing, a heartbeat, how the last loop went) is kept with `Mongo_Reader.save_worker_status()`,
+and if a loop fails, a warning goes in the outbox.
+
+Set `scraper_worker` in secret_info.json to choose what runs the loop:
+- "bot" (the default): the bot runs `master_loop` itself, like it always has.
+- "supervised": the bot starts this as a child process, and restarts it if it stops.
+- "external": this runs under its own service, and the bot just sends what's in the outbox.
+
+In the last two, the bot warns in the private log if the worker's heartbeat goes quiet.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Literal
+
+from Modules import HTTP_Client, Mongo_Reader
+from Modules.WebInteractor import times
+from web_scraper import scraper
+
+with open('secret_info.json') as f:
+    WORKER_MODE: Literal["bot", "supervised", "external"] = json.load(f).get('scraper_worker', "bot")
+"What runs the loop: the bot itself, this worker as the bot's child process, or this worker on its own."
+
+HEARTBEAT_SECONDS = 30
+"How often the worker saves a heartbeat."
+
+HEARTBEAT_STALE_SECONDS = 5 * 60
+"How old the worker's heartbeat can get before the bot warns about it."
+
+REQUEST_POLL_SECONDS = 15
+"How often a waiting worker checks whether the bot has asked it to loop early."
+
+
+
+""" THE WORKER """
+
+def next_loop_time(now: datetime.datetime) -> datetime.datetime:
+    """Returns the first of `times` after `now` (which should be in utc)."""
+    candidates = [
+        datetime.datetime.combine(now.date() + datetime.timedelta(days=days), loop_time)
+        for days in (0, 1) for loop_time in times
+    ]
+    return min(candidate for candidate in candidates if candidate > now)
+
+async def wait_for_next_loop():
+    """Waits until the next loop time, or until the bot asks for a loop (see `Mongo_Reader.request_worker_loop()`)."""
+    next_loop = next_loop_time(datetime.datetime.now(datetime.timezone.utc))
+    await Mongo_Reader.save_worker_status({"state": "waiting", "next_loop": next_loop.timestamp()})
+    print(f"next loop at {next_loop.isoformat()}.")
+
+    while (remaining := next_loop.timestamp() - time.time()) > 0:
+        status = await Mongo_Reader.get_worker_status() or {}
+        if status.get("requested", 0) > status.get("last_loop_started", 0):
+            print("the bot asked for a loop.")
+            return
+        await asyncio.sleep(min(remaining, REQUEST_POLL_SECONDS))
+
+async def loop_once():
+    """Runs one loop, and saves how it went. A failed loop is reported, not raised."""
+    started = time.time()
+    await Mongo_Reader.save_worker_status({"state": "looping", "last_loop_started": started})
+    try:
+        await scraper.process_loop()
+    except Exception as e:
+        traceback.print_exc()
+        await Mongo_Reader.save_worker_status({"state": "idle", "last_loop_failed": time.time(), "last_error": repr(e)})
+        await Mongo_Reader.save_to_outbox(f"worker-{started}", [{
+            "location": "privatelog", "content": f":warning: the scraper worker's loop failed: {e!r}",
+            "embed": None, "file": None
+        }])
+        return
+    await Mongo_Reader.save_worker_status({
+        "state": "idle", "last_loop_finished": time.time(),
+        "last_loop_seconds": round(time.time() - started), "last_error": None
+    })
+
+async def heartbeat():
+    """Saves a heartbeat every `HEARTBEAT_SECONDS`, forever."""
+    while True:
+        try:
+            await Mongo_Reader.save_worker_status({"heartbeat": time.time()})
+        except Exception as e:
+            print(f"couldn't save the worker's heartbeat: {e}")
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+async def run_worker(once: bool = False):
+    """Runs the scraper worker until it's stopped (or after one loop, if `once`)."""
+    await Mongo_Reader.save_worker_status({
+        "state": "starting", "pid": os.getpid(), "host": socket.gethostname(),
+        "started": time.time(), "heartbeat": time.time()
+    })
+    beat = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            if not once: await wait_for_next_loop()
+            await loop_once()
+            if once: break
+    finally:
+        beat.cancel()
+        await Mongo_Reader.save_worker_status({"state": "stopped", "stopped": time.time()})
+        await HTTP_Client.close_session()
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the scraper in its own process.")
+    parser.add_argument("--once", action="store_true", help="loop once, then exit")
+    args = parser.parse_args()
+
+    async def run():
+        # stopping the service (or the bot stopping its child) cancels the worker, so it can save its status.
+        worker = asyncio.current_task()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                asyncio.get_running_loop().add_signal_handler(sig, worker.cancel)
+            except NotImplementedError:
+                pass
+        try:
+            await run_worker(args.once)
+        except asyncio.CancelledError:
+            print("scraper worker stopped.")
+
+    asyncio.run(run())
+
+
+
+""" SUPERVISING IT (FROM THE BOT) """
+
+_process: asyncio.subprocess.Process | None = None
+_warned_quiet = False
+
+def supervised_is_running() -> bool:
+    """Returns true if the bot's worker child process is running."""
+    return _process is not None and _process.returncode is None
+
+async def start_supervised():
+    """Starts the worker as a child process of the bot, if it isn't running already."""
+    global _process
+    if supervised_is_running(): return
+    _process = await asyncio.create_subprocess_exec(sys.executable, "-m", "web_scraper.worker")
+    print(f"started the scraper worker (pid {_process.pid}).")
+
+async def stop_supervised(timeout: float = 30):
+    """Stops the bot's worker child process, and kills it if it hasn't stopped after `timeout` seconds."""
+    if not supervised_is_running(): return
+    _process.terminate()
+    try:
+        await asyncio.wait_for(_process.wait(), timeout)
+    except TimeoutError:
+        _process.kill()
+        await _process.wait()
+
+async def check_worker() -> str | None:
+    """Returns a warning if the worker's heartbeat has gone quiet.
+    (Only once, until it comes back.)"""
+    global _warned_quiet
+    status = await Mongo_Reader.get_worker_status() or {}
+    quiet_for = time.time() - status.get("heartbeat", 0)
+    if quiet_for < HEARTBEAT_STALE_SECONDS:
+        _warned_quiet = False
+        return None
+    if _warned_quiet: return None
+    _warned_quiet = True
+    return f"the scraper worker hasn't checked in for {int(quiet_for // 60)} minute(s). ({describe_status(status)})"
+
+def describe_status(status: dict | None) -> str:
+    """Sums up the worker's status in one line, for Discord."""
+    if status is None or "state" not in status: return "the scraper worker has never run."
+    description = f"scraper worker is {status['state']}"
+    if "heartbeat" in status: description += f", last seen <t:{int(status['heartbeat'])}:R>"
+    if status.get("last_loop_finished") is not None:
+        description += f", last loop finished <t:{int(status['last_loop_finished'])}:R>"
+    if status.get("last_error") is not None: description += f", last error: {status['last_error']}"
+    if status['state'] == "waiting" and "next_loop" in status:
+        description += f", next loop <t:{int(status['next_loop'])}:R>"
+    return description + "."
+
+
+
+if __name__ == "__main__":
+    main()